@@ -0,0 +1,118 @@
+/*
+#   eventfifo.c: wakes the user interface when the backend has news
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#include "gnusource.h"
+#include <stdio.h>
+#include <string.h>
+#include <errno.h>
+#include <unistd.h>
+#include <fcntl.h>
+#include <pthread.h>
+#include <semaphore.h>
+#include "eventfifo.h"
+#include "sig.h"
+
+#define FALSE 0
+#define TRUE 1
+
+/* The JACK callback only sets bits and posts a semaphore. A helper thread
+ * does the writing so the callback never makes a system call that could
+ * block. Writes are non-blocking too: should the user interface fall
+ * behind, the wake-ups it already has pending are enough.
+ */
+
+static int fd = -1;
+static int pending;
+static sem_t sem;
+static pthread_t thread_h;
+
+static void *eventfifo_main(void *arg)
+    {
+    char buffer[4];
+    int what, n;
+
+    sig_mask_thread();
+    for (;;)
+        {
+        if (sem_wait(&sem))
+            {
+            if (errno == EINTR)
+                continue;
+            break;
+            }
+
+        if (!(what = __sync_fetch_and_and(&pending, 0)))
+            continue;
+
+        n = 0;
+        if (what & EVENTFIFO_EVENTS)
+            {
+            buffer[n++] = 'e';
+            buffer[n++] = '\n';
+            }
+        if (what & EVENTFIFO_METERS)
+            {
+            buffer[n++] = 'm';
+            buffer[n++] = '\n';
+            }
+        if (write(fd, buffer, n) < 0 && errno != EAGAIN)
+            {
+            perror("eventfifo_main: write");
+            break;
+            }
+        }
+
+    return NULL;
+    }
+
+int eventfifo_open(const char *pathname)
+    {
+    if (fd != -1)
+        {
+        fprintf(stderr, "eventfifo_open: already open\n");
+        return FALSE;
+        }
+
+    /* Fails with ENXIO unless the user interface has the read end open. */
+    if ((fd = open(pathname, O_WRONLY | O_NONBLOCK)) == -1)
+        {
+        perror("eventfifo_open: open");
+        return FALSE;
+        }
+
+    if (sem_init(&sem, 0, 0) || pthread_create(&thread_h, NULL, eventfifo_main, NULL))
+        {
+        fprintf(stderr, "eventfifo_open: failed to start thread\n");
+        close(fd);
+        fd = -1;
+        return FALSE;
+        }
+    pthread_detach(thread_h);
+
+    return TRUE;
+    }
+
+void eventfifo_post(int what)
+    {
+    if (fd == -1)
+        return;
+
+    if ((__sync_fetch_and_or(&pending, what) & what) != what)
+        sem_post(&sem);
+    }
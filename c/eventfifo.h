@@ -0,0 +1,33 @@
+/*
+#   eventfifo.h: wakes the user interface when the backend has news
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#ifndef EVENTFIFO_H
+#define EVENTFIFO_H
+
+/* things the user interface is told about, written to the fifo as "e\n" and "m\n" */
+#define EVENTFIFO_EVENTS 0x1    /* requestlevels has something to report */
+#define EVENTFIFO_METERS 0x2    /* the shared meter block has changed */
+
+/* open the fifo whose read end the user interface holds, returns FALSE on failure */
+int eventfifo_open(const char *pathname);
+
+/* flag something for the user interface, safe to call from the JACK callback */
+void eventfifo_post(int what);
+
+#endif /* EVENTFIFO_H */
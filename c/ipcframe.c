@@ -0,0 +1,91 @@
+/*
+#   ipcframe.c: length prefixed command and reply frames
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#include "gnusource.h"
+#include <stdlib.h>
+#include <string.h>
+#include "ipcframe.h"
+
+#define FALSE 0
+#define TRUE 1
+
+int ipcframe_read(struct ipcframe *self, FILE *fp)
+    {
+    uint32_t header[2];
+
+    if (fread(header, sizeof header, 1, fp) != 1 || fread(self->module, 2, 1, fp) != 1)
+        return FALSE;
+    self->module[2] = '\0';
+    self->id = header[1];
+    self->size = header[0];
+
+    if (self->size > self->alloc)
+        {
+        if (!(self->records = realloc(self->records, self->size)))
+            {
+            fprintf(stderr, "ipcframe_read: malloc failure\n");
+            exit(5);
+            }
+        self->alloc = self->size;
+        }
+
+    if (self->size && fread(self->records, self->size, 1, fp) != 1)
+        {
+        fprintf(stderr, "ipcframe_read: short frame\n");
+        return FALSE;
+        }
+
+    return TRUE;
+    }
+
+FILE *ipcframe_reply_begin(struct ipcframe *self)
+    {
+    FILE *fp;
+
+    self->reply = NULL;
+    self->reply_size = 0;
+    if (!(fp = open_memstream(&self->reply, &self->reply_size)))
+        perror("ipcframe_reply_begin: open_memstream");
+    return fp;
+    }
+
+int ipcframe_reply_end(struct ipcframe *self, FILE *reply, FILE *fp)
+    {
+    uint32_t header[2];
+    int ok;
+
+    fclose(reply);
+    header[0] = self->reply_size;
+    header[1] = self->id;
+    ok = fwrite(header, sizeof header, 1, fp) == 1 && (!self->reply_size ||
+                fwrite(self->reply, self->reply_size, 1, fp) == 1) && !fflush(fp);
+    free(self->reply);
+    self->reply = NULL;
+    if (!ok)
+        fprintf(stderr, "ipcframe_reply_end: write failed\n");
+    return ok;
+    }
+
+void ipcframe_free(struct ipcframe *self)
+    {
+    if (self->records)
+        free(self->records);
+    self->records = NULL;
+    self->alloc = 0;
+    }
@@ -0,0 +1,57 @@
+/*
+#   ipcframe.h: length prefixed command and reply frames
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#ifndef IPCFRAME_H
+#define IPCFRAME_H
+
+#include <stdio.h>
+#include <stdint.h>
+
+/* The layout must match python/ipcframe.py
+ *
+ * command: uint32 size, uint32 request id, char module[2], then size bytes of
+ *          records each being uint32 key size, uint32 value size, key, value
+ * reply:   uint32 size, uint32 request id, then size bytes of reply text
+ *
+ * Integers are in host byte order.
+ */
+
+struct ipcframe
+    {
+    uint32_t id;
+    char module[3];             /* "mx" or "sc" */
+    char *records;
+    size_t size;
+    size_t alloc;
+    char *reply;
+    size_t reply_size;
+    };
+
+/* read the next command frame, returns FALSE at end of file or on error */
+int ipcframe_read(struct ipcframe *self, FILE *fp);
+
+/* returns a stream collecting the reply text, NULL on failure */
+FILE *ipcframe_reply_begin(struct ipcframe *self);
+
+/* close the reply stream and send it as a frame, returns FALSE on failure */
+int ipcframe_reply_end(struct ipcframe *self, FILE *reply, FILE *fp);
+
+void ipcframe_free(struct ipcframe *self);
+
+#endif /* IPCFRAME_H */
@@ -21,10 +21,14 @@
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <stdint.h>
+#include <stddef.h>
 #include "kvpparse.h"
 #include "bsdcompat.h"
 
 static char *buffer;
+static const char *fed_records;
+static size_t fed_size;
 
 static void kvp_cleanup()
     {
@@ -32,12 +36,55 @@ static void kvp_cleanup()
         free(buffer);
     }
 
+void kvp_feed(const char *records, size_t size)
+    {
+    fed_records = records;
+    fed_size = size;
+    }
+
+/* kvp_parse_records: the framed counterpart of the line reading below */
+static int kvp_parse_records(struct kvpdict *kvpdict)
+    {
+    const char *p = fed_records, *end = fed_records + fed_size;
+    uint32_t sizes[2];
+    char *key, *value;
+
+    fed_records = NULL;
+    while (end - p >= (ptrdiff_t)sizeof sizes)
+        {
+        memcpy(sizes, p, sizeof sizes);
+        p += sizeof sizes;
+        if ((size_t)(end - p) < (size_t)sizes[0] + sizes[1])
+            {
+            fprintf(stderr, "kvp_parse: truncated record\n");
+            return 0;
+            }
+        if (!(key = strndup(p, sizes[0])) || !(value = strndup(p + sizes[0], sizes[1])))
+            {
+            fprintf(stderr, "malloc failure\n");
+            exit(5);
+            }
+        p += sizes[0] + sizes[1];
+        if (!(kvp_apply_to_dict(kvpdict, key, value)))
+            {
+            fprintf(stderr, "kvp_parse: %s=%s, key missing from dictionary\n", key, value);
+            free(value);
+            }
+        free(key);
+        }
+
+    return 1;
+    }
+
 int kvp_parse(struct kvpdict *kvpdict, FILE *fp)
     {
     static size_t n = 5000;
     char *value;
     ssize_t rv;
 
+    if (fed_records)
+        return kvp_parse_records(kvpdict);
+
     if (!buffer)
         {
         if (!(buffer = malloc(n)))
@@ -20,3 +20,6 @@
 #include "kvpdict.h"
 
 int kvp_parse(struct kvpdict *kvpdict, FILE *fp);
+
+/* the next kvp_parse takes its key value records from here instead of fp */
+void kvp_feed(const char *records, size_t size);
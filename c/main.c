@@ -44,6 +44,8 @@
 #include "sig.h"
 #include "mixer.h"
 #include "sourceclient.h"
+#include "kvpparse.h"
+#include "ipcframe.h"
 #include "main.h"
 
 #define FALSE 0
@@ -130,6 +132,47 @@ static int main_process_audio(jack_nframes_t n_frames, void *arg)
     return rv;
     }
 
+/* dispatch: hand a command to the submodule named */
+static int dispatch(const char *module)
+    {
+    if (!strcmp(module, "mx"))
+        return mixer_main();
+    if (!strcmp(module, "sc"))
+        return sourceclient_main();
+
+    fprintf(stderr, "main.c: expected module name, got: %s\n", module);
+    exit(5);
+    }
+
+/* framed_main: the command loop when the user interface frames its commands
+ * 
+ * Replies are collected per command and sent back as a frame bearing the
+ * request id of the command so the user interface can match them up.
+ */
+static int framed_main()
+    {
+    struct ipcframe frame = { 0 };
+    FILE *out = g.out;
+    int keep_running = TRUE;
+
+    while (keep_running && ipcframe_read(&frame, g.in) && !g.app_shutdown)
+        {
+        kvp_feed(frame.records, frame.size);
+        if (!(g.out = ipcframe_reply_begin(&frame)))
+            break;
+        keep_running = dispatch(frame.module);
+        kvp_feed(NULL, 0);
+        if (!ipcframe_reply_end(&frame, g.out, out))
+            keep_running = FALSE;
+        g.out = out;
+        g.main_timeout = 0;
+        }
+
+    g.out = out;
+    ipcframe_free(&frame);
+    return keep_running;
+    }
+
 static int backend_main()
     {
     char *buffer = NULL;
@@ -272,24 +315,16 @@ static int backend_main()
 
     alarm(1);
 
-    while (keep_running && getline(&buffer, &n, g.in) > 0 && !g.app_shutdown)
-        {
-        /* Filter commands to submodules. */
-        if (!strcmp(buffer, "mx\n"))
-            keep_running = mixer_main();
-        else
+    if (getenv("ipc_framing") && !strcmp(getenv("ipc_framing"), "1"))
+        framed_main();
+    else
+        while (keep_running && getline(&buffer, &n, g.in) > 0 && !g.app_shutdown)
             {
-            if (!strcmp(buffer, "sc\n"))
-                keep_running = sourceclient_main();
-            else
-                {
-                fprintf(stderr, "main.c: expected module name, got: %s", buffer);
-                exit(5);
-                }
+            /* Filter commands to submodules. */
+            buffer[strcspn(buffer, "\n")] = '\0';
+            keep_running = dispatch(buffer);
+            g.main_timeout = 0;
             }
-            
-        g.main_timeout = 0;
-        }
 
     jack_deactivate(g.client);
     jack_client_close(g.client);
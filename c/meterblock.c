@@ -0,0 +1,96 @@
+/*
+#   meterblock.c: meter levels and player status shared with the user interface
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#include "gnusource.h"
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <fcntl.h>
+#include <sys/types.h>
+#include <sys/stat.h>
+#include <sys/mman.h>
+#include "meterblock.h"
+
+#define FALSE 0
+#define TRUE 1
+
+/* The block is written by the JACK callback and read by the user interface
+ * without either side blocking. The writer makes the sequence counter odd
+ * for the duration of an update and the reader retries if it sees an odd
+ * value or a value that changed while it was copying.
+ */
+
+static struct meterblock *volatile block;
+
+int meterblock_attach(const char *pathname)
+    {
+    int fd;
+    struct stat st;
+    struct meterblock *mb;
+
+    if ((fd = open(pathname, O_RDWR)) == -1)
+        {
+        perror("meterblock_attach: open");
+        return FALSE;
+        }
+
+    if (fstat(fd, &st) == -1 || st.st_size < (off_t)sizeof (struct meterblock))
+        {
+        fprintf(stderr, "meterblock_attach: file is too small\n");
+        close(fd);
+        return FALSE;
+        }
+
+    mb = mmap(NULL, sizeof (struct meterblock), PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    close(fd);
+    if (mb == MAP_FAILED)
+        {
+        perror("meterblock_attach: mmap");
+        return FALSE;
+        }
+
+    memset(mb, 0, sizeof (struct meterblock));
+    mb->version = METERBLOCK_VERSION;
+    __sync_synchronize();
+    mb->magic = METERBLOCK_MAGIC;
+
+    /* Any previous block is left mapped since the JACK callback may be
+     * in the middle of writing to it.
+     */
+    block = mb;
+    return TRUE;
+    }
+
+struct meterblock *meterblock_begin()
+    {
+    struct meterblock *self = block;
+
+    if (self)
+        {
+        self->seq++;
+        __sync_synchronize();
+        }
+    return self;
+    }
+
+void meterblock_end(struct meterblock *self)
+    {
+    __sync_synchronize();
+    self->seq++;
+    }
@@ -0,0 +1,65 @@
+/*
+#   meterblock.h: meter levels and player status shared with the user interface
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#ifndef METERBLOCK_H
+#define METERBLOCK_H
+
+#include <stdint.h>
+
+/* The layout must match python/meterblock.py */
+#define METERBLOCK_MAGIC 0x4B4C424DU     /* "MBLK" */
+#define METERBLOCK_VERSION 1
+#define METERBLOCK_MAX_MICS 24
+
+enum meterblock_players { MB_LEFT, MB_RIGHT, MB_INTERLUDE, MB_JINGLES, MB_N_PLAYERS };
+
+struct meterblock_player
+    {
+    int32_t elapsed;
+    int32_t playing;
+    int32_t signal;
+    int32_t cid;
+    int32_t runout;
+    float silence;
+    };
+
+struct meterblock
+    {
+    uint32_t magic;
+    uint32_t version;
+    uint32_t seq;               /* seqlock counter, odd while being written */
+    int32_t events_pending;     /* ask for requestlevels over the pipe */
+    int32_t str_l_peak, str_r_peak, str_l_rms, str_r_rms;
+    struct meterblock_player player[MB_N_PLAYERS];
+    int32_t effects_playing;
+    int32_t freewheel_mode;
+    int32_t n_mics;
+    int32_t mic_levels[METERBLOCK_MAX_MICS][4];
+    };
+
+/* map the file created by the user interface, returns FALSE on failure */
+int meterblock_attach(const char *pathname);
+
+/* start of an update, returns NULL when no block is attached */
+struct meterblock *meterblock_begin();
+
+/* end of an update */
+void meterblock_end(struct meterblock *self);
+
+#endif /* METERBLOCK_H */
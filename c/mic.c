@@ -217,13 +217,19 @@ static int mic_getpeak(struct mic *self)
     return (peakdb < 0) ? peakdb : 0;
     }
 
+static void mic_levels(struct mic *self, int *levels)
+    {
+    agc_get_meter_levels(self->host->agc, levels + 1, levels + 2, levels + 3);
+    levels[0] = mic_getpeak(self);
+    }
+
 static void mic_stats(struct mic *self)
     {
-    int red, yellow, green;
+    int levels[4];
     
-    agc_get_meter_levels(self->host->agc, &red, &yellow, &green);
+    mic_levels(self, levels);
     fprintf(g.out, "mic_%d_levels=%d,%d,%d,%d\n", self->id,
-                                    mic_getpeak(self), red, yellow, green);
+                                    levels[0], levels[1], levels[2], levels[3]);
     }
 
 void mic_stats_all(struct mic **mics)
@@ -232,6 +238,15 @@ void mic_stats_all(struct mic **mics)
         mic_stats(*mics++);
     }
 
+int mic_levels_all(struct mic **mics, int (*levels)[4], int max)
+    {
+    int n;
+
+    for (n = 0; *mics && n < max; ++n)
+        mic_levels(*mics++, levels[n]);
+    return n;
+    }
+
 static void mic_set_role(struct mic *self, int role)
     {
     if (role == 'm')
@@ -88,6 +88,8 @@ struct mic
 void mic_process_start_all(struct mic **mics, jack_nframes_t nframes);
 float mic_process_all(struct mic **mics);
 void mic_stats_all(struct mic **mics);
+/* meter levels of up to max mics as mic_stats_all reports them, returns the mic count */
+int mic_levels_all(struct mic **mics, int (*levels)[4], int max);
 struct mic **mic_init_all(int n_mics, jack_client_t *client);
 void mic_free_all(struct mic **self);
 void mic_valueparse(struct mic *s, char *param);
@@ -31,12 +31,14 @@
 #include <jack/session.h>
 #include <getopt.h>
 #include <string.h>
+#include <strings.h>
 #include <fcntl.h>
 #include <sys/types.h>
 #include <sys/stat.h>
 #include <signal.h>
 #include <locale.h>
 #include <limits.h>
+#include <stddef.h>
 
 #include "kvpparse.h"
 #include "dbconvert.h"
@@ -51,6 +53,8 @@
 #include "bsdcompat.h"
 #include "peakfilter.h"
 #include "sig.h"
+#include "meterblock.h"
+#include "eventfifo.h"
 #include "main.h"
 
 #define TRUE 1
@@ -118,6 +122,8 @@ static float str_l_tally, str_r_tally;  /* used to calculate rms value */
 static int rms_tally_count;
 static float str_l_meansqrd, str_r_meansqrd;
 static int reset_vu_stats_f;                   /* when set the mixer will reset the above */
+static jack_nframes_t meter_publish_frames;    /* shared meter block update interval */
+static void meter_publish(jack_nframes_t nframes);
 static float dfmod;                            /* used to reduce the ducking factor */
 static float dj_audio_level;                   /* used to reduce the level of dj audio */
 static float dj_audio_gain = 1.0;              /* same as above but not in dB */
@@ -157,11 +163,15 @@ static struct xlplayer *players[4];
 static struct xlplayer *players_roster[4];
 
 /* these are set in the parse routine - the contents coming from the GUI */
+static char *mixer_delta_string;
 static char *mixer_string, *compressor_string, *gate_string, *microphone_string, *item_index;
 static char *new_mic_string;
 static char *midi, *audl, *audr, *strl, *strr, *action;
 static char *target_port_name;
 static char *dol, *dor, *dil, *dir;
+static char *metainfopathnames;
+static char *meterblockpathname;
+static char *eventfifopathname;
 static char *oggpathname, *sndfilepathname, *avformatpathname, *speexpathname, *speextaglist, *speexcreatedby;
 static char *playerpathname, *seek_s, *size, *playerplaylist, *loop, *resamplequality;
 static char *mic_param, *fade_mode;
@@ -185,6 +195,7 @@ static struct kvpdict kvpdict[] = {
             { "PLPL", &playerplaylist, NULL },   /* A playlist for the media players */
             { "LOOP", &loop, NULL },             /* play in a loop */
             { "MIXR", &mixer_string, NULL },     /* Control strings */
+            { "MIXD", &mixer_delta_string, NULL },
             { "COMP", &compressor_string, NULL },/* packed full of data */
             { "GATE", &gate_string, NULL },
             { "MICS", &microphone_string, NULL },
@@ -203,6 +214,9 @@ static struct kvpdict kvpdict[] = {
             { "VOL2", &use_jingles_vol_2, NULL },
             { "FADE", &fade_mode, NULL },
             { "OGGP", &oggpathname, NULL },
+            { "MINF", &metainfopathnames, NULL }, /* Newline separated pathnames */
+            { "MTRF", &meterblockpathname, NULL },
+            { "EVTF", &eventfifopathname, NULL },
             { "SPXP", &speexpathname, NULL },
             { "SNDP", &sndfilepathname, NULL },
             { "AVFP", &avformatpathname, NULL },
@@ -961,7 +975,8 @@ int mixer_process_audio(jack_nframes_t nframes, void *arg)
                         }
                     else
                         fprintf(stderr,"Error: no mixer mode was chosen\n");
-                        
+
+    meter_publish(nframes);
     return 0;
     }
  
@@ -974,6 +989,84 @@ static int peak_to_log(float peak)
     return (int)level2db(peak);
     }
 
+/* meter_publish: update the shared meter block from the JACK callback
+ * 
+ * Anything the block cannot carry, namely MIDI, session events, port
+ * connection changes, effects changes and new metadata, sets events_pending
+ * so the user interface falls back to requestlevels to collect it.
+ *
+ * The user interface is woken through the event fifo. Events are checked
+ * every period and signalled once until they have been collected. Meter
+ * changes are signalled at most once per block update and only when the
+ * values differ from the last ones published.
+ */
+static void meter_publish(jack_nframes_t nframes)
+    {
+    static jack_nframes_t frames;
+    static int signalled;
+    static struct meterblock previous;
+    const size_t body = offsetof(struct meterblock, str_l_peak);
+    struct meterblock *mb;
+    struct xlplayer *plr[MB_N_PLAYERS];
+    int i, effects, events, pending;
+
+    effects = 0;
+    for (struct xlplayer **p = plr_j_roster; *p; ++p)
+        effects |= (*p)->id;
+
+    events = effects != effects_active || midi_nqueued > 0 || sig_usr1_pending() ||
+                port_connection_count != port_reports || (g.session_event_rb &&
+                jack_ringbuffer_read_space(g.session_event_rb) >= sizeof (jack_session_event_t *));
+    if (events && !signalled)
+        eventfifo_post(EVENTFIFO_EVENTS);
+    signalled = events;
+
+    if ((frames += nframes) < meter_publish_frames)
+        return;
+    frames = 0;
+
+    if (!(mb = meterblock_begin()))
+        return;
+
+    mb->str_l_peak = peak_to_log(peakfilter_read(str_pf_l));
+    mb->str_r_peak = peak_to_log(peakfilter_read(str_pf_r));
+    mb->str_l_rms = str_l_meansqrd ? (int) fabs(level2db(sqrt(str_l_meansqrd))) : 120;
+    mb->str_r_rms = str_r_meansqrd ? (int) fabs(level2db(sqrt(str_r_meansqrd))) : 120;
+
+    plr[MB_LEFT] = plr_l;
+    plr[MB_RIGHT] = plr_r;
+    plr[MB_INTERLUDE] = plr_i;
+    /* requestlevels reports the last of the jingles players */
+    for (plr[MB_JINGLES] = NULL, i = 0; plr_j[i]; ++i)
+        plr[MB_JINGLES] = plr_j[i];
+
+    pending = events;
+    for (i = 0; i < MB_N_PLAYERS; ++i)
+        if (plr[i] && xlplayer_meter_values(plr[i], &mb->player[i]))
+            pending = TRUE;
+
+    mb->n_mics = mic_levels_all(mics, mb->mic_levels, METERBLOCK_MAX_MICS);
+    mb->effects_playing = effects;
+    mb->freewheel_mode = g.freewheel;
+    mb->events_pending = pending;
+
+    meterblock_end(mb);
+    reset_vu_stats_f = TRUE;
+
+    /* new metadata is only discovered here */
+    if (pending && !signalled)
+        {
+        eventfifo_post(EVENTFIFO_EVENTS);
+        signalled = TRUE;
+        }
+
+    if (memcmp((char *)mb + body, (char *)&previous + body, sizeof previous - body))
+        {
+        memcpy((char *)&previous + body, (char *)mb + body, sizeof previous - body);
+        eventfifo_post(EVENTFIFO_METERS);
+        }
+    }
+
 int mixer_healthcheck()
     { 
     const int limit = 15;
@@ -1065,6 +1158,74 @@ static struct mixer {
     char *sc_client_name;
     } s;
 
+/* write a metainfo reply field with the record separators removed */
+static void metainfo_field(const char *text, int last)
+    {
+    for (; text && *text; ++text)
+        fputc((*text == '\t' || *text == '\n') ? ' ' : *text, g.out);
+    fputc(last ? '\n' : '\t', g.out);
+    }
+
+static int ext_is(const char *pathname, const char **exts)
+    {
+    const char *ext = strrchr(pathname, '.');
+
+    if (ext)
+        for (; *exts; ++exts)
+            if (!strcasecmp(ext, *exts))
+                return TRUE;
+
+    return FALSE;
+    }
+
+/* metainforequest: tag and length data for many files in one round trip
+ * 
+ * One reply line per pathname in the order requested.
+ * MIR:V<tab>length<tab>replaygain<tab>artist<tab>title<tab>album
+ * MIR:X when the file could not be read
+ * MIR:end after the last one
+ */
+static void metainforequest(char *pathnames)
+    {
+    static const char *ogg_exts[] = { ".ogg", ".oga", ".spx", NULL };
+    static const char *sndfile_exts[] = { ".wav", ".aiff", ".au", NULL };
+    char *path, *next;
+    int ok;
+
+    for (path = pathnames; path && *path; path = next)
+        {
+        if ((next = strchr(path, '\n')))
+            *next++ = '\0';
+
+        ok = FALSE;
+        if (ext_is(path, ogg_exts))
+            ok = oggdecode_get_metainfo(path, &s.artist, &s.title, &s.album, &s.length, &s.replaygain);
+        else
+            {
+            if (ext_is(path, sndfile_exts))
+                {
+                free(s.replaygain);
+                s.replaygain = NULL;
+                ok = sndfileinfo_get_metainfo(path, &s.artist, &s.title, &s.album, &s.length);
+                }
+            }
+
+        if (ok)
+            {
+            fprintf(g.out, "MIR:V\t%f\t", s.length);
+            metainfo_field(s.replaygain, FALSE);
+            metainfo_field(s.artist, FALSE);
+            metainfo_field(s.title, FALSE);
+            metainfo_field(s.album, TRUE);
+            }
+        else
+            fputs("MIR:X\n", g.out);
+        }
+
+    fputs("MIR:end\n", g.out);
+    fflush(g.out);
+    }
+
 static void mixer_cleanup()
     {
     free(eot_alarm_table);
@@ -1177,6 +1338,7 @@ void mixer_init(void)
             }
         }
             
+    meter_publish_frames = sr / 25;
     str_pf_l = peakfilter_create(115e-6f, sr);
     str_pf_r = peakfilter_create(115e-6f, sr);
 
@@ -1189,6 +1351,108 @@ void mixer_init(void)
     g.mixer_up = TRUE;
     }
         
+/* mixstats_apply: act on new mixer settings from mixstats or mixdelta */
+static void mixstats_apply()
+    {
+    eot_alarm_f |= eot_alarm_set;
+
+    plr_l->fadeout_f = plr_r->fadeout_f = plr_i->fadeout_f = s.fadeout_f;
+    for (struct xlplayer **p = plr_j; *p; ++p)
+        (*p)->fadeout_f = s.fadeout_f;
+            
+    plr_l->use_sv = plr_r->use_sv = plr_i->use_sv = speed_variance;
+
+    if (s.use_dsp != using_dsp)
+        using_dsp = s.use_dsp;
+
+    if (s.new_left_pause != plr_l->pause)
+        {
+        if (s.new_left_pause)
+            xlplayer_pause(plr_l);
+        else
+            xlplayer_unpause(plr_l);
+        }
+            
+    if (s.new_right_pause != plr_r->pause)
+        {
+        if (s.new_right_pause)
+            xlplayer_pause(plr_r);
+        else
+            xlplayer_unpause(plr_r);
+        }
+
+    if (s.new_inter_pause != plr_i->pause)
+        {
+        if (s.new_inter_pause)
+            xlplayer_pause(plr_i);
+        else
+            xlplayer_unpause(plr_i);
+        }
+    }
+
+/* mixdelta_parse: take the mixer settings that changed
+ *
+ * The delta is a comma separated list of name:value with names from the
+ * table below which follows the order of the mixstats string.
+ */
+static void mixdelta_parse(char *delta)
+    {
+    struct field {
+        const char *name;
+        char type;
+        void *target;
+        } fields[] = {
+        { "vol", 'd', &volume }, { "vol2", 'd', &volume2 }, { "xf", 'd', &crossfade },
+        { "jvol1", 'd', &jinglesvolume1 }, { "jmute1", 'd', &jinglesheadroom1 },
+        { "jvol2", 'd', &jinglesvolume2 }, { "jmute2", 'd', &jinglesheadroom2 },
+        { "ivol", 'd', &interludevol }, { "mixback", 'd', &mixbackvol },
+        { "jplay", 'd', &jingles_playing },
+        { "lstr", 'd', &left_stream }, { "laud", 'd', &left_audio },
+        { "rstr", 'd', &right_stream }, { "raud", 'd', &right_audio },
+        { "strmon", 'd', &stream_monitor },
+        { "lpause", 'd', &s.new_left_pause }, { "rpause", 'd', &s.new_right_pause },
+        { "lflush", 'd', &s.flush_left }, { "rflush", 'd', &s.flush_right },
+        { "jflush", 'd', &s.flush_jingles }, { "iflush", 'd', &s.flush_interlude },
+        { "simple", 'd', &simple_mixer }, { "alarm", 'd', &eot_alarm_set },
+        { "mode", 'd', &mixermode }, { "fadeout", 'd', &s.fadeout_f },
+        { "play", 'd', &main_play },
+        { "lspeed", 'f', &plr_l->newpbspeed }, { "rspeed", 'f', &plr_r->newpbspeed },
+        { "sv", 'd', &speed_variance }, { "djaud", 'f', &dj_audio_level },
+        { "xpat", 'd', &crosspattern }, { "dsp", 'd', &s.use_dsp },
+        { "ipause", 'd', &s.new_inter_pause },
+        { "istr", 'd', &inter_stream }, { "iaud", 'd', &inter_audio },
+        { "iforce", 'd', &inter_force }, { "alarmaud", 'f', &alarm_audio_level },
+        { "voip", 'd', &voipvol }, { "ispeed", 'f', &plr_i->newpbspeed },
+        { NULL } };
+    struct field *f;
+    char *item, *value, *saveptr;
+
+    /* any setting not mentioned keeps its value except for the one-shot alarm */
+    eot_alarm_set = 0;
+
+    for (item = strtok_r(delta, ",", &saveptr); item; item = strtok_r(NULL, ",", &saveptr))
+        {
+        if (!(value = strchr(item, ':')))
+            {
+            fprintf(stderr, "mixdelta_parse: bad item %s\n", item);
+            continue;
+            }
+        *value++ = '\0';
+
+        for (f = fields; f->name; ++f)
+            if (!strcmp(f->name, item))
+                {
+                if (f->type == 'd')
+                    *(int *)f->target = atoi(value);
+                else
+                    *(float *)f->target = strtof(value, NULL);
+                break;
+                }
+        if (!f->name)
+            fprintf(stderr, "mixdelta_parse: unknown setting %s\n", item);
+        }
+    }
+
 int mixer_main()
     {
     unsigned int lead, ports_diff;
@@ -1413,6 +1677,21 @@ int mixer_main()
     if (!strcmp(action, "sndfileinforequest"))
         sndfileinfo(sndfilepathname);
 
+    if (!strcmp(action, "metainforequest"))
+        metainforequest(metainfopathnames);
+
+    if (!strcmp(action, "meterblock"))
+        {
+        fprintf(g.out, "meterblock=%d\n", meterblock_attach(meterblockpathname));
+        fflush(g.out);
+        }
+
+    if (!strcmp(action, "eventfifo"))
+        {
+        fprintf(g.out, "eventfifo=%d\n", eventfifo_open(eventfifopathname));
+        fflush(g.out);
+        }
+
 #ifdef HAVE_SPEEX
     if (!(strcmp(action, "speexreadtagrequest")))
         speex_tag_read(speexpathname);
@@ -1437,39 +1716,15 @@ int mixer_main()
             fprintf(stderr, "mixer got bad mixer string\n");
             return TRUE;
             }
-        eot_alarm_f |= eot_alarm_set;
-
-        plr_l->fadeout_f = plr_r->fadeout_f = plr_i->fadeout_f = s.fadeout_f;
-        for (struct xlplayer **p = plr_j; *p; ++p)
-            (*p)->fadeout_f = s.fadeout_f;
-            
-        plr_l->use_sv = plr_r->use_sv = plr_i->use_sv = speed_variance;
-
-        if (s.use_dsp != using_dsp)
-            using_dsp = s.use_dsp;
-
-        if (s.new_left_pause != plr_l->pause)
-            {
-            if (s.new_left_pause)
-                xlplayer_pause(plr_l);
-            else
-                xlplayer_unpause(plr_l);
-            }
-            
-        if (s.new_right_pause != plr_r->pause)
-            {
-            if (s.new_right_pause)
-                xlplayer_pause(plr_r);
-            else
-                xlplayer_unpause(plr_r);
-            }
+        mixstats_apply();
+        }
 
-        if (s.new_inter_pause != plr_i->pause)
+    if (!strcmp(action, "mixdelta"))
+        {
+        if (mixer_delta_string)
             {
-            if (s.new_inter_pause)
-                xlplayer_pause(plr_i);
-            else
-                xlplayer_unpause(plr_i);
+            mixdelta_parse(mixer_delta_string);
+            mixstats_apply();
             }
         }
 
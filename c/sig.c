@@ -65,6 +65,12 @@ void sig_mask_thread()
         fprintf(stderr, "sig_mask_thread: pthread_sigmask() failed\n");
     }
 
+/* like sig_recent_usr1 but leaves the signal to be collected */
+int sig_usr1_pending()
+    {
+    return sigusr1count != sigusr1oldcount;
+    }
+
 int sig_recent_usr1()
     {
     if (sigusr1count != sigusr1oldcount)
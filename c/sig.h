@@ -20,3 +20,4 @@
 void sig_init();
 void sig_mask_thread();
 int sig_recent_usr1();
+int sig_usr1_pending();
@@ -18,6 +18,8 @@
 */
 
 #include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
 #include <sndfile.h>
 #include "sndfileinfo.h"
 #include "main.h"
@@ -50,3 +52,38 @@ int sndfileinfo(char *pathname)
     fflush(g.out);
     return 1;
     }
+
+static void replace_string(char **target, const char *text)
+    {
+    free(*target);
+    if (!(*target = strdup(text)))
+        {
+        fprintf(stderr, "sndfileinfo: malloc failure\n");
+        exit(5);
+        }
+    }
+
+/* sndfileinfo_get_metainfo: as above but the data is returned to the caller
+ * the strings are heap allocated and any previous ones freed */
+int sndfileinfo_get_metainfo(char *pathname, char **artist, char **title, char **album, double *length)
+    {
+    SF_INFO sfinfo;
+    SNDFILE *handle;
+    const char *a, *t, *al;
+
+    if (!(handle = sf_open(pathname, SFM_READ, &sfinfo)))
+        {
+        fprintf(stderr, "sndfileinfo failed to open file %s\n", pathname);
+        return 0;
+        }
+    a = sf_get_string(handle, SF_STR_ARTIST);
+    t = sf_get_string(handle, SF_STR_TITLE);
+    al = sf_get_string(handle, SF_STR_ALBUM);
+
+    *length = (double)sfinfo.frames / sfinfo.samplerate;
+    replace_string(artist, (a && t) ? a : "");
+    replace_string(title, (a && t) ? t : "");
+    replace_string(album, (a && t && al) ? al : "");
+    sf_close(handle);
+    return 1;
+    }
@@ -18,3 +18,4 @@
 */
 
 int sndfileinfo(char *pathname);
+int sndfileinfo_get_metainfo(char *pathname, char **artist, char **title, char **album, double *length);
@@ -118,6 +118,18 @@ static int get_report(struct threads_info *ti, struct universal_vars *uv, void *
     return FAILED;
     }
 
+/* All the recorder and streamer reports, to save a round trip for each. */
+static int get_reports(struct threads_info *ti, struct universal_vars *uv, void *other)
+    {
+    int i;
+
+    for (i = 0; i < ti->n_recorders; i++)
+        recorder_make_report(ti->recorder[i]);
+    for (i = 0; i < ti->n_streamers; i++)
+        streamer_make_report(ti->streamer[i]);
+    return SUCCEEDED;
+    }
+
 static int command_parse(struct commandmap *map, struct threads_info *ti, struct universal_vars *uv)
     {
     for (; map->key; map++)
@@ -200,6 +212,7 @@ static struct commandmap commandmap[] = {
 #endif
 #endif    
     { "get_report", get_report, NULL },
+    { "get_reports", get_reports, NULL },
     { "encoder_start", encoder_start, &ev },
     { "encoder_stop", encoder_stop, NULL },
     { "encoder_update", encoder_update, &ev },
@@ -38,6 +38,7 @@
 #include "avcodecdecode.h"
 #include "bsdcompat.h"
 #include "sig.h"
+#include "meterblock.h"
 #include "main.h"
 
 #define TRUE 1
@@ -1028,6 +1029,19 @@ void xlplayer_stats(struct xlplayer *self)
     #undef PREFIX
     }
 
+int xlplayer_meter_values(struct xlplayer *self, struct meterblock_player *mp)
+    {
+    mp->elapsed = self->play_progress_ms / 1000;
+    mp->playing = self->have_data_f | (self->current_audio_context & 0x1);
+    mp->signal = self->peak > 0.001F || self->peak < 0.0F || self->pause;
+    mp->cid = self->current_audio_context;
+    mp->runout = self->avail < self->samples_cutoff && (!(self->current_audio_context & 0x1));
+    mp->silence = self->silence;
+    self->peak = 0.0f;
+
+    return self->dynamic_metadata.data_type != DM_NONE_NEW;
+    }
+
 void xlplayer_stats_all(struct xlplayer **list)
     {
     while (*list)
@@ -222,6 +222,10 @@ void xlplayer_smoothing_process(struct xlplayer *self);
 
 void xlplayer_stats(struct xlplayer *self);
 
+/* the values of xlplayer_stats for the shared meter block, returns TRUE when there is new metadata to collect */
+struct meterblock_player;
+int xlplayer_meter_values(struct xlplayer *self, struct meterblock_player *mp);
+
 /* group process all players from the list */
 void xlplayer_read_start_all(struct xlplayer **list, jack_nframes_t nframes, struct xlplayer **roster);
 void xlplayer_read_next_all(struct xlplayer **list);
@@ -0,0 +1,269 @@
+"""Recording of backend traffic and its replay through the stand-in."""
+
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = ["Capture", "read_capture", "ReplayBackend"]
+
+
+import gzip
+import time
+import struct
+
+from .ipcframe import command_header, reply_header
+from .meterblock import MeterBlock
+from .standin import StandinBackend, StandinServer, parse_records
+
+
+magic = "IDJCCAP1"
+record = struct.Struct("=dcI")
+
+
+class Capture(object):
+    """Timestamped copy of the traffic with the backend, gzip compressed.
+
+    Each record is the time, a kind and the data:
+
+    w  a command frame as sent on the pipe
+    r  a reply frame as received
+    m  a consistent copy of the meter block, header and body, as read
+
+    Writing is buffered by the gzip module so the cost to the user
+    interface is one string join per message.
+    """
+
+
+    def __init__(self, pathname):
+        self.pathname = pathname
+        self._file = gzip.open(pathname, "wb", 6)
+        self._file.write(magic)
+
+
+    def add(self, kind, data):
+        if self._file is not None:
+            try:
+                self._file.write(record.pack(time.time(), kind, len(data)) +
+                                                                        data)
+            except EnvironmentError as e:
+                print "Capture: write failed, stopping:", e
+                self._file = None
+
+
+    def close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except EnvironmentError as e:
+                print "Capture: close failed:", e
+            self._file = None
+
+
+def read_capture(pathname):
+    """Generate (time, kind, data) from a capture file.
+
+    A truncated final record, as left by a crash, ends the capture.
+    """
+
+    with gzip.open(pathname, "rb") as fh:
+        if fh.read(len(magic)) != magic:
+            raise ValueError("%s is not a capture file" % pathname)
+        while 1:
+            try:
+                head = fh.read(record.size)
+                if len(head) != record.size:
+                    return
+                when, kind, size = record.unpack(head)
+                data = fh.read(size)
+            except (IOError, EOFError, struct.error):
+                return
+            if len(data) != size:
+                return
+            yield when, kind, data
+
+
+def command_key(module, records):
+    """Identify a command well enough to match its replies on replay."""
+
+    if module == "mx":
+        return "mx:" + records.get("ACTN", "")
+    if records.get("command") == "get_report":
+        return "sc:get_report:%s:%s" % (records.get("dev_type"),
+                                                    records.get("tab_id"))
+    return "sc:" + records.get("command", "")
+
+
+class ReplayBackend(StandinBackend):
+    """A stand-in backend that plays back a capture.
+
+    speed is how many times faster than real time the capture is played.
+    """
+
+
+    def __init__(self, pathname, speed=1.0):
+        StandinBackend.__init__(self, "levels=0,metadata=0,midi=0,streams=0")
+        self.pathname = pathname
+        self.speed = speed
+        # Fail here rather than in the child.
+        next(read_capture(pathname), None)
+
+
+    def _server(self, in_fd, out_fd):
+        return ReplayServer(in_fd, out_fd, self.rates, self.pathname,
+                                                                    self.speed)
+
+
+
+class ReplayServer(StandinServer):
+    """The child process side of ReplayBackend.
+
+    Meter block copies are written to the block the user interface attached
+    and are signalled on the event fifo as they were live. The latest
+    recorded level and stream reports are given when the user interface asks
+    for them. Track metadata and MIDI events are carried over from the
+    requestlevels replies the user interface has not asked for yet so none
+    are lost when replaying at speed. Session and JACK port events are not
+    replayed. Everything else is answered by the stand-in.
+    """
+
+
+    def __init__(self, in_fd, out_fd, rates, pathname, speed):
+        StandinServer.__init__(self, in_fd, out_fd, rates)
+        self.speed = speed
+        self._records = read_capture(pathname)
+        self._next = next(self._records, None)
+        self._origin = None
+        self._commands = {}     # Recorded request id to command key.
+        self._replies = {}      # Latest recorded reply by command key.
+        self._metadata = []
+        self._finished = False
+
+
+    def _capture_time(self, now):
+        if self._origin is None:
+            self._origin = now, self._next[0] if self._next else 0.0
+        return self._origin[1] + (now - self._origin[0]) * self.speed
+
+
+    def _timeout(self):
+        if self._next is None:
+            return None
+        return max(0.0, (self._next[0] - self._capture_time(time.time())) /
+                                                                    self.speed)
+
+
+    def _synthesise(self, now):
+        until = self._capture_time(now)
+        posts = set()
+        while self._next is not None and self._next[0] <= until:
+            when, kind, data = self._next
+            post = self._replay(kind, data)
+            if post:
+                posts.add(post)
+            self._next = next(self._records, None)
+
+        if self._next is None and not self._finished:
+            self._finished = True
+            print "replay: end of capture"
+
+        for post in sorted(posts):
+            self._post(post)
+
+
+    def _replay(self, kind, data):
+        """Take in one recorded message. Returns what to signal, if any."""
+
+        if kind == "w":
+            size, request_id, module = command_header.unpack_from(data)
+            records = parse_records(data, command_header.size,
+                                                    command_header.size + size)
+            self._commands[request_id] = command_key(module, records)
+        elif kind == "r":
+            size, request_id = reply_header.unpack_from(data)
+            key = self._commands.pop(request_id, None)
+            if key is not None and (key == "mx:requestlevels" or
+                                            key.startswith("sc:get_report")):
+                text = data[reply_header.size:]
+                self._replies[key] = text
+                if key == "mx:requestlevels":
+                    return self._take_events(text)
+        elif kind == "m":
+            if self.meters is not None and len(data) == MeterBlock.size:
+                self._write_meters(data)
+                return "m\n"
+        return None
+
+
+    def _take_events(self, text):
+        events = False
+        for line in text.splitlines():
+            key, sep, value = line.partition("=")
+            if key == "midi" and value:
+                self.midi.extend(value.split(","))
+                events = True
+            elif key.endswith("_new_metadata"):
+                self._metadata.append(line)
+                events = True
+        return "e\n" if events else None
+
+
+    def _write_meters(self, data):
+        values = MeterBlock.header.unpack_from(data)
+        self.seq += 1
+        MeterBlock.header.pack_into(self.meters, 0, values[0], values[1],
+                                                        self.seq, values[3])
+        self.meters[MeterBlock.header.size:MeterBlock.size] = \
+                                                data[MeterBlock.header.size:]
+        self.seq += 1
+        MeterBlock.header.pack_into(self.meters, 0, values[0], values[1],
+                                                        self.seq, values[3])
+
+
+    def _publish(self, now):
+        # The meter block holds recorded values only.
+        pass
+
+
+    def _levels_text(self):
+        text = self._replies.get("mx:requestlevels")
+        if text is None:
+            return StandinServer._levels_text(self)
+
+        lines = []
+        for line in text.splitlines():
+            key = line.partition("=")[0]
+            if key == "midi":
+                line = "midi=" + ",".join(self.midi)
+            elif key == "session_command":
+                line = "session_command="
+            elif key == "ports_connections_changed":
+                line = "ports_connections_changed=0"
+            elif key.endswith("_new_metadata") or key.startswith("session_"):
+                continue
+            elif key == "end":
+                lines += self._metadata
+            lines.append(line)
+        self.midi = []
+        self._metadata = []
+        return "\n".join(lines) + "\n"
+
+
+    def _sourceclient(self, command, records):
+        if command in ("get_report", "get_reports"):
+            text = self._replies.get(command_key("sc", records))
+            if text is not None:
+                return text
+        return StandinServer._sourceclient(self, command, records)
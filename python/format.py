@@ -384,6 +384,14 @@ class FormatDropdown(gtk.VBox):
                     self._combo_box.set_active(i)
                     break
 
+    def floor(self, value):
+        """The highest numeric choice not above value else the lowest."""
+
+        values = [int(x[0]["value"]) for x in self._combo_box.props.model
+                                            if x[0].get("sensitive", True)]
+        below = [x for x in values if x <= value]
+        return max(below) if below else min(values)
+
 
 class FormatSpin(gtk.VBox):
     def __init__(self, prev_object, title, ident, elements, row, unit, next_element_name, suggested_values, tooltip=None):
@@ -484,6 +492,12 @@ class FormatSpin(gtk.VBox):
         if not self.applied:
             self._spin_button.props.value = int(value)
 
+    def floor(self, value):
+        """value brought within the bounds of the spin button."""
+
+        adj = self._spin_button.get_adjustment()
+        return max(int(adj.lower), min(int(adj.upper), int(value)))
+
 
 class FormatPregain(FormatDropdown):
     """Level adjustment for audio before hitting the codec."""
@@ -1344,3 +1358,49 @@ class FormatControl(gtk.VBox):
         self._back_button.set_sensitive(True)
         self._send("command=encoder_stop\n")
         return self._receive() != "failed"
+
+    def lock(self):
+        """Keep the format as is while the stream uses another tab's encoder."""
+
+        self._back_button.set_sensitive(False)
+
+    def unlock(self):
+        if not self.running:
+            self._back_button.set_sensitive(True)
+
+    # Codecs whose bitrate can change mid stream without upsetting players.
+    _step_down_codecs = ("mp3", "aac", "aacpv2", "vorbis", "opus")
+
+    def lower_bitrate(self, percent):
+        """A bitrate the codec will take near percent of the current one.
+
+        None when the codec is not one to change bitrate while streaming or
+        there is nothing lower.
+        """
+
+        if not self._current.applied or format_collate(self._current).get(
+                                    "codec") not in self._step_down_codecs:
+            return None
+        element = self._current
+        while element.ident != "bitrate":
+            element = element.prev_object
+            if element is None:
+                return None
+        bitrate = int(element.value)
+        lower = element.floor(bitrate * percent // 100)
+        return str(lower) if lower < bitrate else None
+
+    def update_encoder(self, **overrides):
+        """Restart the running encoder in place with some settings changed.
+
+        Connections and recordings fed by the encoder stay up.
+        """
+
+        if not self.running:
+            return False
+        settings = format_collate(self._current)
+        settings.update(overrides)
+        kvps = ["=".join(pairs) for pairs in settings.iteritems()]
+        kvps.append("encode_source=jack\ncommand=encoder_update\n")
+        self._send("\n".join(kvps))
+        return self._receive() != "failed"
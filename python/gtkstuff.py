@@ -19,8 +19,10 @@
 import os
 import json
 import gettext
+import threading
 from abc import ABCMeta, abstractmethod
 from functools import wraps
+from contextlib import contextmanager
 
 import gobject
 import gtk
@@ -182,6 +184,24 @@ def threadslock(f):
     return newf
 
 
+@contextmanager
+def worker_threadslock():
+    """Hold the gtk lock for the duration but only within worker threads.
+
+    For code that may run either on the main thread, which will normally
+    hold the lock already, or on a helper thread.
+    """
+
+    if isinstance(threading.current_thread(), threading._MainThread):
+        yield
+    else:
+        gtk.gdk.threads_enter()
+        try:
+            yield
+        finally:
+            gtk.gdk.threads_leave()
+
+
 class DefaultEntry(gtk.Entry):
     def __init__(self, default_text, sensitive_override=False):
         gtk.Entry.__init__(self)
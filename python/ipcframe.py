@@ -0,0 +1,193 @@
+"""Length prefixed command and reply frames for the backend pipe."""
+
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = ["FramedPipe", "text_to_records"]
+
+
+import time
+import struct
+import collections
+
+
+# The layout must match c/ipcframe.h
+command_header = struct.Struct("=II2s")
+record_header = struct.Struct("=II")
+reply_header = struct.Struct("=II")
+
+
+def _bytes(s):
+    return s.encode("utf-8") if isinstance(s, unicode) else str(s)
+
+
+def text_to_records(text):
+    """Convert KEY=value lines ending with end into lists of (key, value).
+
+    One list per command, so the text forms used throughout the user
+    interface can be sent framed.
+    """
+
+    commands = []
+    records = []
+    for line in text.splitlines():
+        if line == "end":
+            commands.append(records)
+            records = []
+        elif "=" in line:
+            records.append(tuple(line.split("=", 1)))
+        elif line:
+            print "text_to_records: not a key=value pair:", line
+    if records:
+        commands.append(records)
+    return commands
+
+
+class FramedPipe(object):
+    """Framed commands to the backend and replies matched to them.
+
+    request() sends a command and returns its id for use with reply(). The
+    replies to commands sent with send() are read sequentially a line at a
+    time with readline() which is how the text protocol was read.
+
+    The backend handles one command at a time but nothing here relies on
+    that so commands may be pipelined.
+
+    Traffic and round trip times are reported to stats, an IPCStats. The
+    frames themselves are recorded to capture, a Capture.
+    """
+
+
+    def __init__(self, write_file, read_file, stats=None, capture=None):
+        self._write = write_file
+        self._read = read_file
+        self._stats = stats
+        self._capture = capture
+        self._sent_at = {}
+        self._next_id = 1
+        self._pending = set()       # Sent with no reply yet.
+        self._claimed = set()       # Replies wanted by reply().
+        self._replies = collections.OrderedDict()
+        self._lines = collections.deque()
+
+
+    def _send(self, module, records):
+        request_id = self._next_id
+        self._next_id = (self._next_id + 1) & 0xFFFFFFFF or 1
+        payload = []
+        for key, value in records:
+            key = _bytes(key)
+            value = _bytes(value)
+            payload.append(record_header.pack(len(key), len(value)))
+            payload.append(key)
+            payload.append(value)
+        payload = "".join(payload)
+        frame = command_header.pack(len(payload), request_id,
+                                                            module) + payload
+        self._write.write(frame)
+        if self._capture is not None:
+            self._capture.add("w", frame)
+        self._pending.add(request_id)
+        if self._stats is not None:
+            action = [v for k, v in records if k == "ACTN" or k == "command"]
+            command = "%s:%s" % (module, action[-1] if action else "")
+            self._sent_at[request_id] = command, time.time()
+            self._stats.sent(len(frame))
+        return request_id
+
+
+    def send(self, module, records):
+        self._send(module, records)
+        self._write.flush()
+
+
+    def send_text(self, module, text):
+        for records in text_to_records(text):
+            self._send(module, records)
+        self._write.flush()
+
+
+    def request(self, module, records):
+        """Send a command whose reply is to be collected with reply()."""
+
+        request_id = self._send(module, records)
+        self._write.flush()
+        self._claimed.add(request_id)
+        return request_id
+
+
+    def _read_frame(self):
+        """Next reply frame as (id, text) or None at end of file."""
+
+        header = self._read.read(reply_header.size)
+        if len(header) != reply_header.size:
+            return None
+        size, request_id = reply_header.unpack(header)
+        text = self._read.read(size) if size else ""
+        if len(text) != size:
+            return None
+        self._pending.discard(request_id)
+        if self._capture is not None:
+            self._capture.add("r", header + text)
+        if self._stats is not None:
+            command, sent_time = self._sent_at.pop(request_id, (None, None))
+            self._stats.received(reply_header.size + size, command, sent_time)
+        return request_id, text
+
+
+    def reply(self, request_id):
+        """The reply text of a request, or "" should the backend fail."""
+
+        self._claimed.discard(request_id)
+        while request_id not in self._replies:
+            if request_id not in self._pending:
+                return ""
+            frame = self._read_frame()
+            if frame is None:
+                return ""
+            self._replies[frame[0]] = frame[1]
+        return self._replies.pop(request_id)
+
+
+    def readline(self):
+        """The next line of reply to commands sent with send().
+
+        Returns "" when no reply can come.
+        """
+
+        while not self._lines:
+            for request_id in self._replies:
+                if request_id not in self._claimed:
+                    text = self._replies.pop(request_id)
+                    break
+            else:
+                if not self._pending - self._claimed:
+                    return ""
+                frame = self._read_frame()
+                if frame is None:
+                    return ""
+                request_id, text = frame
+                if request_id in self._claimed:
+                    self._replies[request_id] = text
+                    continue
+            self._lines.extend(text.splitlines(True))
+        return self._lines.popleft()
+
+
+    def close(self):
+        self._write.close()
+        self._read.close()
@@ -0,0 +1,169 @@
+"""Latency and throughput figures for the backend pipe."""
+
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = ["IPCStats"]
+
+
+import os
+import json
+import time
+import bisect
+import collections
+
+import glib
+
+
+class IPCStats(object):
+    """Round trip histograms per command, pipe throughput and vu_update timing.
+
+    A round trip is timed from a command being sent to its reply frame being
+    read, so it includes any wait for the user interface to get round to
+    reading. Commands are named by module and action, e.g. "mx:requestlevels".
+
+    A missed tick is a vu_update timer call that came late by more than half
+    its interval. An overrun is any vu_update taking longer than vu_budget.
+    """
+
+
+    # Upper bounds of the histogram buckets in milliseconds.
+    buckets = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0)
+    vu_samples = 1000
+    vu_budget = 50.0            # Milliseconds.
+    dump_interval = 10          # Seconds between rolling file entries.
+    dump_max_bytes = 1 << 20    # Size at which the file is rotated.
+
+
+    def __init__(self):
+        self.dump_pathname = None
+        self._dump_source = None
+        self.reset()
+
+
+    def reset(self):
+        self.histograms = collections.defaultdict(
+                                        lambda: [0] * (len(self.buckets) + 1))
+        self.bytes_out = self.bytes_in = 0
+        self.messages_out = self.messages_in = 0
+        self.vu_durations = collections.deque(maxlen=self.vu_samples)
+        self.vu_missed_ticks = self.vu_overruns = 0
+        self._last_tick = self._last_interval = None
+        self._started = self._last_rates = time.time()
+        self._last_counts = (0, 0, 0, 0)
+
+
+    def sent(self, nbytes):
+        self.bytes_out += nbytes
+        self.messages_out += 1
+
+
+    def received(self, nbytes, command, sent_time):
+        self.bytes_in += nbytes
+        self.messages_in += 1
+        if command is not None:
+            elapsed = (time.time() - sent_time) * 1000.0
+            self.histograms[command][
+                                bisect.bisect_left(self.buckets, elapsed)] += 1
+
+
+    def vu_tick(self, start, duration, interval=None):
+        """Record a vu_update run, interval given for timer driven calls."""
+
+        self.vu_durations.append(duration)
+        if duration * 1000.0 > self.vu_budget:
+            self.vu_overruns += 1
+        if interval is not None:
+            if self._last_tick is not None and self._last_interval == interval:
+                late = (start - self._last_tick) * 1000.0 - interval
+                if late > interval / 2.0:
+                    self.vu_missed_ticks += int(late / interval + 0.5)
+            self._last_tick = start
+            self._last_interval = interval
+
+
+    def _percentiles(self):
+        durations = sorted(self.vu_durations)
+        if not durations:
+            return {}
+        pick = lambda p: durations[min(len(durations) - 1,
+                                            int(len(durations) * p))] * 1000.0
+        return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99),
+                                                "max": durations[-1] * 1000.0}
+
+
+    def snapshot(self):
+        """The figures as a dict suitable for JSON encoding.
+
+        Rates are per second since the previous snapshot.
+        """
+
+        now = time.time()
+        counts = (self.bytes_out, self.bytes_in, self.messages_out,
+                                                            self.messages_in)
+        period = max(now - self._last_rates, 0.001)
+        rates = [(a - b) / period for a, b in zip(counts, self._last_counts)]
+        self._last_rates = now
+        self._last_counts = counts
+
+        return {
+            "time": now,
+            "uptime": now - self._started,
+            "buckets_ms": list(self.buckets) + [None],
+            "round_trips": dict(self.histograms),
+            "ui2be": {"bytes": counts[0], "messages": counts[2],
+                        "bytes_per_s": rates[0], "messages_per_s": rates[2]},
+            "be2ui": {"bytes": counts[1], "messages": counts[3],
+                        "bytes_per_s": rates[1], "messages_per_s": rates[3]},
+            "vu_update": dict(self._percentiles(),
+                        samples=len(self.vu_durations),
+                        missed_ticks=self.vu_missed_ticks,
+                        overruns=self.vu_overruns)
+        }
+
+
+    def start_dump(self, pathname):
+        """Append a snapshot to a rolling file every dump_interval seconds."""
+
+        self.stop_dump()
+        self.dump_pathname = pathname
+        self._dump_source = glib.timeout_add_seconds(self.dump_interval,
+                                                                self._dump)
+
+
+    def stop_dump(self):
+        if self._dump_source is not None:
+            glib.source_remove(self._dump_source)
+            self._dump_source = None
+        self.dump_pathname = None
+
+
+    def _dump(self):
+        try:
+            if os.path.getsize(self.dump_pathname) > self.dump_max_bytes:
+                os.rename(self.dump_pathname, self.dump_pathname + ".1")
+        except OSError:
+            pass
+
+        try:
+            with open(self.dump_pathname, "a") as f:
+                f.write(json.dumps(self.snapshot()) + "\n")
+        except EnvironmentError as e:
+            print "IPCStats: dump failed:", e
+            self._dump_source = self.dump_pathname = None
+            return False
+        return True
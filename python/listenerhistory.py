@@ -0,0 +1,193 @@
+"""Fixed size history of stream listener counts and connection health."""
+
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = ["ListenerHistory", "Sparkline"]
+
+
+import json
+import array
+
+import gtk
+
+
+class _Tier(object):
+    """Ring of samples each covering span seconds.
+
+    A sample holds the maximum of each field over its span, -1 for none.
+    """
+
+
+    fields = ("listeners", "sendbuffer", "state")
+
+
+    def __init__(self, name, span, capacity):
+        self.name = name
+        self.span = span
+        self.capacity = capacity
+        self.data = dict((x, array.array("i", [-1] * capacity))
+                                                        for x in self.fields)
+        self.bucket = None      # Number of the newest span since the epoch.
+
+
+    def add(self, now, values):
+        bucket = int(now // self.span)
+        if bucket != self.bucket:
+            if self.bucket is not None and bucket > self.bucket:
+                # Spans gone by without samples are blanked.
+                for b in xrange(max(self.bucket + 1, bucket - self.capacity + 1),
+                                                                    bucket + 1):
+                    for field in self.fields:
+                        self.data[field][b % self.capacity] = -1
+            self.bucket = bucket
+        i = bucket % self.capacity
+        for field, value in zip(self.fields, values):
+            column = self.data[field]
+            if value > column[i]:
+                column[i] = value
+
+
+    def rows(self):
+        """Generate (time, listeners, sendbuffer, state) oldest first."""
+
+        if self.bucket is None:
+            return
+        for b in xrange(self.bucket - self.capacity + 1, self.bucket + 1):
+            i = b % self.capacity
+            values = [self.data[field][i] for field in self.fields]
+            if values[2] != -1:
+                yield tuple([b * self.span] + values)
+
+
+    def recent(self, field, n):
+        """The newest n samples of a field oldest first, -1 where none."""
+
+        if self.bucket is None:
+            return [-1] * n
+        column = self.data[field]
+        return [column[b % self.capacity] if b > self.bucket - self.capacity
+                    else -1 for b in xrange(self.bucket - n + 1, self.bucket + 1)]
+
+
+
+class ListenerHistory(object):
+    """Listener count, send buffer fill and connection state over time.
+
+    Sampled at every monitor tick into three tiers of fixed size: a second
+    for an hour, a minute for a day, and an hour for thirty days. Each
+    sample is the maximum seen within its period. A listener count of -1
+    means it was not known.
+    """
+
+
+    tiers = (("second", 1, 3600), ("minute", 60, 1440), ("hour", 3600, 720))
+
+
+    def __init__(self):
+        self._tiers = dict((name, _Tier(name, span, capacity))
+                                        for name, span, capacity in self.tiers)
+
+
+    def add(self, now, listeners, sendbuffer, state):
+        for tier in self._tiers.itervalues():
+            tier.add(now, (listeners, sendbuffer, state))
+
+
+    def tier(self, name):
+        try:
+            return self._tiers[name]
+        except KeyError:
+            raise ValueError("no such tier: %s" % name)
+
+
+    def to_csv(self, name):
+        lines = ["time,listeners,sendbuffer,state"]
+        lines += ["%d,%d,%d,%d" % row for row in self.tier(name).rows()]
+        return "\n".join(lines) + "\n"
+
+
+    def to_json(self, name):
+        tier = self.tier(name)
+        return json.dumps({"tier": name, "span": tier.span,
+                "fields": ["time"] + list(tier.fields),
+                "rows": list(tier.rows())})
+
+
+    def export(self, name, format):
+        if format == "csv":
+            return self.to_csv(name)
+        if format == "json":
+            return self.to_json(name)
+        raise ValueError("no such format: %s" % format)
+
+
+
+class Sparkline(gtk.DrawingArea):
+    """Small line graph of the recent listener counts of a ListenerHistory.
+
+    Drawn from the minute tier and redrawn as each minute passes.
+    """
+
+
+    samples = 60
+
+
+    def __init__(self, history, width=60, height=14):
+        gtk.DrawingArea.__init__(self)
+        self.history = history
+        self.set_size_request(width, height)
+        self.connect("expose-event", self._on_expose)
+        self._bucket = None
+
+
+    def update(self):
+        bucket = self.history.tier("minute").bucket
+        if bucket != self._bucket:
+            self._bucket = bucket
+            self.queue_draw()
+
+
+    def _on_expose(self, widget, event):
+        values = self.history.tier("minute").recent("listeners", self.samples)
+        top = max(values)
+        if top <= 0:
+            return True
+
+        cr = widget.window.cairo_create()
+        area = event.area
+        cr.rectangle(area.x, area.y, area.width, area.height)
+        cr.clip()
+        alloc = widget.get_allocation()
+        step = float(alloc.width - 1) / max(1, self.samples - 1)
+        scale = float(alloc.height - 2) / top
+        cr.set_line_width(1.0)
+        cr.set_source_color(widget.style.fg[gtk.STATE_NORMAL])
+        pen_down = False
+        for i, value in enumerate(values):
+            if value < 0:
+                pen_down = False
+                continue
+            x = i * step + 0.5
+            y = alloc.height - 1.5 - value * scale
+            if pen_down:
+                cr.line_to(x, y)
+            else:
+                cr.move_to(x, y)
+                pen_down = True
+        cr.stroke()
+        return True
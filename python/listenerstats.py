@@ -0,0 +1,215 @@
+"""Listener counts from Icecast and Shoutcast server admin pages."""
+
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = ["StatsServer", "StatsCollector", "stats_collector"]
+
+
+import time
+import base64
+import socket
+import urllib
+import httplib
+import threading
+import collections
+import Queue
+import xml.etree.cElementTree as ElementTree
+
+
+StatsServer = collections.namedtuple("StatsServer",
+                    "is_shoutcast host port mount login password")
+
+
+class BadStats(ValueError):
+    pass
+
+
+
+class StatsCollector(object):
+    """Fetches listener counts on a small pool of worker threads.
+
+    request() queues a fetch which is skipped should the server have been
+    asked within min_interval or be backing off after failures. Connections
+    are kept alive and reused per host. The admin page is parsed as it
+    arrives and only until the listener count is found, after which a short
+    remainder is read off so the connection can be reused, a long one
+    closes it.
+
+    listeners() is the last count if no older than ttl seconds, else -2.
+    """
+
+
+    workers = 4
+    timeout = 5.0
+    min_interval = 5.0
+    ttl = 30.0
+    backoff = 10.0
+    backoff_max = 300.0
+    drain_max = 65536
+    idle_max = 60.0
+
+
+    def __init__(self):
+        self._jobs = Queue.Queue()
+        self._lock = threading.Lock()
+        self._results = {}      # Server to (time, listeners).
+        self._asked = {}        # Server to time of the last request.
+        self._failures = {}     # Server to (count, time of next attempt).
+        self._busy = set()
+        self._idle = {}         # (host, port) to [(time, connection), ...].
+        self._threads = []
+
+
+    def request(self, server):
+        now = time.time()
+        with self._lock:
+            if server in self._busy or now - self._asked.get(server, 0.0) < \
+                                                            self.min_interval:
+                return
+            if now < self._failures.get(server, (0, 0.0))[1]:
+                return
+            self._asked[server] = now
+            self._busy.add(server)
+            if len(self._threads) < min(self.workers,
+                                                len(self._busy)):
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        self._jobs.put(server)
+
+
+    def listeners(self, server):
+        with self._lock:
+            when, listeners = self._results.get(server, (0.0, -2))
+        if time.time() - when > self.ttl:
+            return -2
+        return listeners
+
+
+    def _work(self):
+        """Worker thread body."""
+
+        while 1:
+            server = self._jobs.get()
+            try:
+                listeners = self._fetch(server)
+            except Exception as e:
+                with self._lock:
+                    count = self._failures.get(server, (0, 0.0))[0] + 1
+                    self._failures[server] = count, time.time() + min(
+                            self.backoff_max, self.backoff * 2 ** (count - 1))
+                if count == 1:
+                    print "failed to get server stats for %s:%d%s: %s" % (
+                                server.host, server.port, server.mount, e)
+            else:
+                with self._lock:
+                    self._results[server] = time.time(), listeners
+                    self._failures.pop(server, None)
+            finally:
+                with self._lock:
+                    self._busy.discard(server)
+
+
+    def _connection(self, host, port):
+        """An idle kept alive connection if there is one and whether so."""
+
+        now = time.time()
+        with self._lock:
+            idle = self._idle.get((host, port), [])
+            while idle:
+                when, conn = idle.pop()
+                if now - when < self.idle_max:
+                    return conn, True
+                conn.close()
+        return httplib.HTTPConnection(host, port, timeout=self.timeout), False
+
+
+    def _release(self, host, port, conn):
+        with self._lock:
+            self._idle.setdefault((host, port), []).append((time.time(), conn))
+
+
+    def _fetch(self, server):
+        if server.is_shoutcast:
+            path = "/admin.cgi?mode=viewxml"
+        else:
+            path = "/admin/listclients?mount=" + urllib.quote(server.mount)
+        headers = {"User-Agent": "Mozilla/5.0",
+                   "Authorization": "Basic " + base64.b64encode("%s:%s" % (
+                                                server.login, server.password))}
+
+        conn, reused = self._connection(server.host, server.port)
+        try:
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+            except (httplib.HTTPException, socket.error):
+                if not reused:
+                    raise
+                # The server may have dropped the idle connection.
+                conn.close()
+                conn = httplib.HTTPConnection(server.host, server.port,
+                                                        timeout=self.timeout)
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+
+            if response.status != 200:
+                raise BadStats("HTTP status %d" % response.status)
+            listeners = self._parse(response, server)
+            if response.length is not None and \
+                                    response.length <= self.drain_max:
+                response.read()
+            if response.isclosed() and not response.will_close:
+                self._release(server.host, server.port, conn)
+                conn = None
+            return listeners
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+    @staticmethod
+    def _parse(response, server):
+        """The listener count, parsing no further than needed."""
+
+        root = mount = None
+        for event, elem in ElementTree.iterparse(response,
+                                                    events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem.tag
+                    if root != ("icestats", "SHOUTCASTSERVER")[
+                                                        server.is_shoutcast]:
+                        raise BadStats("unexpected document " + root)
+                if elem.tag == "source":
+                    mount = elem.get("mount")
+                continue
+
+            if server.is_shoutcast:
+                if elem.tag == "CURRENTLISTENERS":
+                    return int(elem.text.strip())
+            elif elem.tag == "Listeners" and mount == server.mount:
+                return int(elem.text.strip())
+            elif elem.tag == "listener":
+                elem.clear()
+        raise BadStats("no listener count")
+
+
+
+stats_collector = StatsCollector()
@@ -18,6 +18,7 @@
             
 import os
 import sys
+import errno
 import fcntl
 import subprocess
 import ConfigParser
@@ -50,6 +51,16 @@ from .jingles import ExtraPlayers
 from .utils import SlotObject
 from .utils import LinkUUIDRegistry
 from .utils import PathStr
+from .utils import WatchedDict
+from .metadatacache import MetadataCache
+from .playlog import PlayLog
+from .meterblock import MeterBlock
+from .ipcframe import FramedPipe
+from .ipcstats import IPCStats
+from .standin import StandinBackend, GUIBenchmark
+from .capture import Capture, ReplayBackend
+from .trackhistory import AsyncWriter, TrackHistory
+from .metadatabus import MetadataBus
 from .gtkstuff import threadslock, WindowSizeTracker, ConfirmationDialog
 from .gtkstuff import IconChooserButton, IconPreviewFileChooserDialog, LEDDict
 from .gtkstuff import LabelSubst
@@ -65,6 +76,7 @@ _ = gettext.translation(FGlobs.package_name, FGlobs.localedir,
 args = ArgumentParserImplementation().parse_args()
 pm = ProfileManager()
 link_uuid_reg = LinkUUIDRegistry()
+metadata_cache = MetadataCache()
 
 METER_TEXT_SIZE = 8000
 
@@ -1379,59 +1391,109 @@ def make_stream_meter_unit(text, meters):
 
 
 
+class MeterClock(object):
+    """Paces meter repaints and animation to one frame per interval.
+
+    Meters call request() when given a value and have their frame() method
+    called on the next tick. frame() returns True for another call on the
+    tick after, for meters with decay to animate. The clock stops when no
+    meter needs it.
+    """
+
+
+    interval = 40
+
+
+    def __init__(self):
+        self._meters = set()
+        self._source = None
+
+
+    def request(self, meter):
+        self._meters.add(meter)
+        if self._source is None:
+            self._source = glib.timeout_add(self.interval, self._tick)
+
+
+    @threadslock
+    def _tick(self):
+        meters = self._meters
+        self._meters = set()
+        for meter in meters:
+            if meter.frame():
+                self._meters.add(meter)
+
+        if self._meters:
+            return True
+        self._source = None
+        return False
+
+meter_clock = MeterClock()
+
+
+
+def rgb(spec):
+    """Cairo colour tuple from a colour name or #RRGGBB."""
+
+    colour = gtk.gdk.color_parse(spec)
+    return colour.red / 65535.0, colour.green / 65535.0, colour.blue / 65535.0
+
+
+
 class StreamMeter(gtk.Frame):
     """Main panel meter showing stream status and buffer fill."""
     
     
-    def realize(self, widget):
-        self.gc = gtk.gdk.GC(self.window)
-        self.gc.copy(self.da.get_style().fg_gc[gtk.STATE_NORMAL])
-        self.green = gtk.gdk.color_parse("#30D030")
-        self.red    = gtk.gdk.color_parse("#D05044")
-        self.grey  = gtk.gdk.color_parse("darkgray")
+    green = rgb("#30D030")
+    red = rgb("#D05044")
+    grey = rgb("darkgray")
 
-    def expose(self, widget, event):
+
+    def _shown(self):
         if self.flash or not self.active:
-            self.gc.set_rgb_fg_color(self.grey)
-            self.da.window.draw_rectangle(
-                        self.gc, True, 0, 0, self.rect.width, self.rect.height)
-        else:
-            valuep = int(float(self.value - self.base) /
+            return None
+        return int(float(self.value - self.base) /
                                 float(self.top - self.base) * self.rect.width)
-            self.gc.set_rgb_fg_color(self.red)
-            self.da.window.draw_rectangle(
-                                self.gc, True, 0, 0, valuep, self.rect.height)
-            self.gc.set_rgb_fg_color(self.green)
-            self.da.window.draw_rectangle(self.gc, True, valuep, 0,
-                                    self.rect.width - valuep, self.rect.height)
+
+
+    def expose(self, widget, event):
+        self.drawn = self._shown()
+        cr = self.da.window.cairo_create()
+        area = event.area
+        cr.rectangle(area.x, area.y, area.width, area.height)
+        cr.clip()
+        if self.drawn is None:
+            cr.set_source_rgb(*self.grey)
+            cr.paint()
+        else:
+            cr.set_source_rgb(*self.red)
+            cr.rectangle(0, 0, self.drawn, self.rect.height)
+            cr.fill()
+            cr.set_source_rgb(*self.green)
+            cr.rectangle(self.drawn, 0, self.rect.width - self.drawn,
+                                                            self.rect.height)
+            cr.fill()
 
     def cb_configure(self, widget, event):
         self.rect.width = event.width
         self.rect.height = event.height
 
     def set_value(self, value):
-        if value < self.base:
-            self.value = self.base
-        elif self.value > self.top:
-            self.value = self.top
-        else:
-            self.value = value
-        if value != self.oldvalue:
-            self.invalidate()
+        self.value = max(self.base, min(self.top, value))
+        meter_clock.request(self)
 
     def set_active(self, active):
-        if active != self.active:
-            self.active = active
-            self.invalidate()
+        self.active = active
+        meter_clock.request(self)
 
     def set_flash(self, flash):
-        if flash != self.flash:
-            self.flash = flash
-            self.invalidate()
+        self.flash = flash
+        meter_clock.request(self)
 
-    def invalidate(self):
-        if self.da.flags() & gtk.REALIZED:
+    def frame(self):
+        if self._shown() != self.drawn and self.da.flags() & gtk.REALIZED:
             self.da.window.invalidate_rect(self.rect, False)
+        return False
 
     def __init__(self, base, top):
         self.base = base
@@ -1441,46 +1503,103 @@ class StreamMeter(gtk.Frame):
         self.da = gtk.DrawingArea()
         self.add(self.da)
         self.da.connect("configure_event", self.cb_configure)
-        self.da.connect("realize", self.realize)
         self.da.connect("expose_event", self.expose)
         self.da.show()
         self.rect = gtk.gdk.Rectangle()
-        self.value = self.oldvalue = self.base
+        self.value = self.base
         self.active = False
         self.flash = False
+        self.drawn = None
 
 
 
 class BasicMeter(gtk.Frame):
-    """A meter widget with a simple rectangular vertical bar."""
+    """A meter widget with a simple rectangular vertical bar.
 
+    The bar and the background are pre-rendered per meter size and painted
+    through a clip of the area that changed.
+    """
 
-    def realize(self, widget):
-        self.gc = gtk.gdk.GC(self.window)
-        self.gc.copy(self.da.get_style().fg_gc[gtk.STATE_NORMAL])
-        self.lowc = gtk.gdk.color_parse("#30D030")
-        self.midc = gtk.gdk.color_parse("#CCCF44")
-        self.highc = gtk.gdk.color_parse("#D05044")
-        self.backc = gtk.gdk.color_parse("darkgray")
-        self.linec = gtk.gdk.color_parse("#505050")
+
+    lowc = rgb("#30D030")
+    midc = rgb("#CCCF44")
+    highc = rgb("#D05044")
+    backc = rgb("darkgray")
+    linec = rgb("#505050")
+
+    _surfaces = {}      # Shared by meters of the same size and thresholds.
+    _max_surfaces = 32
+
+
+    def _get_surfaces(self, cr):
+        key = (self.base, self.top, self.lut, self.mut, self.width,
+                                                                self.height)
+        try:
+            return self._surfaces[key]
+        except KeyError:
+            pass
+
+        if len(self._surfaces) >= self._max_surfaces:
+            self._surfaces.clear()
+
+        target = cr.get_target()
+        fg = target.create_similar(cairo.CONTENT_COLOR, self.width,
+                                                                self.height)
+        fgcr = cairo.Context(fg)
+        for colour, top, bottom in (
+                    (self.highc, 0, self.height - self.mutp),
+                    (self.midc, self.height - self.mutp, self.height - self.lutp),
+                    (self.lowc, self.height - self.lutp, self.height)):
+            fgcr.set_source_rgb(*colour)
+            fgcr.rectangle(0, top, self.width, bottom - top)
+            fgcr.fill()
+
+        bg = target.create_similar(cairo.CONTENT_COLOR, self.width,
+                                                                self.height)
+        bgcr = cairo.Context(bg)
+        bgcr.set_source_rgb(*self.backc)
+        bgcr.paint()
+
+        surfaces = self._surfaces[key] = fg, bg
+        return surfaces
+
+
+    def _pixels(self, value):
+        return int(self.height * float(value - self.base) /
+                                                float(self.top - self.base))
 
 
     def expose(self, widget, event):
-        self.oldvalue = self.top
-        self.set_value(self.value)
-        if self.value != self.base:
-            self.oldvalue = self.base
-            self.set_value(self.value)
+        self.drawnp = valuep = self._pixels(self.value)
+        cr = self.da.window.cairo_create()
+        area = event.area
+        cr.rectangle(area.x, area.y, area.width, area.height)
+        cr.clip()
+        fg, bg = self._get_surfaces(cr)
+
+        cr.set_source_surface(bg, 0, 0)
+        cr.rectangle(0, 0, self.width, self.height - valuep)
+        cr.fill()
+        cr.set_source_surface(fg, 0, 0)
+        cr.rectangle(0, self.height - valuep, self.width, valuep)
+        cr.fill()
+
+        if self.line is not None:
+            y = self.height - self._pixels(self.line) + 0.5
+            cr.set_source_rgb(*self.linec)
+            cr.set_line_width(1.0)
+            cr.move_to(0, y)
+            cr.line_to(self.width, y)
+            cr.stroke()
 
 
     def cb_configure(self, widget, event):
         self.width = event.width
         self.height = event.height
         # calculate colour threshold pixels
-        self.lutp = int(self.height * float(self.lut - self.base) /
-                                                    float(self.top - self.base))
-        self.mutp = int(self.height * float(self.mut - self.base) /
-                                                    float(self.top - self.base))
+        self.lutp = self._pixels(self.lut)
+        self.mutp = self._pixels(self.mut)
+
 
     def set_value(self, value):
         if value > self.top:
@@ -1488,35 +1607,19 @@ class BasicMeter(gtk.Frame):
         if value < self.base:
             value = self.base
         self.value = value
-        if self.da.flags() & gtk.REALIZED:
-            valuep = int(self.height * float(self.value - self.base) /
-                                                    float(self.top - self.base))
-            if value < self.oldvalue:
-                self.gc.set_rgb_fg_color(self.backc)
-                self.da.window.draw_rectangle(self.gc, True, 0, 0, self.width,
-                                                    self.height - valuep)
-            if value > self.oldvalue:
-                if valuep > self.mutp:
-                    self.gc.set_rgb_fg_color(self.highc)
-                    self.da.window.draw_rectangle(self.gc, True, 0, self.height
-                                    - valuep, self.width, valuep - self.mutp)
-                    valuep = self.mutp
-                if valuep > self.lutp:
-                    self.gc.set_rgb_fg_color(self.midc)
-                    self.da.window.draw_rectangle(self.gc, True, 0, self.height
-                                    - valuep, self.width, valuep - self.lutp)
-                    valuep = self.lutp
-                if valuep > 0:
-                    self.gc.set_rgb_fg_color(self.lowc)
-                    self.da.window.draw_rectangle(self.gc, True, 0, self.height
-                                    - valuep, self.width, valuep)
-            if self.line is not None:
-                valuel = int(self.height * float(self.line - self.base) /
-                                                    float(self.top - self.base))
-                self.gc.set_rgb_fg_color(self.linec)
-                self.da.window.draw_lines(self.gc, ((0, self.height - valuel),
-                                            (self.width, self.height - valuel))) 
-            self.oldvalue = value
+        meter_clock.request(self)
+
+
+    def frame(self):
+        """Invalidate the span between the drawn and the new bar height."""
+
+        valuep = self._pixels(self.value)
+        if valuep != self.drawnp and self.da.flags() & gtk.REALIZED:
+            top = self.height - max(valuep, self.drawnp)
+            self.da.window.invalidate_rect(gtk.gdk.Rectangle(0, top,
+                            self.width, abs(valuep - self.drawnp)), False)
+            self.drawnp = valuep
+        return False
 
 
     def set_line(self, lineval):
@@ -1524,7 +1627,8 @@ class BasicMeter(gtk.Frame):
                                 lineval >= self.top or lineval <= self.base):
             lineval = None
         self.line = lineval
-        self.expose(None, None)
+        if self.da.flags() & gtk.REALIZED:
+            self.da.queue_draw()
 
 
     def get_value(self):
@@ -1547,7 +1651,6 @@ class BasicMeter(gtk.Frame):
         self.da = gtk.DrawingArea()
         self.add(self.da)
         self.da.connect("configure_event", self.cb_configure)
-        self.da.connect("realize", self.realize)
         self.da.connect("expose_event", self.expose)
         self.da.show()
         self.base = base
@@ -1555,7 +1658,7 @@ class BasicMeter(gtk.Frame):
         self.lut = lut
         self.mut = mut
         self.value = base
-        self.oldvalue = self.top
+        self.width = self.height = self.lutp = self.mutp = self.drawnp = 0
         self.line = None
 
 
@@ -1564,17 +1667,35 @@ class StackedMeter(gtk.Frame):
     """Meter with three fill levels showing as different colours."""
     
     
-    def realize(self, widget):
-        self.gc = gtk.gdk.GC(self.window)
-        self.gc.copy(self.da.get_style().fg_gc[gtk.STATE_NORMAL])
-        self.ngc = gtk.gdk.color_parse("#30D030")
-        self.dsc = gtk.gdk.color_parse("#CCCF44")
-        self.compc = gtk.gdk.color_parse("#D05044")
-        self.backc = gtk.gdk.color_parse("darkgray")
+    ngc = rgb("#30D030")
+    dsc = rgb("#CCCF44")
+    compc = rgb("#D05044")
+    backc = rgb("darkgray")
+
+
+    def _heights(self):
+        nh = int(self.uh * self.n)
+        dh = int(self.uh * self.d)
+        ch = int(self.uh * self.c)
+        if ch + dh + nh > self.height:
+            ch = self.height - dh - nh
+        return nh, dh, ch
 
 
     def expose(self, widget, event):
-        self.set_meter_value(self.c, self.d, self.n, True)
+        self.drawn = nh, dh, ch = self._heights()
+        cr = self.da.window.cairo_create()
+        area = event.area
+        cr.rectangle(area.x, area.y, area.width, area.height)
+        cr.clip()
+        y = 0
+        for colour, h in ((self.ngc, nh), (self.dsc, dh), (self.compc, ch),
+                                    (self.backc, self.height - nh - dh - ch)):
+            if h:
+                cr.set_source_rgb(*colour)
+                cr.rectangle(0, y, self.width, h)
+                cr.fill()
+                y += h
 
 
     def cb_configure(self, widget, event):
@@ -1583,47 +1704,18 @@ class StackedMeter(gtk.Frame):
         self.uh = self.height / float(self.top - self.base)
 
 
-    def set_meter_value(self, c, d, n, force=False):
-        if not force and (self.c == c and self.d == d and self.n == n):
-            # Values not changed from last time so no need to redraw.
-            return
-        if c < self.base:
-            c = self.base
-        if d < self.base:
-            d = self.base
-        if n < self.base:
-            n = self.base
-        if c > self.top:
-            c = self.top
-        if d > self.top:
-            d = self.top
-        if n > self.top:
-            n = self.top
-        self.c = c
-        self.d = d
-        self.n = n
-        if self.da.flags() & gtk.REALIZED:
-            nh = int(self.uh * n)
-            dh = int(self.uh * d)
-            ch = int(self.uh * c)
-            if ch + dh + nh > self.height:
-                ch = self.height - dh - nh
-            if nh:
-                self.gc.set_rgb_fg_color(self.ngc)
-                self.da.window.draw_rectangle(
-                                    self.gc, True, 0, 0, self.width, nh)
-            if dh:
-                self.gc.set_rgb_fg_color(self.dsc) 
-                self.da.window.draw_rectangle(
-                                    self.gc, True, 0, nh, self.width, dh)
-            if ch:
-                self.gc.set_rgb_fg_color(self.compc)
-                self.da.window.draw_rectangle(
-                                    self.gc, True, 0, nh + dh, self.width, ch)
-
-            self.gc.set_rgb_fg_color(self.backc)
-            self.da.window.draw_rectangle(self.gc, True, 0, nh + dh + ch,
-                                    self.width, self.height - (nh + dh + ch))
+    def set_meter_value(self, c, d, n):
+        clamp = lambda x: max(self.base, min(self.top, x))
+        self.c = clamp(c)
+        self.d = clamp(d)
+        self.n = clamp(n)
+        meter_clock.request(self)
+
+
+    def frame(self):
+        if self._heights() != self.drawn and self.da.flags() & gtk.REALIZED:
+            self.da.queue_draw()
+        return False
 
 
     def __init__(self, base, top):
@@ -1635,64 +1727,75 @@ class StackedMeter(gtk.Frame):
         self.da = gtk.DrawingArea()
         self.add(self.da)
         self.da.connect("configure_event", self.cb_configure)
-        self.da.connect("realize", self.realize)
         self.da.connect("expose_event", self.expose)
         self.da.show()
-        self.c = self.d = self.n = base - 1
+        self.c = self.d = self.n = base
+        self.width = self.height = self.uh = 0
+        self.drawn = None
 
 
 
 class vumeter(BasicMeter):
-    """A VU meter that needs to be fed values at 50ms intervals."""
+    """A VU meter that averages over the last six frames of the clock."""
     
 
     def set_meter_value(self, newvalue):
-        if newvalue > self.scale:
-            newvalue = self.scale
-            
+        self.sample = min(newvalue, self.scale)
+        meter_clock.request(self)
+
+
+    def frame(self):
         self.gen6 = self.gen5
         self.gen5 = self.gen4
         self.gen4 = self.gen3
         self.gen3 = self.gen2
         self.gen2 = self.gen1
-        self.gen1 = newvalue
+        self.gen1 = self.sample
 
-        # Weighted mean over 300ms.
+        # Weighted mean over 240ms.
         newvalue = (5 * self.gen1 + 6 * self.gen2 + 4 * self.gen3 + 
                                 3 * self.gen4 + 2 * self.gen5 + self.gen6 ) / 21
-        BasicMeter.set_value(self, -newvalue)
+        self.value = max(self.base, min(self.top, -newvalue))
+        BasicMeter.frame(self)
+        return self.gen6 != self.sample
 
 
     def __init__(self):
         BasicMeter.__init__(self, -36, 0, -12, -7)
-        self.scale = 36
-        self.gen1 = self.gen2 = self.gen3 = self.gen4 = self.gen5 = self.scale
+        self.scale = self.sample = 36
+        self.gen1 = self.gen2 = self.gen3 = self.gen4 = self.gen5 = \
+                                                    self.gen6 = self.scale
 
 
 
 class peakholdmeter(BasicMeter):
-    """A peak-hold meter."""
+    """A peak-hold meter that decays on the frame clock."""
 
 
     def set_meter_value(self, newval):
-        oldval = self.get_value()
-        if newval > oldval:
+        self.sample = newval
+        if newval > self.value:
             self.peakage = 0
-            oldval = newval
-        else:
+            self.value = min(newval, self.top)
+        meter_clock.request(self)
+
+
+    def frame(self):
+        floor = max(self.sample, self.base)
+        if self.value > floor:
             self.peakage += 1
             if self.peakage > self.peakholditers:
-                newval = oldval - (self.peakage - self.peakholditers) ** 1.1
-            else:
-                newval = oldval
-        BasicMeter.set_value(self, newval)
+                self.value = max(floor, self.value -
+                                (self.peakage - self.peakholditers) ** 1.1)
+        BasicMeter.frame(self)
+        return self.value > floor
 
 
     def __init__(self):
         BasicMeter.__init__(self, -36, 0, -12, -2)
         self.peakage = 0
-        self.oldval = 0
-        self.peakholditers = 4  # Meter hold iterations.
+        self.sample = self.base
+        self.peakholditers = 5  # Frames the peak is held for.
 
 
 
@@ -1908,71 +2011,134 @@ class idjc_shutdown_dialog:
 
 
 class MainWindow(dbus.service.Object):
-    def send_new_mixer_stats(self):
+    vu_poll_interval = 50        # Milliseconds, without the event fifo.
+    vu_fallback_interval = 500   # Milliseconds, with it.
+    metadata_encoder_lag = 1000  # Milliseconds a track change must stand
+    metadata_irc_lag = 3000      # before it is announced.
+
 
+    # Mixer settings in the order of the old mixstats string as named in
+    # mixdelta_parse in c/mixer.c. Fader values are sent coalesced.
+    mixer_continuous = frozenset(("vol", "vol2", "xf", "jvol1", "jmute1",
+        "jvol2", "jmute2", "ivol", "mixback", "djaud", "alarmaud", "voip"))
+
+
+    def _mixer_state(self):
         deckadj = deck2adj = self.deckadj.get_value()
         if self.prefs_window.dual_volume.get_active():
              deck2adj = self.deck2adj.get_value()
 
-        string_to_send = ":%03d:%03d:%03d:%03d:%03d:%03d:%03d:%03d:%03d:" \
-                        "%d:%d%d%d%d%d:%d%d:%d%d%d%d:%d:%d:%d:%d:%d:%f:%f:" \
-                        "%d:%f:%d:%d:%d:%d:%d:%d:%d:%03d:%f:" % (
-                        deckadj,
-                        deck2adj,
-                        self.crossadj.get_value(),
-                        self.jingles.jvol_adj[0].get_value(),
-                        self.jingles.jmute_adj[0].get_value(),
-                        self.jingles.jvol_adj[1].get_value(),
-                        self.jingles.jmute_adj[1].get_value(),
-                        self.jingles.ivol_adj.get_value(),
-                        self.mixbackadj.get_value(),
-                        self.jingles.playing,
-                        self.player_left.stream.get_active(),
-                        self.player_left.listen.get_active(),
-                        self.player_right.stream.get_active(),
-                        self.player_right.listen.get_active(),
-                        self.listen_stream.get_active(),
-                        self.player_left.pause.get_active(),
-                        self.player_right.pause.get_active(),
-                        self.player_left.flush,
-                        self.player_right.flush,
-                        self.jingles.flush,
-                        self.jingles.interludeflush,
-                        self.simplemixer,
-                        self.alarm,
-                        self.mixermode,
-                        True,
-                        self.player_left.play.get_active() or
-                        self.player_right.play.get_active(),
-                        1.0 / self.player_left.pbspeedfactor,
-                        1.0 / self.player_right.pbspeedfactor,
-                        self.prefs_window.speed_variance.get_active(),
-                        self.prefs_window.dj_aud_adj.get_value(),
-                        self.crosspattern.get_active(),
-                        self.dsp_button.get_active(), 
-                        self.jingles.interlude.pause.get_active(),
-                        self.jingles.interlude.stream.get_active(),
-                        self.jingles.interlude.listen.get_active(),
-                        self.jingles.interlude.force.get_active(),
-                        self.prefs_window.alarm_aud_adj.get_value(),
-                        self.voipgainadj.get_value(),
-                        1.0 / self.jingles.interlude.pbspeedfactor
-                        )
-        self.mixer_write("MIXR=%s\nACTN=mixstats\nend\n" % string_to_send)
+        return (
+                ("vol", "%d" % deckadj),
+                ("vol2", "%d" % deck2adj),
+                ("xf", "%d" % self.crossadj.get_value()),
+                ("jvol1", "%d" % self.jingles.jvol_adj[0].get_value()),
+                ("jmute1", "%d" % self.jingles.jmute_adj[0].get_value()),
+                ("jvol2", "%d" % self.jingles.jvol_adj[1].get_value()),
+                ("jmute2", "%d" % self.jingles.jmute_adj[1].get_value()),
+                ("ivol", "%d" % self.jingles.ivol_adj.get_value()),
+                ("mixback", "%d" % self.mixbackadj.get_value()),
+                ("jplay", "%d" % self.jingles.playing),
+                ("lstr", "%d" % self.player_left.stream.get_active()),
+                ("laud", "%d" % self.player_left.listen.get_active()),
+                ("rstr", "%d" % self.player_right.stream.get_active()),
+                ("raud", "%d" % self.player_right.listen.get_active()),
+                ("strmon", "%d" % self.listen_stream.get_active()),
+                ("lpause", "%d" % self.player_left.pause.get_active()),
+                ("rpause", "%d" % self.player_right.pause.get_active()),
+                ("lflush", "%d" % self.player_left.flush),
+                ("rflush", "%d" % self.player_right.flush),
+                ("jflush", "%d" % self.jingles.flush),
+                ("iflush", "%d" % self.jingles.interludeflush),
+                ("simple", "%d" % self.simplemixer),
+                ("mode", "%d" % self.mixermode),
+                ("fadeout", "1"),
+                ("play", "%d" % (self.player_left.play.get_active() or
+                                    self.player_right.play.get_active())),
+                ("lspeed", "%f" % (1.0 / self.player_left.pbspeedfactor)),
+                ("rspeed", "%f" % (1.0 / self.player_right.pbspeedfactor)),
+                ("sv", "%d" % self.prefs_window.speed_variance.get_active()),
+                ("djaud", "%f" % self.prefs_window.dj_aud_adj.get_value()),
+                ("xpat", "%d" % self.crosspattern.get_active()),
+                ("dsp", "%d" % self.dsp_button.get_active()),
+                ("ipause", "%d" % self.jingles.interlude.pause.get_active()),
+                ("istr", "%d" % self.jingles.interlude.stream.get_active()),
+                ("iaud", "%d" % self.jingles.interlude.listen.get_active()),
+                ("iforce", "%d" % self.jingles.interlude.force.get_active()),
+                ("alarmaud", "%f" % self.prefs_window.alarm_aud_adj.get_value()),
+                ("voip", "%d" % self.voipgainadj.get_value()),
+                ("ispeed", "%f" % (1.0 / self.jingles.interlude.pbspeedfactor))
+                )
+
+
+    def send_mixer_delta(self):
+        """Send the mixer settings that have changed since last time."""
+
+        self.mixer_delta_source = None
+        if self.mixer_unsent:
+            self.mixer_write("MIXD=%s\nACTN=mixdelta\nend\n" % ",".join(
+                        "%s:%s" % x for x in self.mixer_unsent.iteritems()))
+            self.mixer_sent.update(self.mixer_unsent)
+            self.mixer_unsent.clear()
+        return False
 
-        self.alarm = False
-        iteration = 0
-        while self.player_left.flush or self.player_right.flush or \
+
+    def reset_mixer_delta(self):
+        """Forget what the backend was sent so all settings go next time."""
+
+        self.mixer_sent.clear()
+
+
+    @threadslock
+    def _cb_mixer_flush(self):
+        self.jingles.interludeflush = self.jingles.interludeflush & \
+                                    self.interlude_playing.value
+        self.jingles.flush = self.jingles.flush & self.jingles_playing.value
+        self.player_left.flush = self.player_left.flush & \
+                                    self.player_left.mixer_playing.value
+        self.player_right.flush = self.player_right.flush & \
+                                    self.player_right.mixer_playing.value
+        if self.player_left.flush or self.player_right.flush or \
                             self.jingles.flush or self.jingles.interludeflush:
-            time.sleep(0.05)
-            self.vu_update(False)
-            self.jingles.interludeflush = self.jingles.interludeflush & \
-                                        self.interlude_playing.value
-            self.jingles.flush = self.jingles.flush & self.jingles_playing.value
-            self.player_left.flush = self.player_left.flush & \
-                                        self.player_left.mixer_playing.value
-            self.player_right.flush = self.player_right.flush & \
-                                        self.player_right.mixer_playing.value
+            return True
+
+        self.mixer_flush_source = None
+        return False
+
+
+    def send_new_mixer_stats(self):
+        immediate = False
+        for key, value in self._mixer_state():
+            if self.mixer_sent.get(key) != value:
+                self.mixer_unsent[key] = value
+                if key not in self.mixer_continuous:
+                    immediate = True
+            else:
+                self.mixer_unsent.pop(key, None)
+
+        # The alarm is a one-shot the backend resets with each delta.
+        if self.alarm:
+            self.mixer_unsent["alarm"] = "1"
+            immediate = True
+            self.alarm = False
+
+        if immediate:
+            if self.mixer_delta_source is not None:
+                glib.source_remove(self.mixer_delta_source)
+            self.send_mixer_delta()
+            self.mixer_sent.pop("alarm", None)
+        elif self.mixer_unsent and self.mixer_delta_source is None:
+            # Fader drags are coalesced to one delta per redraw.
+            self.mixer_delta_source = glib.idle_add(
+                        threadslock(self.send_mixer_delta),
+                        priority=glib.PRIORITY_HIGH_IDLE + 10)
+
+        # Flushes are acknowledged by the players reporting they stopped.
+        if (self.player_left.flush or self.player_right.flush or
+                self.jingles.flush or self.jingles.interludeflush) and \
+                self.mixer_flush_source is None:
+            self.mixer_flush_source = glib.timeout_add(50,
+                                                    self._cb_mixer_flush)
 
         # decide which metadata source to use (0 = left, 1 = right)
         if self.metadata_src == self.METADATA_LEFT_DECK:
@@ -2032,23 +2198,11 @@ class MainWindow(dbus.service.Object):
                 tm = time.localtime()
                 ts = "%02d:%02d :: " % (tm[3], tm[4])  # hours and minutes
                 tstext = self.songname.encode("utf-8")
-                self.history_buffer.place_cursor(
-                                            self.history_buffer.get_end_iter())
-                self.history_buffer.insert_at_cursor(ts + tstext + "\n")
-                adjustment = self.history_window.get_vadjustment()
-                adjustment.set_value(adjustment.upper)
-                try:
-                    file = open(pm.basedir / "history.log", "a")
-                except IOError:
-                    print "unable to open history.log for writing"
-                else:
-                    try:
-                        file.write(time.strftime("%x %X :: ") + tstext + "\n")
-                    except IOError:
-                        print "unable to append to file \"history.log\""
-                    file.close()
+                self.track_history.add(ts + tstext + "\n")
+                self.history_writer.append(pm.basedir / "history.log",
+                                time.strftime("%x %X :: ") + tstext + "\n")
 
-                self._track_metadata_changed(self.artist, self.title,
+                self.metadata_bus.publish(self.artist, self.title,
                         self.album, self.songname, self.music_filename)
             else:
                 self.window.set_title(self.appname + pm.title_extra)
@@ -2056,14 +2210,6 @@ class MainWindow(dbus.service.Object):
             print "song title: %s\n" % self.songname
 
 
-    def _track_metadata_changed(self, *args):
-        if self._old_metadata_2 == args:
-            return
-
-        self._old_metadata_2 = args
-        self.track_metadata_changed(*args)
-        self.server_window.new_metadata(*args[:-1]) # Don't pass music_filename
-
     @dbus.service.signal(dbus_interface=PGlobs.dbus_bus_basename,
                                                             signature="sssss")
     def track_metadata_changed(self, artist, title, album, songname,
@@ -2229,7 +2375,7 @@ class MainWindow(dbus.service.Object):
                 self.crosspass = gobject.timeout_add(
                 int(self.passspeed_adj.get_value() * 10), self.cb_crosspass)
         if data == "Clear History":
-            self.history_buffer.set_text("")
+            self.track_history.clear()
 
     def expandercallback(self, expander, param_spec, user_data=None): 
         if expander.get_expanded():
@@ -2400,27 +2546,18 @@ class MainWindow(dbus.service.Object):
                     str(self.player_nb.get_current_page()) + "\n")
                 fh.close()
                 
-                # Save a list of files played and timestamps.
-                fh = open(session_filename + "_files_played", "w")
-                cutoff = time.time() - 2592000 # 2592000 = 30 days.
-                recent = {}
-                for key, value in self.files_played.iteritems():
-                    if value > cutoff:
-                        recent[key] = value
-                pickle.Pickler(fh).dump(recent)
-                fh.close()
+                # The play log is written as tracks play.
+                if where is None:
+                    self.files_played.compact()
+                else:
+                    self.files_played.save_copy(where / "played")
             
         except Exception as e:
             print "Error writing out main session data", e
 
-        try:
-            fh = open(session_filename + "_tracks", "w")
-            start, end = self.history_buffer.get_bounds()
-            text = self.history_buffer.get_text(start, end)
-            fh.write(text)
-            fh.close()
-        except Exception as e:
-            print "Error writing out tracks played data", e
+        # The track history is written as tracks play.
+        if where is not None:
+            self.track_history.save_copy(session_filename + "_tracks")
 
         self.prefs_window.save_player_prefs(where)
         self.controls.save_prefs(where)
@@ -2450,6 +2587,7 @@ class MainWindow(dbus.service.Object):
         self.player_left.save_session(where)
         self.player_right.save_session(where)
         self.jingles.save_session(where)
+        metadata_cache.flush()
         # JACK ports are saved at the moment of change, not here.
         
         return True  # This is also a timeout routine
@@ -2507,31 +2645,19 @@ class MainWindow(dbus.service.Object):
                 self.topleftpane.notebook.set_current_page(int(v))
             elif k=="playerpage":
                 self.player_nb.set_current_page(int(v))
+        # Files played used to be kept as a pickled dict.
+        legacy = pm.basedir / (self.session_filename + "_files_played")
         try:
-            fh = open(self.session_filename + "_files_played", "r")
-        except:
-            pass
-        else:
-            self.files_played = pickle.Unpickler(fh).load()
-            fh.close()
-
-        mst = pm.basedir / (self.session_filename + "_tracks")
-        try:
-            stat = os.stat(mst)
-        except OSError as e:
-            print e
-            return
-        if stat.st_ctime + 21600 > time.time():
+            with open(legacy, "r") as fh:
+                legacy_played = pickle.Unpickler(fh).load()
+        except Exception:
+            legacy_played = None
+        self.files_played.load(legacy_played)
+        if legacy_played is not None:
             try:
-                fh = open(mst, "r")
-            except Exception as e:
+                os.unlink(legacy)
+            except EnvironmentError as e:
                 print e
-                return
-            text = fh.read()
-            fh.close()
-            self.history_buffer.set_text(text)
-        else:
-            print "disregarding out of date track history text"
 
 
     def destroy_hard(self, widget=None, data=None):
@@ -2539,6 +2665,7 @@ class MainWindow(dbus.service.Object):
             self.freewheel_button.set_active(False)
             self.save_session("atexit")
             self.quitting()
+        self.history_writer.close()
         try:
             gtk.main_quit()
         except:
@@ -2558,14 +2685,27 @@ class MainWindow(dbus.service.Object):
         self.player_left.cleanup()
         self.player_right.cleanup()
         self.jingles.cleanup()
+        metadata_cache.close()
+        self.files_played.close()
+        self.meter_block.close()
+        self.ipc_stats.stop_dump()
+        self.close_backend_events()
         self.player_left.flush = True
         self.player_right.flush = True
         self.send_new_mixer_stats()
+        for source in (self.mixer_delta_source, self.mixer_flush_source):
+            if source is not None:
+                glib.source_remove(source)
         self.prefs_window.songdbprefs.disconnect()
         gobject.source_remove(self.statstimeout)
         gobject.source_remove(self.vutimeout)
+        gobject.source_remove(self.heartbeattimeout)
         gobject.source_remove(self.savetimeout)
-        self._mixer_ctrl.close()
+        self._mixer_pipe.close()
+        if self.ipc_capture is not None:
+            self.ipc_capture.close()
+        self.history_writer.close()
+        self.metadata_bus.close()
         self.quitting()
         self.window.hide()
         self.prefs_window.window.hide()
@@ -2592,12 +2732,58 @@ class MainWindow(dbus.service.Object):
 
         pass
 
+    @dbus.service.method(dbus_interface=PGlobs.dbus_bus_basename,
+                                        in_signature="ss", out_signature="b")
+    def played_report(self, day, pathname):
+        """Write the files played on day, YYYY-MM-DD, to pathname.
+
+        Each line is the time played and the pathname, tab separated.
+        """
+
+        try:
+            self.files_played.export_report(day, pathname)
+        except EnvironmentError as e:
+            print "played_report:", e
+            return False
+        return True
+
     @dbus.service.method(dbus_interface=PGlobs.dbus_bus_basename, out_signature="u")
     def pid(self):
         """Reply with the process ID."""
 
         return int(os.getpid())
 
+    @dbus.service.method(dbus_interface=PGlobs.dbus_bus_basename, out_signature="s")
+    def ipc_stats_json(self):
+        """Reply with backend pipe latency and throughput figures as JSON."""
+
+        return json.dumps(self.ipc_stats.snapshot())
+
+    @dbus.service.method(dbus_interface=PGlobs.dbus_bus_basename)
+    def ipc_stats_reset(self):
+        """Zero the backend pipe figures."""
+
+        self.ipc_stats.reset()
+
+    @dbus.service.method(dbus_interface=PGlobs.dbus_bus_basename,
+                                        in_signature="su", out_signature="b")
+    def metadata_lag(self, subscriber, lag):
+        """Set the delay in ms before track changes go to a subscriber.
+
+        The subscribers are dbus, encoders, and irc.
+        """
+
+        return self.metadata_bus.set_lag(subscriber, lag)
+
+    @dbus.service.method(dbus_interface=PGlobs.dbus_bus_basename, in_signature="b")
+    def ipc_stats_dump(self, enable):
+        """Start or stop logging the figures to ipcstats.log periodically."""
+
+        if enable:
+            self.ipc_stats.start_dump(pm.basedir / "ipcstats.log")
+        else:
+            self.ipc_stats.stop_dump()
+
     def delete_event(self, widget, event, data=None):
         qm = ["<span size='12000' weight='bold'>%s</span>" %
                             _("Confirmation to quit IDJC is required."), ""]
@@ -2624,8 +2810,7 @@ class MainWindow(dbus.service.Object):
         if target == True or target == False or target == None:
             raise RuntimeError("want traceback")
         try:
-            self._mixer_ctrl.write("%s\n%s" % (target, message))
-            self._mixer_ctrl.flush()
+            self._mixer_pipe.send_text(target, message)
         except (IOError, ValueError, AttributeError) as e:
             if message == "bootstrap":
                 print "launching backend"
@@ -2642,16 +2827,21 @@ class MainWindow(dbus.service.Object):
                     continue
                 
                 try:
-                    self._mixer_ctrl = os.fdopen(write.value, "w")
-                    self._mixer_rply = os.fdopen(read.value, "r")
+                    mixer_ctrl = os.fdopen(write.value, "w")
+                    mixer_rply = os.fdopen(read.value, "r")
                 except OSError:
                     "failed to open streams to backend"
                     continue
                     
                 print "awaiting reply"
                     
+                # The greeting is the last thing the backend sends unframed.
                 for j in range(10):
-                    reply = self.mixer_read()
+                    try:
+                        reply = mixer_rply.readline()
+                    except IOError as e:
+                        print str(e)
+                        continue
                     print "got", reply
                     if reply == "idjc backend ready\n":
                         break
@@ -2659,12 +2849,19 @@ class MainWindow(dbus.service.Object):
                     print "bad response from newly started backend"
                     continue
 
+                self._mixer_pipe = FramedPipe(mixer_ctrl, mixer_rply,
+                                            self.ipc_stats, self.ipc_capture)
+
                 if FGlobs.have_libmpg123:
                     self.mixer_write("ACTN=mp3_getstatus\nend\n")
                     self.mp3status = int(self.mixer_read())
+
+                self.meter_block.attach(self.mixer_write, self.mixer_read)
+                self.open_backend_events()
               
                 if message != "bootstrap":
                     # Restore previous settings.
+                    self.reset_mixer_delta()
                     self.send_new_mixer_stats()
                     self.prefs_window.fixup_mic_controls()
                     self.player_left.next.clicked()
@@ -2685,117 +2882,239 @@ class MainWindow(dbus.service.Object):
         if iters == 5:
             self.destroy_hard()
         try:
-            line = self._mixer_rply.readline()
+            line = self._mixer_pipe.readline()
         except IOError as e:
             print str(e)
             line = self.mixer_read(iters + 1)
-        if line == "Segmentation Fault\n":
-            line = ""
-            print "Mixer reports a segmentation fault"
-            self._mixer_rply.close()
-            self._mixer_ctrl.close()
         return line
 
 
-    def vu_update(self, locking = True):
-        if locking:
-            gtk.gdk.threads_enter()
+    def mixer_request(self, records, target="mx"):
+        """Send a command as (key, value) pairs, returning the reply text.
+
+        Values need no escaping and the reply is matched to the command by
+        request id so it is unaffected by replies not yet read.
+        """
+
         try:
-            self.vu_update_counter += 1
-            if self.vu_update_counter % 20 == 0:
-                self.heartbeat()
+            request_id = self._mixer_pipe.request(target, records)
+            return self._mixer_pipe.reply(request_id)
+        except (IOError, ValueError, AttributeError) as e:
+            print "mixer_request:", e
+            return ""
 
-            session_ns = {}
-            player_metadata = []
-            
+
+    def backend_metainfo(self, pathnames):
+        """Tag data and length of ogg and libsndfile media in one round trip.
+
+        Returns a list with a (length, replaygain, artist, title, album) tuple
+        per pathname or None where the backend could not read the file.
+        """
+
+        reply = self.mixer_request([("MINF", "")] + [("+MINF", x)
+                    for x in pathnames] + [("ACTN", "metainforequest")])
+        replies = []
+        for line in reply.splitlines(True):
+            if line == "MIR:end\n":
+                break
+            if line.startswith("MIR:V\t"):
+                fields = line[6:-1].split("\t")
+                try:
+                    replies.append((float(fields[0]), ) + tuple(fields[1:5]))
+                except (ValueError, TypeError):
+                    replies.append(None)
+            elif line == "MIR:X\n":
+                replies.append(None)
+            else:
+                print "backend_metainfo: unexpected reply", line,
+
+        return replies + [None] * (len(pathnames) - len(replies))
+
+
+    def open_backend_events(self):
+        """Have the backend signal its events on a fifo that is watched.
+
+        A line "e" means requestlevels has something to report and "m" that
+        the shared meter block changed. The vu_update timer is slowed to a
+        fallback rate for as long as the fifo works.
+        """
+
+        self.close_backend_events()
+        pathname = pm.basedir / "be2ui_ev"
+        try:
             try:
-                self.mixer_write("ACTN=requestlevels\nend\n")
-            except (ValueError, IOError):
-                if locking:
-                    gtk.gdk.threads_leave()
-                return True
-
-            session_cmd = midis = ''
-            cons_changed = False
-            while 1:
-                line = self.mixer_read().rstrip()
-                if line == "":
-                    if locking:
-                        gtk.gdk.threads_leave()
-                    return True
-                if line == "end":
-                    break
-                if not line.count("="):
-                    print line
-                    continue
-                key, value = line.split("=", 1)
+                os.unlink(pathname)
+            except OSError:
+                pass
+            os.mkfifo(pathname, 0600)
+            self._event_fd = os.open(pathname, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError as e:
+            print "backend event fifo unavailable:", e
+            return
 
-                if key == "midi":
-                    midis= value
-                    continue
-                    
-                if key.startswith("session_"):
-                    session_ns[key[8:]] = value
-                    continue
-                 
-                if key == "ports_connections_changed":
-                    cons_changed = value != "0"
-                    
-                if key.endswith("_silence"):
-                    try:
-                        value = float(value)
-                    except ValueError:
-                        pass
-                else:
+        self.mixer_write("EVTF=%s\nACTN=eventfifo\nend\n" % pathname)
+        if self.mixer_read() != "eventfifo=1\n":
+            print "backend did not open the event fifo, polling instead"
+            self.close_backend_events()
+            return
+
+        self._event_watch = glib.io_add_watch(self._event_fd,
+                    glib.IO_IN | glib.IO_HUP | glib.IO_ERR, self.cb_backend_event)
+        self.set_vu_interval(self.vu_fallback_interval)
+
+
+    def close_backend_events(self):
+        if self._event_watch is not None:
+            glib.source_remove(self._event_watch)
+            self._event_watch = None
+        if self._event_fd is not None:
+            os.close(self._event_fd)
+            self._event_fd = None
+        self.set_vu_interval(self.vu_poll_interval)
+
+
+    @threadslock
+    def cb_backend_event(self, fd, condition):
+        # Reading everything available coalesces a burst of wake-ups.
+        try:
+            data = os.read(fd, 4096)
+        except OSError as e:
+            data = "" if e.errno != errno.EAGAIN else None
+        if data == "" or (data is None and condition & (glib.IO_HUP |
+                                                                glib.IO_ERR)):
+            # The backend went away. Polling takes over until it is back.
+            if fd == self._event_fd:
+                self._event_watch = None
+                self.close_backend_events()
+            return False
+
+        if data:
+            if "e" in data:
+                start = time.time()
+                self.vu_update_pipe()
+                self.ipc_stats.vu_tick(start, time.time() - start)
+            elif "m" in data:
+                self.vu_update(False)
+        return fd == self._event_fd
+
+
+    def set_vu_interval(self, interval):
+        if interval != self.vu_interval:
+            self.vu_interval = interval
+            if self.vutimeout is not None:
+                gobject.source_remove(self.vutimeout)
+                self.vutimeout = gobject.timeout_add(interval, self.vu_update)
+
+
+    def vu_update(self, locking = True):
+        if locking:
+            gtk.gdk.threads_enter()
+        start = time.time()
+        try:
+            # Meters come from shared memory with the text pipe used when
+            # the backend has events to report.
+            levels = self.meter_block.read()
+            if levels is None:
+                self.vu_update_pipe()
+            else:
+                for key, value in levels.iteritems():
                     try:
-                        value = int(value)
-                    except ValueError:
+                        self.vumap[key].set_meter_value(value)
+                    except KeyError:
                         pass
 
-                if key.endswith("_new_metadata"):
-                    if not key.startswith("jingles"):
-                        player_metadata.append((getattr(self, "player_" +
-                                            key.split("_", 1)[0]), value))
-                    continue
+                if self.jingles.playing == True and \
+                                            int(self.jingles_playing) == 0:
+                    self.jingles.clear_indicators()
+        finally:
+            # Timer driven calls are the ones taking the lock.
+            self.ipc_stats.vu_tick(start, time.time() - start,
+                                            self.vu_interval if locking else None)
+            if locking:
+                gtk.gdk.threads_leave()
+        return True
+
 
+    def vu_update_pipe(self):
+        session_ns = {}
+        player_metadata = []
+        
+        try:
+            self.mixer_write("ACTN=requestlevels\nend\n")
+        except (ValueError, IOError):
+            return
+
+        session_cmd = midis = ''
+        cons_changed = False
+        while 1:
+            line = self.mixer_read().rstrip()
+            if line == "":
+                return
+            if line == "end":
+                break
+            if not line.count("="):
+                print line
+                continue
+            key, value = line.split("=", 1)
+
+            if key == "midi":
+                midis= value
+                continue
+                
+            if key.startswith("session_"):
+                session_ns[key[8:]] = value
+                continue
+             
+            if key == "ports_connections_changed":
+                cons_changed = value != "0"
+                
+            if key.endswith("_silence"):
+                try:
+                    value = float(value)
+                except ValueError:
+                    pass
+            else:
                 try:
-                    self.vumap[key].set_meter_value(value)
-                except KeyError:
+                    value = int(value)
+                except ValueError:
                     pass
-                    #print "key value", key, "missing from vumap"
 
-            if self.jingles.playing == True and int(self.jingles_playing) == 0:
-                self.jingles.clear_indicators()
-            
-            for player, data in player_metadata:
-                self.update_songname(player, data)
+            if key.endswith("_new_metadata"):
+                if not key.startswith("jingles"):
+                    player_metadata.append((getattr(self, "player_" +
+                                        key.split("_", 1)[0]), value))
+                continue
+
+            try:
+                self.vumap[key].set_meter_value(value)
+            except KeyError:
+                pass
+                #print "key value", key, "missing from vumap"
 
-            if midis:
-                for midi in midis.split(','):
-                    input, _, value = midi.partition(':')
-                    self.controls.input(input, int(value, 16))
+        if self.jingles.playing == True and int(self.jingles_playing) == 0:
+            self.jingles.clear_indicators()
+        
+        for player, data in player_metadata:
+            self.update_songname(player, data)
 
-            if session_ns["command"] == "save_L1" and pm.session_type == "L1":
-                self.jack.session_save()
-                self.save_session("L1")
-            if session_ns["command"].endswith("_JACK") and \
-                                                    pm.session_type == "JACK":
-                self.handle_jack_session(**session_ns)
+        if midis:
+            for midi in midis.split(','):
+                input, _, value = midi.partition(':')
+                self.controls.input(input, int(value, 16))
 
-            if cons_changed:
-                self.jack.standard_save()
+        if session_ns["command"] == "save_L1" and pm.session_type == "L1":
+            self.jack.session_save()
+            self.save_session("L1")
+        if session_ns["command"].endswith("_JACK") and \
+                                                pm.session_type == "JACK":
+            self.handle_jack_session(**session_ns)
 
-            ep = int(self.effects_playing)
-            if ep != -1:
-                self.jingles.update_effect_leds(ep)
+        if cons_changed:
+            self.jack.standard_save()
 
-        except Exception:
-            if locking:  # Ensure unlocking occurs when there is an exception.
-                gtk.gdk.threads_leave()
-            raise
-        if locking:
-            gtk.gdk.threads_leave()
-        return True
+        ep = int(self.effects_playing)
+        if ep != -1:
+            self.jingles.update_effect_leds(ep)
 
 
     def handle_jack_session(self, command, event, directory, uuid):
@@ -2986,13 +3305,26 @@ class MainWindow(dbus.service.Object):
         # For IPC.
         os.environ["ui2be"] = pm.basedir / "ui2be"
         os.environ["be2ui"] = pm.basedir / "be2ui"
+        os.environ["ipc_framing"] = "1"
 
         print "jack client ID:", client_id
 
         self.session_loaded = False
 
         try:
-            self.backend = ctypes.CDLL(FGlobs.backend)
+            if args.replay is not None:
+                self.backend = ReplayBackend(args.replay[0],
+                                                    args.replay_speed[0])
+            elif args.standin_backend is not None:
+                self.backend = StandinBackend(args.standin_backend)
+            else:
+                self.backend = ctypes.CDLL(FGlobs.backend)
+        except ValueError as e:
+            print "--standin-backend:", e
+            raise self.initfailed
+        except (IOError, EOFError) as e:
+            print "--replay:", e
+            raise self.initfailed
         except OSError:
             try:
                 subprocess.call(["notify-send", "-u", "critical", "-a", "IDJC", "IDJC Failed to open %s\n\nCannot continue" % FGlobs.backend])
@@ -3000,6 +3332,33 @@ class MainWindow(dbus.service.Object):
                 pass
             raise self.initfailed
 
+        # Created ahead of the backend which is handed it on launch.
+        self.meter_block = MeterBlock()
+        self.ipc_stats = IPCStats()
+        self.history_writer = AsyncWriter()
+        # Changes are held back from the streams and IRC in case the deck
+        # is swapped again. music_filename is for DBus only.
+        self.metadata_bus = MetadataBus()
+        self.metadata_bus.subscribe("dbus", self.track_metadata_changed)
+        self.metadata_bus.subscribe("encoders", lambda *args:
+                                self.server_window.new_metadata(*args[:-1]),
+                                self.metadata_encoder_lag)
+        self.metadata_bus.subscribe("irc", lambda *args:
+                                self.server_window.irc_new_metadata(*args[:-1]),
+                                self.metadata_irc_lag)
+        self.ipc_capture = None
+        if args.capture is not None:
+            try:
+                self.ipc_capture = Capture(args.capture[0])
+            except EnvironmentError as e:
+                print "--capture:", e
+            else:
+                self.meter_block.capture = self.ipc_capture
+        self.vutimeout = self._event_watch = self._event_fd = None
+        self.vu_interval = self.vu_poll_interval
+        self.mixer_sent = {}
+        self.mixer_unsent = {}
+        self.mixer_delta_source = self.mixer_flush_source = None
         self.mixer_write("bootstrap")
   
         # create the GUI elements
@@ -3260,6 +3619,10 @@ class MainWindow(dbus.service.Object):
         # The contents of the two player panes 3L and 3R are next up
         # The two identical players have been moved into one class
         
+        # Last played timestamps by pathname, watched by the players.
+        self.files_played = PlayLog(pm.basedir / "played")
+        self.files_played_offline = WatchedDict()
+
         self.player_left = IDJC_Media_Player(self.vbox3L, "left", self)
         self.vbox3L.show()
         
@@ -3315,7 +3678,8 @@ class MainWindow(dbus.service.Object):
         self.history_textview.set_cursor_visible(False)
         self.history_textview.set_editable(False)
         self.history_textview.set_wrap_mode(gtk.WRAP_CHAR)
-        self.history_buffer = self.history_textview.get_buffer()
+        self.track_history = TrackHistory(self.history_textview,
+                                    self.history_window, self.history_writer)
         
         self.abox = gtk.HBox()
         self.abox.viewlevels = (5,)
@@ -3698,7 +4062,6 @@ class MainWindow(dbus.service.Object):
         self.showing_left_file_requester = False
         self.showing_right_file_requester = False
         self.old_metadata = None
-        self._old_metadata_2 = None
         self.simplemixer = False
         self.crosspass = 0
         self.old_meta_context = None
@@ -3713,7 +4076,6 @@ class MainWindow(dbus.service.Object):
         self.METADATA_BACKGROUND = 5
         self.metadata_src = self.METADATA_CROSSFADER
 
-        self.vu_update_counter = 0
         self.alarm = False
         self.NO_PHONE = 0
         self.PUBLIC_PHONE = 1
@@ -3763,8 +4125,6 @@ class MainWindow(dbus.service.Object):
         self.in_vu_timeout = False
         self.vucounter = 0
         self.session_filename = "main_session"
-        self.files_played = {}
-        self.files_played_offline = {}
         
         # Variable map for stuff read from the mixer
         self.vumap = {
@@ -3837,7 +4197,9 @@ class MainWindow(dbus.service.Object):
         self.prefs_window.load_player_prefs()
         self.prefs_window.apply_player_prefs()
 
-        self.vutimeout = gobject.timeout_add(50, self.vu_update)
+        self.vutimeout = gobject.timeout_add(self.vu_interval, self.vu_update)
+        self.heartbeattimeout = gobject.timeout_add_seconds(1,
+                                            lambda: self.heartbeat() or True)
         self.statstimeout = gobject.timeout_add(100, self.stats_update)
 
         self.savetimeout = gobject.timeout_add_seconds(
@@ -3857,6 +4219,8 @@ class MainWindow(dbus.service.Object):
             self.player_right.restore_session()
             self.jingles.restore_session()
             self.restore_session()
+        self.track_history.load(pm.basedir / (self.session_filename +
+                "_tracks"), self.prefs_window.restore_session_option.get_active())
         self.session_loaded = True
          
         self.window.set_focus_chain((self.player_left.scrolllist,
@@ -3930,6 +4294,13 @@ class MainWindow(dbus.service.Object):
                 self.player_right.play.clicked()
             if "3" in args.players:
                 self.jingles.interlude.play.clicked()
+
+        if args.benchmark is not None:
+            if args.standin_backend is None:
+                print "--benchmark requires --standin-backend"
+            else:
+                self.benchmark = GUIBenchmark(self.mixer_request,
+                                                            args.benchmark[0])
                     
     def main(self):
         gtk.main()
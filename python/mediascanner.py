@@ -0,0 +1,177 @@
+"""Background probing of media files for playlist imports."""
+
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = ["MediaScanner"]
+
+
+import time
+import threading
+import multiprocessing
+import Queue
+
+import glib
+
+from .gtkstuff import threadslock
+
+
+class MediaScanner(object):
+    """Fan media file probes out to a pool of worker threads.
+
+    Sources are drawn from an iterable within the GTK main loop so playlist
+    parsing and cue sheet handling stay on the main thread. Runs of pathname
+    strings are handed to the probe function as a list on a worker thread,
+    so it can batch its backend requests, and it must return a list of rows
+    of the same length. Anything else is taken to be a finished playlist row.
+
+    Results go to the deliver callback in source order, in batches, from the
+    main loop. The progress callback receives the number of items delivered,
+    the number found so far, and whether the sources are exhausted.
+    """
+
+
+    interval = 100        # Milliseconds between deliveries.
+    timeslice = 0.02      # Time allowed for reading sources per interval.
+    batch_size = 250      # Upper limit of rows delivered per interval.
+    backlog = 2000        # Probe jobs allowed to be outstanding.
+    chunk_size = 32       # Pathnames handed to the probe function at once.
+
+
+    def __init__(self, sources, probe, deliver, finish=None, progress=None,
+                                                                workers=None):
+        self._sources = iter(sources)
+        self._probe = probe
+        self._deliver = deliver
+        self._finish = finish
+        self._progress = progress
+        self._jobs = Queue.Queue()
+        self._results = {}
+        self._lock = threading.Lock()
+        self._next_in = self._next_out = 0
+        self._chunk = []
+        self._exhausted = False
+        self.cancelled = False
+        self.finished = False
+
+        if workers is None:
+            try:
+                workers = multiprocessing.cpu_count()
+            except NotImplementedError:
+                workers = 2
+            workers = min(max(workers, 2), 8)
+
+        self._workers = []
+        for i in xrange(workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+        glib.timeout_add(self.interval, self._tick)
+
+
+    def cancel(self):
+        """Stop scanning. Rows not yet delivered are discarded."""
+
+        self.cancelled = True
+
+
+    def _work(self):
+        """Worker thread body."""
+
+        while 1:
+            seq, items = self._jobs.get()
+            if items is None:
+                return
+
+            results = [None] * len(items)
+            if not self.cancelled:
+                try:
+                    results = self._probe(items)
+                except Exception as e:
+                    print "MediaScanner: probe failed for", items[0], e
+
+            with self._lock:
+                for i, result in enumerate(results):
+                    self._results[seq + i] = result
+
+
+    def _queue_chunk(self):
+        if self._chunk:
+            self._jobs.put((self._next_in - len(self._chunk), self._chunk))
+            self._chunk = []
+
+
+    def _read_sources(self):
+        deadline = time.time() + self.timeslice
+        while not self._exhausted and \
+                        self._next_in - self._next_out < self.backlog and \
+                        time.time() < deadline:
+            try:
+                item = self._sources.next()
+            except StopIteration:
+                self._exhausted = True
+                break
+
+            if isinstance(item, basestring):
+                self._chunk.append(item)
+                self._next_in += 1
+                if len(self._chunk) >= self.chunk_size:
+                    self._queue_chunk()
+            else:
+                self._queue_chunk()
+                with self._lock:
+                    self._results[self._next_in] = item
+                self._next_in += 1
+        self._queue_chunk()
+
+
+    def _collect(self):
+        batch = []
+        with self._lock:
+            while self._next_out in self._results and \
+                                                len(batch) < self.batch_size:
+                batch.append(self._results.pop(self._next_out))
+                self._next_out += 1
+        return [x for x in batch if x]
+
+
+    def _shutdown(self):
+        for worker in self._workers:
+            self._jobs.put((None, None))
+        self.finished = True
+        if self._finish is not None:
+            self._finish()
+
+
+    @threadslock
+    def _tick(self):
+        if not self.cancelled:
+            self._read_sources()
+            rows = self._collect()
+            if rows:
+                self._deliver(rows)
+
+        if not self.cancelled and self._progress is not None:
+            self._progress(self._next_out, self._next_in, self._exhausted)
+
+        if self.cancelled or (self._exhausted and
+                                            self._next_out == self._next_in):
+            self._shutdown()
+            return False
+        return True
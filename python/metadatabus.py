@@ -0,0 +1,116 @@
+"""Delivery of track metadata changes to the parts that announce them."""
+
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = ["MetadataBus"]
+
+
+import glib
+
+from .gtkstuff import threadslock
+
+
+class _Subscriber(object):
+    def __init__(self, name, callback, lag):
+        self.name = name
+        self.callback = callback
+        self.lag = lag
+        self.pending = None
+        self.delivered = None
+        self.source = None
+
+
+    def schedule(self, metadata):
+        self.pending = metadata
+        self.cancel()
+        if self.lag:
+            self.source = glib.timeout_add(self.lag, self._deliver)
+        else:
+            self.source = glib.idle_add(self._deliver)
+
+
+    def cancel(self):
+        if self.source is not None:
+            glib.source_remove(self.source)
+            self.source = None
+
+
+    @threadslock
+    def _deliver(self):
+        self.source = None
+        metadata, self.pending = self.pending, None
+        if metadata is not None and metadata != self.delivered:
+            self.delivered = metadata
+            try:
+                self.callback(*metadata)
+            except Exception as e:
+                print "MetadataBus: %s subscriber failed: %s" % (self.name, e)
+        return False
+
+
+
+class MetadataBus(object):
+    """Track metadata published once and delivered to each subscriber.
+
+    publish() ignores a repeat of the last metadata. Each subscriber has a
+    lag in milliseconds for which a change must stand before it is
+    delivered, so a burst of changes such as from rapid deck swaps results
+    in one delivery of the last of them. Delivery is from the main loop
+    and never from within publish() since the subscribers use GTK and the
+    backend pipe. A subscriber is not given the same metadata twice in a
+    row.
+    """
+
+
+    def __init__(self):
+        self._subscribers = []
+        self._last = None
+
+
+    def subscribe(self, name, callback, lag=0):
+        """callback is called with the arguments given to publish()."""
+
+        self._subscribers.append(_Subscriber(name, callback, lag))
+
+
+    def set_lag(self, name, lag):
+        for subscriber in self._subscribers:
+            if subscriber.name == name:
+                subscriber.lag = max(0, int(lag))
+                return True
+        return False
+
+
+    def get_lags(self):
+        return dict((x.name, x.lag) for x in self._subscribers)
+
+
+    def publish(self, *metadata):
+        """Announce metadata. Returns whether it differed from the last."""
+
+        if metadata == self._last:
+            return False
+        self._last = metadata
+        for subscriber in self._subscribers:
+            subscriber.schedule(metadata)
+        return True
+
+
+    def close(self):
+        for subscriber in self._subscribers:
+            subscriber.cancel()
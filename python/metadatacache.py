@@ -0,0 +1,229 @@
+"""Persistent cache of media file tag and length data."""
+
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = ["MetadataCache"]
+
+
+import os
+import time
+import sqlite3
+import threading
+
+from .utils import Singleton
+from .prelims import ProfileManager
+
+
+PM = ProfileManager()
+
+
+class MetadataCache(object):
+    """Playlist row data for media files, keyed by pathname, size and mtime.
+
+    The database lives in the profile directory so it persists across
+    restarts. Least recently used entries are evicted once max_entries is
+    exceeded. Writes are batched and committed by flush().
+    """
+
+
+    __metaclass__ = Singleton
+
+
+    filename = "metadata_cache.db"
+    fields = ("rsmeta", "length", "meta", "title", "artist", "replaygain",
+                                                                    "album")
+    max_entries = 50000
+    commit_interval = 250
+
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn = None
+        self._failed = False
+        self._count = 0
+        self._pending = 0
+        self.hits = 0
+        self.misses = 0
+
+
+    def _connect(self):
+        """Open the database on first use. Returns False if unusable."""
+
+        if self._conn is not None:
+            return True
+        if self._failed:
+            return False
+
+        try:
+            conn = sqlite3.connect(PM.basedir / self.filename,
+                                                    check_same_thread=False)
+            conn.text_factory = str
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("""CREATE TABLE IF NOT EXISTS metadata (
+                            path TEXT PRIMARY KEY,
+                            size INTEGER, mtime REAL, last_used REAL,
+                            rsmeta TEXT, length REAL, meta TEXT, title TEXT,
+                            artist TEXT, replaygain TEXT, album TEXT)""")
+            conn.execute("""CREATE INDEX IF NOT EXISTS metadata_last_used
+                            ON metadata (last_used)""")
+            self._count = conn.execute(
+                                    "SELECT COUNT(*) FROM metadata").fetchone()[0]
+        except sqlite3.Error as e:
+            print "MetadataCache: unable to open database:", e
+            self._failed = True
+            return False
+
+        self._conn = conn
+        return True
+
+
+    def _changed(self):
+        self._pending += 1
+        if self._pending >= self.commit_interval:
+            self._commit()
+
+
+    def _commit(self):
+        try:
+            self._conn.commit()
+        except sqlite3.Error as e:
+            print "MetadataCache: commit failed:", e
+        self._pending = 0
+
+
+    def _evict(self):
+        """Drop the least recently used tenth of the entries."""
+
+        excess = self._count - self.max_entries + self.max_entries // 10
+        self._conn.execute("""DELETE FROM metadata WHERE path IN (
+                            SELECT path FROM metadata
+                            ORDER BY last_used LIMIT ?)""", (excess, ))
+        self._count -= excess
+        print "MetadataCache: evicted %d entries" % excess
+
+
+    @staticmethod
+    def _stat(pathname):
+        try:
+            st = os.stat(pathname)
+        except EnvironmentError:
+            return None
+        return st.st_size, st.st_mtime
+
+
+    def get(self, pathname):
+        """A dict of the cached fields or None if not present or stale."""
+
+        key = self._stat(pathname)
+        with self._lock:
+            if key is None or not self._connect():
+                self.misses += 1
+                return None
+
+            try:
+                row = self._conn.execute("SELECT size, mtime, %s FROM metadata"
+                        " WHERE path=?" % ", ".join(self.fields),
+                        (pathname, )).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+
+                if tuple(row[:2]) != key:
+                    self._conn.execute("DELETE FROM metadata WHERE path=?",
+                                                                (pathname, ))
+                    self._count -= 1
+                    self._changed()
+                    self.misses += 1
+                    return None
+
+                self._conn.execute("UPDATE metadata SET last_used=? "
+                                "WHERE path=?", (time.time(), pathname))
+                self._changed()
+            except sqlite3.Error as e:
+                print "MetadataCache: lookup failed:", e
+                self.misses += 1
+                return None
+
+            self.hits += 1
+
+        data = dict(zip(self.fields, row[2:]))
+        for key in ("title", "artist", "album"):
+            data[key] = data[key].decode("utf-8")
+        return data
+
+
+    def put(self, pathname, **fields):
+        """Store the fields of a freshly scanned media file."""
+
+        key = self._stat(pathname)
+        if key is None:
+            return
+
+        values = [fields[x] for x in self.fields]
+        with self._lock:
+            if not self._connect():
+                return
+
+            try:
+                cur = self._conn.execute("DELETE FROM metadata WHERE path=?",
+                                                                (pathname, ))
+                self._count -= cur.rowcount
+                self._conn.execute("INSERT INTO metadata VALUES (?, ?, ?, ?, "
+                                    "?, ?, ?, ?, ?, ?, ?)", [pathname] +
+                                    list(key) + [time.time()] + values)
+                self._count += 1
+                if self._count > self.max_entries:
+                    self._evict()
+                self._changed()
+            except sqlite3.Error as e:
+                print "MetadataCache: store failed:", e
+
+
+    def invalidate(self, pathname):
+        """Forget a file e.g. because its tag has just been rewritten."""
+
+        with self._lock:
+            if not self._connect():
+                return
+
+            try:
+                cur = self._conn.execute("DELETE FROM metadata WHERE path=?",
+                                                                (pathname, ))
+                self._count -= cur.rowcount
+                self._commit()
+            except sqlite3.Error as e:
+                print "MetadataCache: invalidate failed:", e
+
+
+    def flush(self):
+        """Commit outstanding writes to disk."""
+
+        with self._lock:
+            if self._conn is None or not self._pending:
+                return
+            self._commit()
+        print "MetadataCache: %d hits, %d misses, %d entries" % (
+                                        self.hits, self.misses, self._count)
+
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._commit()
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,124 @@
+"""Meter levels and player status shared with the backend via mmap."""
+
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = ["MeterBlock"]
+
+
+import os
+import mmap
+import struct
+import tempfile
+
+
+class MeterBlock(object):
+    """Reader of the struct meterblock defined in c/meterblock.h.
+
+    The backend writes the block from its JACK callback under a seqlock.
+    read() returns the values keyed as the requestlevels reply would have
+    them, or None when the block is not in use or a consistent copy could
+    not be had, in which case the text pipe is the fallback.
+
+    Consistent copies are recorded to capture when it is set to a Capture.
+    """
+
+
+    magic = 0x4B4C424D
+    version = 1
+    max_mics = 24
+    players = ("left", "right", "interlude", "jingles")
+    player_keys = ("elapsed", "playing", "signal", "cid", "audio_runout",
+                                                                    "silence")
+
+    header = struct.Struct("=IIIi")
+    body = struct.Struct("=4i" + "5if" * len(players) + "3i" +
+                                                        "4i" * max_mics)
+    size = header.size + body.size
+    retries = 3
+
+
+    def __init__(self):
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        fd, self.pathname = tempfile.mkstemp(prefix="idjc-meters-",
+                                                                dir=directory)
+        try:
+            os.ftruncate(fd, self.size)
+            self._map = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+        self.attached = False
+        self.capture = None
+
+
+    def attach(self, mixer_write, mixer_read):
+        """Hand the block to the backend. Must be redone on backend restart."""
+
+        mixer_write("MTRF=%s\nACTN=meterblock\nend\n" % self.pathname)
+        self.attached = mixer_read() == "meterblock=1\n"
+        if not self.attached:
+            print "MeterBlock: backend did not attach, using the text pipe"
+
+
+    def read(self):
+        if not self.attached:
+            return None
+
+        buf = self._map
+        for attempt in xrange(self.retries):
+            magic, version, seq, pending = self.header.unpack_from(buf)
+            if magic != self.magic or version != self.version:
+                return None
+            if seq & 1:
+                continue
+            data = buf[self.header.size:self.size]
+            if self.header.unpack_from(buf)[2] == seq:
+                break
+        else:
+            return None
+
+        if self.capture is not None:
+            self.capture.add("m", self.header.pack(magic, version, seq,
+                                                            pending) + data)
+        if pending:
+            return None
+
+        values = self.body.unpack(data)
+        levels = dict(zip(("str_l_peak", "str_r_peak", "str_l_rms",
+                                                "str_r_rms"), values[:4]))
+        i = 4
+        for player in self.players:
+            for key in self.player_keys:
+                levels["%s_%s" % (player, key)] = values[i]
+                i += 1
+        # Effects changes are signalled as pending events.
+        levels["freewheel_mode"] = values[i + 1]
+        n_mics = values[i + 2]
+        i += 3
+        for mic in xrange(min(n_mics, self.max_mics)):
+            levels["mic_%d_levels" % (mic + 1)] = "%d,%d,%d,%d" % values[
+                                                    i + mic * 4:i + mic * 4 + 4]
+        return levels
+
+
+    def close(self):
+        self.attached = False
+        self._map.close()
+        try:
+            os.unlink(self.pathname)
+        except EnvironmentError:
+            pass
@@ -38,6 +38,7 @@ from mutagen.asf import ASF, ASFUnicodeAttribute
 from idjc import FGlobs
 from .tooltips import set_tip
 from idjc.prelims import ProfileManager
+from .metadatacache import MetadataCache
 
 
 t = gettext.translation(FGlobs.package_name, FGlobs.localedir, fallback=True)
@@ -645,6 +646,7 @@ class MutagenGUI:
 
     
     def update_playlists(self, pathname, idjcroot):
+        MetadataCache().invalidate(pathname)
         newplaylistdata = idjcroot.player_left.get_media_metadata(pathname)
         idjcroot.player_left.update_playlist(newplaylistdata)
         idjcroot.player_right.update_playlist(newplaylistdata)
@@ -29,9 +29,13 @@ import xml.dom.minidom as mdom
 import warnings
 import gettext
 import uuid
+import heapq
+import json
+import ast
 from stat import *
 from collections import deque, namedtuple, defaultdict
 from functools import partial
+from bisect import bisect_left, bisect_right
 
 import glib
 import gobject
@@ -52,7 +56,9 @@ from .mutagentagger import *
 from .utils import SlotObject
 from .utils import LinkUUIDRegistry
 from .utils import PathStr
-from .gtkstuff import threadslock, FolderChooserButton
+from .metadatacache import MetadataCache
+from .mediascanner import MediaScanner
+from .gtkstuff import threadslock, worker_threadslock, FolderChooserButton
 from .prelims import *
 from .tooltips import set_tip
 
@@ -68,6 +74,8 @@ PM = ProfileManager()
 
 link_uuid_reg = LinkUUIDRegistry()
 
+metadata_cache = MetadataCache()
+
 
 # Suppress the warning that occurs when None is placed in a ListStore element
 # where some kind of GObject is expected.
@@ -90,6 +98,9 @@ RGDEF = "0 DEFAULT"
 # Playlist value indicating a file isn't valid.
 NOTVALID = PlayerRow("<s>valid</s>", "", 0, "", "latin1", "", "", RGDEF, None, "", "")
 
+# File types for which the backend supplies the tag data and length.
+BACKEND_MEDIA = (".ogg", ".oga", ".spx", ".wav", ".aiff", ".au")
+
 # Delay in milliseconds between progress bar updates.
 PROGRESS_TIMEOUT = 200
 
@@ -122,46 +133,108 @@ class CueSheetListStore(gtk.ListStore):
     def __init__(self):
         gtk.ListStore.__init__(self, *self._columns)
         self.playing_index = None
+        self._stale = True
+        self._refreshing = False
+        for signal in ("row-changed", "row-inserted", "row-deleted",
+                                                            "rows-reordered"):
+            self.connect(signal, self._cb_modified)
+
+    def _cb_modified(self, *args):
+        if not self._refreshing:
+            self._stale = True
+
+    def _build_index(self):
+        """Lookup tables for the offset based queries.
+
+        _reach[i] is the furthest end point of any playable track up to i
+        so the first playable track ending past an offset can be bisected
+        for. When the tracks are in offset order, as with single file cue
+        sheets, _remaining[i] holds the playable duration from track i on.
+        """
+
+        self._tracks = tracks = [CueSheetTrack(*gtk.ListStore.__getitem__(
+                                        self, i)) for i in xrange(len(self))]
+        self._positions = {}
+        self._reach = reach = []
+        furthest = None
+        ordered = True
+        prev_end = None
+        for i, each in enumerate(tracks):
+            self._positions.setdefault(each, i)
+            end = each.offset + each.duration
+            if each.play and (furthest is None or end > furthest):
+                furthest = end
+            reach.append(furthest)
+            if each.duration < 0 or (prev_end is not None and
+                                                    each.offset < prev_end):
+                ordered = False
+            prev_end = end
+
+        self._first_play = reach.count(None)
+        self._ends = [x.offset + x.duration for x in tracks]
+        if ordered:
+            self._remaining = remaining = [0] * (len(tracks) + 1)
+            for i in xrange(len(tracks) - 1, -1, -1):
+                remaining[i] = remaining[i + 1] + (tracks[i].play and
+                                                        tracks[i].duration)
+        else:
+            self._remaining = None
+
+        self._stale = False
 
     def element(self, offset):
         """The element given an offset in seconds."""
 
+        if self._stale:
+            self._build_index()
+
         ret = None
         offset *= 75
         playing_index = self.playing_index
-        for i, each in enumerate(self):
-            if each.play:
-                if ret is None and offset < each.offset + each.duration:
-                    ret = each
-                    if self.playing_index != i:
-                        self.playing_index = i
+        # Skip the leading entries that have no playable track in reach.
+        i = bisect_right(self._reach, offset, lo=self._first_play)
+        if i < len(self._tracks):
+            ret = self._tracks[i]
+            self.playing_index = i
 
         if playing_index != self.playing_index:
-            self.invalidate()
+            self.invalidate((playing_index, self.playing_index))
 
         return ret
 
     def next_element(self, element):
-        iterator = iter(self)
+        if self._stale:
+            self._build_index()
+
         try:
-            item = iterator.next()
-            while item != element:
-                item = iterator.next()
-            next_item = iterator.next()
-            return next_item
-        except StopIteration:
+            return self._tracks[self._positions[element] + 1]
+        except (KeyError, IndexError):
             return None
            
     def non_playing(self):
+        playing_index = self.playing_index
         self.playing_index = None
-        self.invalidate()
+        self.invalidate((playing_index, ))
 
     def time_remaining(self, offset):
         """Play time remaining given a whole file time offset in seconds."""
 
-        sectors = 0.0
+        if self._stale:
+            self._build_index()
+
         offset *= 75
-        for each in self:
+        if self._remaining is not None:
+            i = bisect_right(self._ends, offset)
+            if i == len(self._tracks):
+                return 0.0
+            sectors = float(self._remaining[i])
+            each = self._tracks[i]
+            if each.play and offset > each.offset:
+                sectors -= offset - each.offset
+            return sectors / 75.0
+
+        sectors = 0.0
+        for each in self._tracks:
             if offset >= each.offset + each.duration:
                 continue
 
@@ -173,12 +246,18 @@ class CueSheetListStore(gtk.ListStore):
 
         return sectors / 75.0
 
-    def invalidate(self):
-        for i in xrange(len(self)):
-            # There should be an invalidate row signal (oh well).
-            row = gtk.ListStore.__getitem__(self, i)
-            title = row[5]
-            row[5] = title
+    def invalidate(self, rows=None):
+        """Have the view redraw rows, by default all of them."""
+
+        if rows is None:
+            rows = xrange(len(self))
+        self._refreshing = True
+        try:
+            for i in rows:
+                if i is not None and i < len(self):
+                    self.row_changed((i, ), self.get_iter((i, )))
+        finally:
+            self._refreshing = False
 
     def __nonzero__(self):
         return len(self) != 0
@@ -230,6 +309,9 @@ class CellRendererDuration(gtk.CellRendererText):
 
 class CuesheetPlaylist(gtk.Frame):
     __gsignals__ = { "playitem" : (
+                        gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE,
+                            (gobject.TYPE_PYOBJECT, gobject.TYPE_PYOBJECT, )),
+                     "playtoggled" : (
                         gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE,
                             (gobject.TYPE_PYOBJECT, gobject.TYPE_PYOBJECT, ))}
 
@@ -339,6 +421,7 @@ class CuesheetPlaylist(gtk.Frame):
         col = CueSheetTrack._fields.index("play")
         val = model.get_value(iter, col)
         model.set_value(iter, col, not val)
+        self.emit("playtoggled", model, path)
 
 
 class ButtonFrame(gtk.Frame):
@@ -356,6 +439,24 @@ class ButtonFrame(gtk.Frame):
         self.set_shadow_type(gtk.SHADOW_NONE)
         self.set_label_align(0.5, 0.5)
 
+class ScanProgress(gtk.HBox):
+    """Progress indication for playlist additions with a cancel button."""
+
+    def __init__(self):
+        gtk.HBox.__init__(self)
+        self.set_border_width(4)
+        self.set_spacing(4)
+        self.bar = gtk.ProgressBar()
+        self.pack_start(self.bar, True, True, 0)
+        self.bar.show()
+        image = gtk.image_new_from_stock(gtk.STOCK_STOP, gtk.ICON_SIZE_MENU)
+        self.cancel = gtk.Button()
+        self.cancel.add(image)
+        image.show()
+        self.pack_start(self.cancel, False, False, 0)
+        self.cancel.show()
+        set_tip(self.cancel, _('Stop adding tracks to the playlist.'))
+
 class ExternalPL(gtk.Frame):
     def get_next(self):
         next = self._get_next()
@@ -898,6 +999,226 @@ class CueSheet(object):
         return self.segment
 
 
+class BlockTimeIndex(object):
+    """Running totals of playlist row durations for block time queries.
+
+    Row durations are held in a Fenwick tree and the positions of the
+    block ending playlist controls and >normalspeed in sorted lists so the
+    block size from any row takes O(log n). Changed rows are updated in
+    place. Inserts, deletes and reorders mark the index for a rebuild which
+    happens at most once per query.
+    """
+
+    barriers = (">stopplayer", ">stopplayer2", ">transfer", ">crossfade",
+                                                ">announcement", ">jumptotop")
+
+    def __init__(self, model):
+        self.model = model
+        self._dirty = True
+        for signal in ("row-inserted", "row-deleted", "rows-reordered"):
+            model.connect(signal, self._cb_structure_changed)
+        model.connect("row-changed", self._cb_row_changed)
+
+    def invalidate(self):
+        self._dirty = True
+
+    def _cb_structure_changed(self, model, path, *args):
+        self._dirty = True
+
+    def _row_data(self, row):
+        """The control kind and duration of a playlist row."""
+
+        length = row[2]
+        if length == -11:
+            text = row[0]
+            if text.startswith("<b>"):
+                text = text[3:-4]
+            if text in self.barriers:
+                return "barrier", 0.0
+            if text == ">normalspeed":
+                return "normalspeed", 0.0
+            return None, 0.0
+        if length < 0:
+            return None, 0.0
+        cuesheet = row[8]
+        if cuesheet is not None:
+            return None, float(cuesheet.time_remaining(0.0))
+        return None, float(length)
+
+    def _cb_row_changed(self, model, path, iter):
+        if self._dirty:
+            return
+        i = path[0]
+        kind, weight = self._row_data(model[i])
+        if kind != self._kinds[i]:
+            self._dirty = True
+            return
+        delta = weight - self._weights[i]
+        if delta:
+            self._weights[i] = weight
+            tree = self._tree
+            j = i + 1
+            while j < len(tree):
+                tree[j] += delta
+                j += j & -j
+
+    def _rebuild(self):
+        self._kinds = kinds = []
+        self._weights = weights = []
+        self._barriers = []
+        self._normalspeeds = []
+        for i, row in enumerate(self.model):
+            kind, weight = self._row_data(row)
+            kinds.append(kind)
+            weights.append(weight)
+            if kind == "barrier":
+                self._barriers.append(i)
+            elif kind == "normalspeed":
+                self._normalspeeds.append(i)
+
+        self._tree = tree = [0.0] + weights
+        for j in xrange(1, len(tree)):
+            k = j + (j & -j)
+            if k < len(tree):
+                tree[k] += tree[j]
+        self._dirty = False
+
+    def _prefix(self, i):
+        """Sum of the durations of the first i rows."""
+
+        total = 0.0
+        tree = self._tree
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def block_size(self, index, speedfactor):
+        """Play time in seconds from row index up to the next block end."""
+
+        if self._dirty:
+            self._rebuild()
+
+        end = len(self._weights)
+        i = bisect_left(self._barriers, index)
+        if i < len(self._barriers):
+            end = self._barriers[i]
+        i = bisect_left(self._normalspeeds, index)
+        normal = end
+        if i < len(self._normalspeeds):
+            normal = min(self._normalspeeds[i], end)
+
+        start = self._prefix(index)
+        mid = self._prefix(normal)
+        return int((mid - start) / speedfactor) + \
+                                        int(self._prefix(end) - mid)
+
+
+class LeastRecentIndex(object):
+    """Playlist pathnames ordered by when they were last played.
+
+    One heap per timestamp source, each entry being (timestamp, tie breaker,
+    pathname). Stale entries, for pathnames no longer in the playlist or
+    played since, are skipped when met and the heaps are rebuilt once they
+    hold too many of them. A list of pathnames shadows the playlist so
+    deletions can be accounted for.
+    """
+
+    def __init__(self, model, *sources):
+        self.model = model
+        self._sources = sources
+        self._heaps = tuple([] for each in sources)
+        for which, source in enumerate(sources):
+            source.watchers.append(partial(self._cb_played, which))
+        model.connect("row-inserted", self._cb_row_inserted)
+        model.connect("row-deleted", self._cb_row_deleted)
+        model.connect("row-changed", self._cb_row_changed)
+        model.connect("rows-reordered", self._cb_rows_reordered)
+        self._rebuild()
+
+    def _rebuild(self):
+        self._pathnames = [row[1] or "" for row in self.model]
+        self._counts = defaultdict(int)
+        for pathname in self._pathnames:
+            if pathname:
+                self._counts[pathname] += 1
+        self._rebuild_heaps()
+
+    def _rebuild_heaps(self):
+        for source, heap in zip(self._sources, self._heaps):
+            heap[:] = [(source.get(x, 0), random.random(), x)
+                                                        for x in self._counts]
+            heapq.heapify(heap)
+
+    def _add(self, pathname):
+        if pathname:
+            self._counts[pathname] += 1
+            if self._counts[pathname] == 1:
+                for source, heap in zip(self._sources, self._heaps):
+                    self._push(heap, source.get(pathname, 0), pathname)
+
+    def _remove(self, pathname):
+        if pathname:
+            self._counts[pathname] -= 1
+            if not self._counts[pathname]:
+                del self._counts[pathname]
+
+    def _push(self, heap, timestamp, pathname):
+        heapq.heappush(heap, (timestamp, random.random(), pathname))
+        if len(heap) > 2 * len(self._counts) + 100:
+            self._rebuild_heaps()
+
+    def _cb_played(self, which, pathname, timestamp):
+        if pathname in self._counts:
+            self._push(self._heaps[which], timestamp or 0, pathname)
+
+    def _cb_row_inserted(self, model, path, iter):
+        pathname = model.get_value(iter, 1) or ""
+        self._pathnames.insert(path[0], pathname)
+        self._add(pathname)
+
+    def _cb_row_deleted(self, model, path):
+        self._remove(self._pathnames.pop(path[0]))
+
+    def _cb_row_changed(self, model, path, iter):
+        pathname = model.get_value(iter, 1) or ""
+        i = path[0]
+        if self._pathnames[i] != pathname:
+            self._remove(self._pathnames[i])
+            self._pathnames[i] = pathname
+            self._add(pathname)
+
+    def _cb_rows_reordered(self, model, *args):
+        # PyGTK does not give us a usable new_order.
+        self._rebuild()
+
+    def least_recent(self, count, which=0):
+        """Up to count distinct pathnames, the least recently played first.
+
+        which selects the timestamp source.
+        """
+
+        source = self._sources[which]
+        heap = self._heaps[which]
+        found = []
+        seen = set()
+        while heap and len(found) < count:
+            entry = heapq.heappop(heap)
+            timestamp, tie, pathname = entry
+            if pathname in self._counts and pathname not in seen and \
+                                        source.get(pathname, 0) == timestamp:
+                seen.add(pathname)
+                found.append(entry)
+        for entry in found:
+            heapq.heappush(heap, entry)
+        return [x[2] for x in found]
+
+    def index(self, pathname):
+        """The playlist row of a pathname."""
+
+        return self._pathnames.index(pathname)
+
+
 class IDJC_Media_Player:
     playlisttype_extension = tuple(zip(
         # File format selection items from a list (user can pick only one).
@@ -995,6 +1316,54 @@ class IDJC_Media_Player:
         return element
 
     def get_media_metadata(self, filename, get_length=False):
+        return self.get_media_metadata_many((filename, ), get_length)[0]
+
+    def get_media_metadata_many(self, filenames, get_length=False):
+        """Playlist rows (or lengths) for a sequence of media files.
+
+        Files the backend must examine are dealt with in one round trip.
+        """
+
+        results = [None] * len(filenames)
+        todo = []
+        for i, filename in enumerate(filenames):
+            # Strip away any file:// prefix
+            if filename.count("file://", 0, 7):
+                filename = filename[7:]
+            elif filename.count("file:", 0, 5):
+                filename = filename[5:]
+
+            cached = metadata_cache.get(filename)
+            if cached is None:
+                todo.append((i, filename))
+            elif get_length:
+                results[i] = cached["length"]
+            else:
+                results[i] = PlayerRow(filename=filename, encoding=None,
+                        cuesheet=None, uuid=str(uuid.uuid4()), **cached)
+
+        backend = [(i, filename) for i, filename in todo
+                        if supported.check_media(filename) in BACKEND_MEDIA
+                        and "\n" not in filename and os.path.isfile(filename)]
+        if backend:
+            with worker_threadslock():
+                replies = self.parent.backend_metainfo(
+                                                [x[1] for x in backend])
+            backend_info = dict(zip((x[0] for x in backend), replies))
+        else:
+            backend_info = {}
+
+        for i, filename in todo:
+            row = self._get_media_metadata(filename, get_length,
+                                                        backend_info.get(i))
+            if not get_length and row:
+                metadata_cache.put(filename, **dict((x, getattr(row, x))
+                                            for x in metadata_cache.fields))
+            results[i] = row
+
+        return results
+
+    def _get_media_metadata(self, filename, get_length, backend_info):
         artist = u""
         title = u""
         album = u""
@@ -1004,12 +1373,6 @@ class IDJC_Media_Player:
         album_retval = u""
         cuesheet = None
 
-        # Strip away any file:// prefix
-        if filename.count("file://", 0, 7):
-            filename = filename[7:]
-        elif filename.count("file:", 0, 5):
-            filename = filename[5:]
-
         filext = supported.check_media(filename)
         if filext == False or os.path.isfile(filename) == False:
             return NOTVALID._replace(filename=filename)
@@ -1065,50 +1428,20 @@ class IDJC_Media_Player:
 
 
         # Trying for metadata from native tagging formats.
-        if (filext == ".wav" or filext == ".aiff" or filext == ".au"):
-            self.parent.mixer_write("SNDP=%s\nACTN=sndfileinforequest\nend\n" %
-                                                                    filename)
-            while 1:
-                line = self.parent.mixer_read()
-                if line == "idjcmixer: sndfileinfo Not Valid\n" or line == "":
-                    return NOTVALID._replace(filename=filename)
-                if line.startswith("idjcmixer: sndfileinfo length="):
-                    length = float(line[30:-1])
-                if line.startswith("idjcmixer: sndfileinfo artist="):
-                    artist = line[30:-1]
-                if line.startswith("idjcmixer: sndfileinfo title="):
-                    title = line[29:-1]
-                if line.startswith("idjcmixer: sndfileinfo album="):
-                    album = line[29:-1]
-                if line == "idjcmixer: sndfileinfo end\n":
-                    break
-            if length == None:
+        # The backend has already been asked about these.
+        if filext in BACKEND_MEDIA:
+            if backend_info is None:
                 return NOTVALID._replace(filename=filename)
 
-        # This handles chained ogg files as generated by IDJC.
-        elif filext == ".ogg" or filext == ".oga" or filext == ".spx":
-            self.parent.mixer_write("OGGP=%s\nACTN=ogginforequest\nend\n" %
-                                                                    filename)
-            while 1:
-                line = self.parent.mixer_read()
-                if line == "OIR:NOT VALID\n" or line == "":
-                    return NOTVALID._replace(filename=filename)
-                if line.startswith("OIR:ARTIST="):
-                    artist = line[11:].strip()
-                if line.startswith("OIR:TITLE="):
-                    title = line[10:].strip()
-                if line.startswith("OIR:ALBUM="):
-                    album = line[10:].strip()
-                if line.startswith("OIR:LENGTH="):
-                    length = float(line[11:].strip())
-                if line.startswith("OIR:REPLAYGAIN_TRACK_GAIN="):
-                    val = line[26:].rstrip(" dB\n")
-                    if not val:
-                        rg = RGDEF
-                    else:
-                        rg = val + " RG"
-                if line == "OIR:end\n":
-                    break
+            length, backend_rg, b_artist, b_title, b_album = backend_info
+            if filext in (".ogg", ".oga", ".spx"):
+                artist, title, album = b_artist, b_title, b_album
+                rg = backend_rg.rstrip(" dB")
+                rg = rg + " RG" if rg else RGDEF
+            elif b_artist and b_title:
+                artist, title = b_artist, b_title
+                if b_album:
+                    album = b_album
         elif filext == ".aac":
             try:
                 id3 = ID3(filename)
@@ -1277,6 +1610,7 @@ class IDJC_Media_Player:
             where = PM.basedir
        
         fh = open(where / self.session_filename, "w")
+        fh.write("session_format=%d\n" % self.session_format)
         extlist = self.external_pl.filechooser.get_filename()
         if extlist is not None:
             fh.write("extlist=" + extlist + "\n")
@@ -1302,33 +1636,15 @@ class IDJC_Media_Player:
                 # Replace orig file abspath with alternate path to a hard link
                 # except when link is None as happens when a hard link fails.
                 entry[1] = PathStr("links") / link
-            
-            fh.write("pe=")
-            if entry[0].startswith("<b>"):  # Clean off bold tags.
-                entry[0] = entry[0][3:-4]
-            for item in entry:
-                if isinstance(item, int):
-                    item = str(item)
-                    fh.write("i")
-                elif isinstance(item, float):
-                    item = str(item)
-                    fh.write("f")
-                elif isinstance(item, str):
-                    fh.write("s")
-                elif isinstance(item, CueSheetListStore):
-                    fh.write("c")
-                    if item:
-                        item = "(%s, )" % ", ".join(repr(x) for x in item)
-                    else:
-                        item = "()"
-                elif item is None:
-                    fh.write("n")
-                    item = "None"
-                fh.write(str(len(item)) + ":" + item)
-            fh.write("\n")
+            fh.write("pl=" + self.pl_pack(entry) + "\n")
+        # Rows of the last session still waiting to be put in the playlist.
+        for text in self.session_pending:
+            fh.write("pl=" + text)
         model, iter = self.treeview.get_selection().get_selected()
         if iter is not None:
             fh.write("select=" + str(model.get_path(iter)[0]) + "\n")
+        elif self.session_select is not None:
+            fh.write("select=" + str(self.session_select) + "\n")
         fh.close()
 
     def restore_session(self):
@@ -1336,6 +1652,8 @@ class IDJC_Media_Player:
             fh = open(PM.basedir / self.session_filename, "r")
         except:
             return
+        rows = []
+        select = None
         while 1:
             try:
                 line = fh.readline()
@@ -1344,6 +1662,14 @@ class IDJC_Media_Player:
             except:
                 break
             try:
+                if line.startswith("pl="):
+                    # Decoding is left to the playlist fill.
+                    rows.append(line[3:])
+                    continue
+                if line.startswith("session_format="):
+                    if int(line[15:]) > self.session_format:
+                        print self.playername + " player: session file is" \
+                                                    " from a newer version"
                 if line.startswith("extlist="):
                     self.external_pl.filechooser.set_filename(line[8:-1])
                 if line.startswith("extdir="):
@@ -1369,52 +1695,137 @@ class IDJC_Media_Player:
                 if line.startswith("fade_mode="):
                     self.pl_delay.set_active(int(line[10]))
                 if line.startswith("pe="):
-                    playlist_entry = self.pl_unpack(line[3:])
-                    # Links directory entries conversion to absolute path.
-                    if playlist_entry[1] and playlist_entry[1][0] != \
-                                                                os.path.sep:
-                        playlist_entry = playlist_entry._replace(
-                                    filename=PM.basedir / playlist_entry[1])
-                        
-                    if not playlist_entry or self.playlist_todo:
-                        self.playlist_todo.append(playlist_entry.filename)
-                    else:
-                        try:
-                            self.liststore.append(playlist_entry)
-                        except TypeError:
-                            self.playlist_todo.append(playlist_entry.filename)
+                    # Old session format, converted on the next save.
+                    rows.append(self.pl_pack(self.pl_unpack(line[3:])) + "\n")
                 if line.startswith("select="):
-                    path = line[7:-1]
-                    try:
-                        self.treeview.get_selection().select_path(path)
-                        self.treeview.scroll_to_cell(path, None, False)
-                    except:
-                        pass
+                    select = int(line[7:-1])
             except ValueError:
                 pass
+        fh.close()
+
+        # The first screenfuls go in at once with the model detached from
+        # the view. The remainder follows from the main loop.
+        self.session_pending = deque(rows)
+        self.session_select = select
+        self.treeview.set_model(None)
+        self.restore_session_rows(self.session_chunk)
+        self.treeview.set_model(self.liststore)
+        if self.session_pending:
+            glib.idle_add(self.cb_restore_session_rows)
+        else:
+            self.restore_session_finish()
+
+    @threadslock
+    def cb_restore_session_rows(self):
+        self.restore_session_rows(self.session_chunk)
+        if self.session_pending:
+            return True
+        self.restore_session_finish()
+        return False
+
+    def restore_session_rows(self, count):
+        """Move rows from the session file into the playlist."""
+
+        pending = self.session_pending
+        append = self.liststore.append
+        while pending and count:
+            count -= 1
+            playlist_entry = self.pl_decode(pending.popleft())
+            # Links directory entries conversion to absolute path.
+            if playlist_entry[1] and playlist_entry[1][0] != os.path.sep:
+                playlist_entry = playlist_entry._replace(
+                                    filename=PM.basedir / playlist_entry[1])
+
+            if not playlist_entry or self.playlist_todo:
+                self.playlist_todo.append(playlist_entry.filename)
+            else:
+                try:
+                    append(playlist_entry)
+                except TypeError:
+                    self.playlist_todo.append(playlist_entry.filename)
+
+        select = self.session_select
+        if select is not None and select < len(self.liststore):
+            self.session_select = None
+            try:
+                self.treeview.get_selection().select_path(select)
+                self.treeview.scroll_to_cell(select, None, False)
+            except:
+                pass
+
+    def restore_session_finish(self):
+        self.session_select = None
         if self.playlist_todo:
             print self.playername + (" player: the stored playlist data is not "
                                     "compatible with this version\nfiles placed"
                                     " in a queue for rescanning")
-            gobject.idle_add(self.cb_playlist_todo)
+            self.scan_elements_from(self.playlist_todo)
+            self.playlist_todo = deque()
+
+    @staticmethod
+    def pl_pack(entry):
+        """Marshall a playlist row to a line of JSON.
+
+        Strings are mapped to JSON through latin1 so any byte sequence
+        survives the round trip. A cue sheet is a list of its tracks.
+        """
+
+        entry = list(entry)
+        if entry[0].startswith("<b>"):  # Clean off bold tags.
+            entry[0] = entry[0][3:-4]
+        if entry[8] is not None:
+            entry[8] = [list(x) for x in entry[8]]
+        return json.dumps(entry, encoding="latin1", separators=(",", ":"))
+
+    def pl_decode(self, text):
+        """Unmarshall a line made by pl_pack to a PlayerRow."""
+
+        def bytestr(value):
+            if isinstance(value, unicode):
+                return value.encode("latin1")
+            if isinstance(value, list):
+                return [bytestr(x) for x in value]
+            return value
 
-    @threadslock
-    def cb_playlist_todo(self):
-        if self.no_more_files:
-            return False
         try:
-            pathname = self.playlist_todo.popleft()
-        except:
-            return False
-        line = self.get_media_metadata(pathname)
-        if line:
-            self.liststore.append(line)
-        else:
-            print "file missing or type unsupported %s" % pathname
-        return True
+            entry = bytestr(json.loads(text))
+        except (ValueError, UnicodeError), e:
+            print "pl_decode: playlist line not valid", e
+            return NOTVALID
+
+        try:
+            if entry[8] is not None:
+                cuesheet = CueSheetListStore()
+                for track in entry[8]:
+                    cuesheet.append(CueSheetTrack._make(track))
+                entry[8] = cuesheet
+            return PlayerRow._make(entry)
+        except (TypeError, IndexError), e:
+            print "pl_decode: playlist line not valid", e
+            try:
+                return NOTVALID._replace(filename=str(entry[1]))
+            except (TypeError, IndexError):
+                return NOTVALID
+
+    @staticmethod
+    def _cuesheet_tracks(text):
+        """Parse the repr of cue sheet tracks from an old session file."""
+
+        tree = ast.parse(text, mode="eval").body
+        if not isinstance(tree, ast.Tuple):
+            raise ValueError("cue sheet data is not a tuple")
+        tracks = []
+        for node in tree.elts:
+            if not (isinstance(node, ast.Call) and isinstance(node.func,
+                        ast.Name) and node.func.id == "CueSheetTrack") or \
+                        node.args or node.starargs or node.kwargs:
+                raise ValueError("cue sheet data is malformed")
+            tracks.append(CueSheetTrack(**dict((kw.arg, ast.literal_eval(
+                                        kw.value)) for kw in node.keywords)))
+        return tracks
 
     def pl_unpack(self, text):
-        """Unmarshall a string to a list."""
+        """Unmarshall a string in the old session format to a list."""
         
         
         start = 0
@@ -1436,8 +1847,7 @@ class IDJC_Media_Player:
                 elif t == "s":
                     pass
                 elif t == "c":
-                    csts = eval(value, {"__builtins__":None},{
-                                                "CueSheetTrack":CueSheetTrack})
+                    csts = self._cuesheet_tracks(value)
                     value = CueSheetListStore()
                     for cst in csts:
                         value.append(cst)
@@ -1836,27 +2246,16 @@ class IDJC_Media_Player:
                 if poolsize > len(self.liststore):
                     poolsize = len(self.liststore)
 
+            # Pick from the least recently played tracks.
             if self.parent.server_window.is_streaming or \
                                         self.parent.server_window.is_recording:
-                fp = self.parent.files_played
+                source = 0      # files_played
             else:
-                fp = self.parent.files_played_offline
-            timestamped_pathnames = []
-            while not timestamped_pathnames:
-                random_pathnames = [PlayerRow(*x).filename 
-                            for x in random.sample(self.liststore, poolsize)]
-                timestamped_pathnames = [(fp.get(pn, 0), pn) 
-                                            for pn in random_pathnames if pn]
-                timestamped_pathnames.sort()
-                least_recent_ts = timestamped_pathnames[0][0]
-                timestamped_pathnames = [x for x in timestamped_pathnames
-                                                    if x[0] == least_recent_ts]
-                least_recent = random.choice(timestamped_pathnames)[1]
-
-            for path, entry in enumerate(self.liststore):
-                entry_filename = PlayerRow(*entry).filename
-                if least_recent == entry_filename:
-                    break
+                source = 1      # files_played_offline
+            pool = self.lrp_index.least_recent(poolsize, source)
+            if not pool:
+                return
+            path = self.lrp_index.index(random.choice(pool))
 
             treeselection = self.treeview.get_selection()
             treeselection.select_path(path)
@@ -1978,26 +2377,10 @@ class IDJC_Media_Player:
                 treeselection.select_path(0)
 
     def get_pl_block_size(self, iter):
-        size = 0
-        speedfactor = self.pbspeedfactor
-        while iter is not None:
-            length = self.liststore.get_value(iter, 2)
-            if length == -11:
-                text = self.liststore.get_value(iter, 0)
-                if text.startswith("<b>"):
-                    text = text[3:-4]
-                if text in (">stopplayer", ">stopplayer2", ">transfer",
-                                ">crossfade", ">announcement", ">jumptotop"):
-                    break
-                if text == ">normalspeed":
-                    speedfactor = 1.0
-            if length >= 0:
-                cuesheet = self.liststore.get_value(iter, 8)
-                if cuesheet is not None:
-                    length = cuesheet.time_remaining(0.0)
-                size += int(length / speedfactor)
-            iter = self.liststore.iter_next(iter)
-        return size
+        if iter is None:
+            return 0
+        return self.block_index.block_size(self.liststore.get_path(iter)[0],
+                                                        self.pbspeedfactor)
 
     def update_time_stats(self):
         """In playlist mode 0 the block times are calculated and displayed.
@@ -2465,14 +2848,7 @@ class IDJC_Media_Player:
         self.filerq.destroy()
         if response_id != gtk.RESPONSE_ACCEPT:
             return
-        gen = self.filter_allowed_controls(self.get_elements_from(chosenfiles))
-        for each in gen:
-            if self.no_more_files:
-                self.no_more_files = False
-                break
-            self.liststore.append(each)
-            while gtk.events_pending():
-                gtk.main_iteration()
+        self.scan_elements_from(self.get_sources_from(chosenfiles))
                 
     def filter_allowed_controls(self, items):
         """Interlude playlist must not contain certain playlist controls."""
@@ -2732,42 +3108,107 @@ class IDJC_Media_Player:
         return False
 
     def get_elements_from(self, pathnames):
+        """Playlist rows for the media referenced by pathnames."""
+
+        for each in self.get_sources_from(pathnames):
+            if isinstance(each, basestring):
+                each = self.get_media_metadata(each)
+            if each:
+                yield each
+
+    def scan_elements_from(self, sources, path=None, before=False):
+        """Add media to the playlist using a background scanner.
+
+        The rows are placed before or after path or are appended. Scans
+        started while others are running proceed alongside them, each
+        keeping to its own insertion point.
+        """
+
+        self.no_more_files = False
+
+        # The insertion point and whether to insert before it.
+        if path is None:
+            where = [None, False]
+        else:
+            where = [gtk.TreeRowReference(self.liststore, path), before]
+
+        def deliver(rows):
+            model = self.liststore
+            for row in self.filter_allowed_controls(rows):
+                ref, before = where
+                if ref is not None and ref.valid():
+                    iter = model.get_iter(ref.get_path())
+                    if before:
+                        iter = model.insert_before(iter, row)
+                    else:
+                        iter = model.insert_after(iter, row)
+                else:
+                    iter = model.append(row)
+                where[:] = gtk.TreeRowReference(model, model.get_path(iter)), \
+                                                                        False
+
+        def progress(done, found, exhausted):
+            if self.no_more_files:
+                scanner.cancel()
+                return
+
+            self.scanners[scanner] = done, found, exhausted
+            done, found, exhausted = (sum(x) for x in zip(
+                                                *self.scanners.itervalues()))
+            exhausted = exhausted == len(self.scanners)
+            self.scan_progress.show()
+            if found:
+                self.scan_progress.bar.set_fraction(float(done) / found)
+            # TC: Progress of media files being added to the playlist.
+            self.scan_progress.bar.set_text(_('%(done)d of %(found)d%(more)s') %
+                    dict(done=done, found=found, more="" if exhausted else "+"))
+
+        def finish():
+            self.scanners.pop(scanner, None)
+            if not self.scanners:
+                self.scan_progress.hide()
+            self.reselect_please = True
+
+        scanner = MediaScanner(sources, self.get_media_metadata_many,
+                                                    deliver, finish, progress)
+        self.scanners[scanner] = 0, 0, False
+
+    def cb_scan_cancel(self, widget):
+        self.no_more_files = True
+        for scanner in self.scanners:
+            scanner.cancel()
+
+    def get_sources_from(self, pathnames):
+        """Media pathnames to probe, and finished rows, from pathnames."""
+
         self.no_more_files = False
         l = len(pathnames)
         if l == 1:
             ext = os.path.splitext(pathnames[0])[1]
             if ext in (".cue", ".txt"):
-                return self.get_elements_from_cue(pathnames[0])
+                return self.get_sources_from_cue(pathnames[0])
             if ext == ".m3u":
-                return self.get_elements_from_m3u(pathnames[0])
+                return self.get_sources_from_m3u(pathnames[0])
             elif ext == ".pls":
-                return self.get_elements_from_pls(pathnames[0])
+                return self.get_sources_from_pls(pathnames[0])
             elif ext == ".xspf":
-                return self.get_elements_from_xspf(pathnames[0])
+                return self.get_sources_from_xspf(pathnames[0])
             elif os.path.isdir(pathnames[0]):
-                return self.get_elements_from_directory(pathnames[0], 2)
-        return self.get_elements_from_chosen(pathnames)
+                return self.get_sources_from_directory(pathnames[0], 2)
+        return iter(pathnames)
 
-    def get_elements_from_chosen(self, chosenfiles):
-        for each in chosenfiles:
-            meta = self.get_media_metadata(each)
-            if meta:
-                yield meta
-
-    def get_elements_from_cue(self, filename):
+    def get_sources_from_cue(self, filename):
         cuesheet_entry = self.make_cuesheet_playlist_entry(filename)
         pathnames = list(x.pathname for x in cuesheet_entry.cuesheet if x.index == 1)
         # Multi file cue sheet adds as content files.        
         if len(set(pathnames)) > 1:
             for each in pathnames:
-                meta = self.get_media_metadata(each)
-                if meta:
-                    yield meta
+                yield each
         else:
             if any(pathnames):
                 yield cuesheet_entry
 
-    def get_elements_from_directory(self, chosendir, depth=1, visited=None):
+    def get_sources_from_directory(self, chosendir, depth=1, visited=None):
         depth -= 1
         if visited is None:
             visited = set()
@@ -2788,20 +3229,18 @@ class IDJC_Media_Player:
                 #if os.path.realpath(pathname) == pathname:
                 if not filename.startswith("."):
                     directories.add(filename)
-            else:
-                meta = self.get_media_metadata(pathname)
-                if meta:
-                    yield meta
+            elif supported.check_media(pathname):
+                yield pathname
 
         if depth:
             for subdir in directories:
                 print "examining", "/".join((chosendir, subdir))
-                gen = self.get_elements_from_directory("/".join(
+                gen = self.get_sources_from_directory("/".join(
                                         (chosendir, subdir)), depth, visited)
-                for meta in gen:
-                    yield meta
+                for each in gen:
+                    yield each
 
-    def get_elements_from_m3u(self, filename):
+    def get_sources_from_m3u(self, filename):
         try:
             file = open(filename, "r")
             data = file.read().strip()
@@ -2818,16 +3257,13 @@ class IDJC_Media_Player:
                 each = basepath + each
             # handle special case of a single element referring to a directory
             if line == 0 and len(data) == 1 and os.path.isdir(each):
-                gen = self.get_elements_from_directory(each)
-                for meta in gen:
-                    yield meta
+                gen = self.get_sources_from_directory(each)
+                for each in gen:
+                    yield each
                 return
-            meta = self.get_media_metadata(each)
-            if meta:
-                yield meta
-            line += 1
+            yield each
 
-    def get_elements_from_pls(self, filename):
+    def get_sources_from_pls(self, filename):
         import ConfigParser
         cfg = ConfigParser.RawConfigParser()
         try:
@@ -2855,11 +3291,9 @@ class IDJC_Media_Player:
                 print "Problem getting file path from playlist"
             else:
                 if os.path.isfile(path):
-                    meta = self.get_media_metadata(path)
-                    if meta:
-                        yield meta
+                    yield path
 
-    def get_elements_from_xspf(self, filename):
+    def get_sources_from_xspf(self, filename):
         class BadXspf(ValueError):
             pass
         class GotLocation(Exception):
@@ -2929,9 +3363,10 @@ class IDJC_Media_Player:
                         for base in baseurl:
                             url = urllib.unquote(urllib.basejoin(base, 
                                 location.firstChild.wholeText).encode("ASCII"))
-                            meta = self.get_media_metadata(url)
-                            if meta:
-                                yield meta
+                            if url.startswith("file://"):
+                                url = url[7:]
+                            if os.path.isfile(url):
+                                yield url
                                 raise GotLocation
                     # Support namespaced pld tag for literal playlist data.
                     # This is only used for data such as playlist controls.
@@ -3029,56 +3464,19 @@ class IDJC_Media_Player:
                 context.finish(False, False, etime)
         return True
 
+    @threadslock
     def drag_data_received_data_idle(self, treeview, x, y, dragged):
-        gtk.gdk.threads_enter()
-        model = treeview.get_model()
-        gtk.gdk.threads_leave()
-
         pathnames = [urllib.unquote(t[7:]) for t in dragged.strip().splitlines(
                                                 ) if t.startswith("file://")]
-        gen = self.get_elements_from(pathnames)
-
-        first = True
-        for media_data in gen:
-            if self.no_more_files:
-                self.no_more_files = False
-                break
-            if first:
-                gtk.gdk.threads_enter()
-                drop_info = treeview.get_dest_row_at_pos(x, y)
-                gtk.gdk.threads_leave()
-                if drop_info:
-                    path, position = drop_info
-                    gtk.gdk.threads_enter()
-                    iter = model.get_iter(path)
-                    gtk.gdk.threads_leave()
-                    if(position == gtk.TREE_VIEW_DROP_BEFORE or position == \
-                                            gtk.TREE_VIEW_DROP_INTO_OR_BEFORE):
-                        gtk.gdk.threads_enter()
-                        iter = model.insert_before(iter, media_data)
-                        gtk.gdk.threads_leave()
-                    else:
-                        gtk.gdk.threads_enter()
-                        iter = model.insert_after(iter, media_data)
-                        gtk.gdk.threads_leave()
-                else:
-                    gtk.gdk.threads_enter()
-                    iter = model.append(media_data)
-                    gtk.gdk.threads_leave()
-                first = False
-            else:
-                gtk.gdk.threads_enter()
-                iter = model.insert_after(iter, media_data)
-                gtk.gdk.threads_leave()
-            gtk.gdk.threads_enter()
-            while gtk.events_pending():
-                gtk.gdk.threads_leave()
-                gtk.gdk.threads_enter()
-                gtk.main_iteration()
-                gtk.gdk.threads_leave()
-                gtk.gdk.threads_enter()
-            gtk.gdk.threads_leave()
-        self.reselect_please = True
+        drop_info = treeview.get_dest_row_at_pos(x, y)
+        if drop_info:
+            path, position = drop_info
+            before = position in (gtk.TREE_VIEW_DROP_BEFORE,
+                                            gtk.TREE_VIEW_DROP_INTO_OR_BEFORE)
+            self.scan_elements_from(self.get_sources_from(pathnames), path,
+                                                                        before)
+        else:
+            self.scan_elements_from(self.get_sources_from(pathnames))
         return False
 
     sourcetargets = [
@@ -3587,6 +3985,11 @@ class IDJC_Media_Player:
             return False
         return True
 
+    # Replay gain marker column markup: red triangle when not set or small
+    # green bullet point.
+    rg_markup = ('<span foreground="dark red">&#x25b5;</span>',
+                 '<span foreground="dark green">&#x2022;</span>')
+
     def rgrowconfig(self, tv_column, cell_renderer, model, iter):
         if self.exiting:
             return
@@ -3594,14 +3997,32 @@ class IDJC_Media_Player:
         if model.get_value(iter, 0)[0] == ">":
             cell_renderer.set_property("text", " ")
         else:
-            if model.get_value(iter, 7) == RGDEF:
-                # Red triangle.
-                cell_renderer.set_property("markup",
-                                '<span foreground="dark red">&#x25b5;</span>')
+            cell_renderer.set_property("markup", self.rg_markup[
+                                            model.get_value(iter, 7) != RGDEF])
+
+    def playtime_text(self, playtime, meta):
+        """The play time column text of a row, memoized."""
+
+        key = playtime if playtime != -11 else meta[2:6]
+        try:
+            return self.playtime_text_cache[key]
+        except KeyError:
+            pass
+
+        if playtime == -11:
+            length = meta[2:6] or "0000"
+            if length == "0000":
+                text = ""
+            elif length[0] == "0":
+                text = " " + length[1] + ":" + length[2:]
             else:
-                # Small green bullet point.
-                cell_renderer.set_property("markup",
-                                '<span foreground="dark green">&#x2022;</span>')
+                text = length[:2] + ":" + length[2:]
+        elif playtime == 0:
+            text = "? : ??"
+        else:
+            text = "%d:%02d" % divmod(playtime, 60)
+        self.playtime_text_cache[key] = text
+        return text
 
     def playtimerowconfig(self, tv_column, cell_renderer, model, iter):
         if self.exiting:
@@ -3611,27 +4032,13 @@ class IDJC_Media_Player:
         cell_renderer.set_property("xalign", 1.0)
         if playtime == -11:
             if model.get_value(iter, 0) == ">announcement":
-                length = model.get_value(iter, 3)[2:6]
-                if not length:
-                    length = "0000"
-                if length == "0000":
-                    cell_renderer.set_property("text", "")
-                else:
-                    if length[0] == "0":
-                        length = " " + length[1] + ":" + length[2:]
-                    else:
-                        length = length[:2] + ":" + length[2:]
-                    cell_renderer.set_property("text", length)
+                cell_renderer.set_property("text", self.playtime_text(
+                                            -11, model.get_value(iter, 3)))
             else:
                 cell_renderer.set_property("text", "")
-        elif playtime == 0:
-            cell_renderer.set_property("text", "? : ??")
         else:
-            secs = playtime % 60
-            playtime -= secs
-            mins = playtime / 60
-            text = "%d:%02d" % (mins, secs)
-            cell_renderer.set_property("text", text)
+            cell_renderer.set_property("text", self.playtime_text(
+                                                                playtime, ""))
 
     # Class variable for use by rowconfig.
     control_cell_properties = {
@@ -3694,57 +4101,77 @@ class IDJC_Media_Player:
                             ("foreground", "blue"))
         }
 
-    def rowconfig(self, tv_column, cell_renderer, model, iter):
-        if self.exiting:
-            return
-        crprop = cell_renderer.set_property
-        celltext = model.get_value(iter, 0)
-        if celltext[:4] == "<b>>":
-            celltext = celltext[3:-4]
-        if celltext[0] == ">":
-            crprop("xalign", 0.45)
-            crprop("ypad", 0)
-            crprop("scale", 0.75)
-            crprop("cell-background-set", True)
-            crprop("background-set", True)
-            crprop("foreground-set", True)
-            if self.pl_mode.get_active() == 0:
-                try:
-                    properties = self.control_cell_properties[celltext]
-                except KeyError:
-                    pass
-                else:
-                    for name, value in properties:
-                        crprop(name, value)
+    def row_render_props(self, control, active):
+        """Cell renderer properties for a row, computed once per kind.
+
+        control is the playlist control name or None for a media row and
+        active is whether playlist controls are in effect.
+        """
+
+        key = (control, active)
+        try:
+            return self.render_props_cache[key]
+        except KeyError:
+            pass
+
+        if control is None:
+            props = (("foreground-set", False),
+                     ("cell-background-set", False),
+                     ("background-set", False),
+                     ("scale", 1.0),
+                     ("xalign", 0.0),
+                     ("ypad", 2))
+        else:
+            props = [("xalign", 0.45),
+                     ("ypad", self.control_ypad),
+                     ("scale", 0.75),
+                     ("cell-background-set", True),
+                     ("background-set", True),
+                     ("foreground-set", True)]
+            if active:
+                props.extend(self.control_cell_properties.get(control, ()))
                     
-                if celltext == ">transfer":
+                if control == ">transfer":
                     if self.playername == "left":
                         # TC: Playlist control.
-                        crprop("text", _('>>> Transfer across >>>'))
+                        props.append(("text", _('>>> Transfer across >>>')))
                     elif self.playername == "right":
                         # TC: Playlist control.
-                        crprop("text", _('<<< Transfer across <<<'))
+                        props.append(("text", _('<<< Transfer across <<<')))
                 
-                if celltext == ">crossfade":
+                if control == ">crossfade":
                     if self.playername == "left":
                         # TC: Playlist control.
-                        crprop("text", _('>>> Fade across >>>'))
+                        props.append(("text", _('>>> Fade across >>>')))
                     elif self.playername == "right":
                         # TC: Playlist control.
-                        crprop("text", _('<<< Fade across <<<'))
+                        props.append(("text", _('<<< Fade across <<<')))
             else:
-                crprop("cell-background", "darkgray")
-                crprop("background", "darkgray")
-                crprop("foreground", "white")
-                # TC: Playlist control.
-                crprop("markup", "<i>%s</i>" % _("Ignored playlist control"))
+                props.extend((("cell-background", "darkgray"),
+                              ("background", "darkgray"),
+                              ("foreground", "white"),
+                              # TC: Playlist control.
+                              ("markup", "<i>%s</i>" % _(
+                                                "Ignored playlist control"))))
+            props = tuple(props)
+
+        self.render_props_cache[key] = props
+        return props
+
+    def rowconfig(self, tv_column, cell_renderer, model, iter):
+        if self.exiting:
+            return
+        crprop = cell_renderer.set_property
+        celltext = model.get_value(iter, 0)
+        if celltext[:4] == "<b>>":
+            celltext = celltext[3:-4]
+        if celltext[0] == ">":
+            props = self.row_render_props(celltext,
+                                                self.pl_mode.get_active() == 0)
         else:
-            crprop("foreground-set", False)
-            crprop("cell-background-set", False)
-            crprop("background-set", False)
-            crprop("scale", 1.0)
-            crprop("xalign", 0.0)
-            crprop("ypad", 2)
+            props = self.row_render_props(None, None)
+        for name, value in props:
+            crprop(name, value)
 
     def cb_playlist_delay(self, widget):
         print "inter track fade was changed"
@@ -3941,11 +4368,26 @@ class IDJC_Media_Player:
         self.playtimetvcolumn.set_cell_data_func(
                                 self.playtimecellrender, self.playtimerowconfig)
         self.tvcolumn.set_cell_data_func(self.cellrender, self.rowconfig)
-        self.playtimetvcolumn.set_sizing(gtk.TREE_VIEW_COLUMN_AUTOSIZE)
+        # Fixed sizing throughout so that GTK need not measure every row of
+        # the playlist, making large playlists quick to load and scroll.
+        def text_size(text):
+            return self.treeview.create_pango_layout(text).get_pixel_size()
+        xpad = 2 * self.playtimecellrender.get_property("xpad") + 4
+        self.playtimetvcolumn.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
+        self.playtimetvcolumn.set_fixed_width(text_size("0000:00")[0] + xpad)
+        self.rgtvcolumn.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
+        self.rgtvcolumn.set_fixed_width(text_size(u"\u25b5")[0] + xpad)
         self.tvcolumn.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
         self.tvcolumn.set_expand(True)
         self.treeview.append_column(self.tvcolumn)
         self.treeview.append_column(self.playtimetvcolumn)
+        self.treeview.set_fixed_height_mode(True)
+        # Playlist controls are drawn in smaller text so they get more
+        # padding to make all rows the same height.
+        text_height = text_size("Ag")[1]
+        self.control_ypad = (text_height + 5 - int(text_height * 0.75)) // 2
+        self.render_props_cache = {}
+        self.playtime_text_cache = {}
         self.treeview.set_search_column(0)
         self.treeview.set_headers_visible(False)
         self.treeview.set_enable_search(False)
@@ -3968,6 +4410,9 @@ class IDJC_Media_Player:
 
         self.liststore.connect("row-inserted", self.cb_playlist_changed)
         self.liststore.connect("row-deleted", self.cb_playlist_changed)
+        self.block_index = BlockTimeIndex(self.liststore)
+        self.lrp_index = LeastRecentIndex(self.liststore,
+                    self.parent.files_played, self.parent.files_played_offline)
 
         self.scrolllist.add(self.treeview)
         self.treeview.show()
@@ -3975,10 +4420,17 @@ class IDJC_Media_Player:
         plvbox.pack_start(self.scrolllist, True, True, 0)
         self.scrolllist.show()
 
+        # Progress of tracks being added.
+        self.scan_progress = ScanProgress()
+        self.scan_progress.cancel.connect("clicked", self.cb_scan_cancel)
+        plvbox.pack_start(self.scan_progress, False, False, 0)
+
         # Cue sheet playlist controls.
 
         self.cuesheet_playlist = CuesheetPlaylist()
         self.cuesheet_playlist.connect("playitem", self._cb_cuesheet_item)
+        self.cuesheet_playlist.connect("playtoggled",
+                                lambda w, m, p: self.block_index.invalidate())
         plvbox.pack_start(self.cuesheet_playlist)
 
         # External playlist control unit
@@ -4577,12 +5029,17 @@ class IDJC_Media_Player:
         self.crossfader_initiated = False
         self.music_filename = ""
         self.session_filename = self.playername + "_session"
+        self.session_format = 2
+        self.session_chunk = 1000
+        self.session_pending = deque()
+        self.session_select = None
         self.oldstatusbartext = ""
         self.pbspeedfactor = 1.0
         self.playlist_changed = True
         self.alarm_cid = 0
         self.playlist_todo = deque()
         self.no_more_files = False
+        self.scanners = {}      # Running MediaScanner to its progress.
         self.model_playing = None
         self.player_cid = -1
 
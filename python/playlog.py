@@ -0,0 +1,182 @@
+"""Append-only record of the media files played."""
+
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = ["PlayLog"]
+
+
+import os
+import time
+import shutil
+
+from .utils import WatchedDict
+
+
+class PlayLog(WatchedDict):
+    """Last played times by pathname, backed by one log file per day.
+
+    Each play is appended as a line of timestamp and pathname to the log
+    for its day and flushed straight away so little is lost in a crash. A
+    torn final line is ignored on load. Compaction is the deletion of logs
+    older than retain_days which also bounds the in-memory index.
+
+    The player updates the timestamp of the playing file every second.
+    Updates closer together than same_play belong to the play already
+    logged and only change the index.
+    """
+
+
+    retain_days = 30
+    same_play = 10.0
+
+
+    def __init__(self, directory):
+        WatchedDict.__init__(self)
+        self.directory = directory
+        self._fh = None
+        self._day = None
+
+
+    @staticmethod
+    def _day_of(timestamp):
+        return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+
+    def _log_pathname(self, day):
+        return os.path.join(self.directory, day + ".log")
+
+
+    def _log_days(self):
+        try:
+            names = os.listdir(self.directory)
+        except EnvironmentError:
+            return []
+        return sorted(x[:-4] for x in names if x.endswith(".log"))
+
+
+    def _append(self, pathname, timestamp):
+        if "\n" in pathname:
+            return
+
+        day = self._day_of(timestamp)
+        try:
+            if day != self._day:
+                if self._fh is not None:
+                    self._fh.close()
+                    self._fh = None
+                if not os.path.isdir(self.directory):
+                    os.makedirs(self.directory)
+                self._fh = open(self._log_pathname(day), "a")
+                self._day = day
+            self._fh.write("%.3f\t%s\n" % (timestamp, pathname))
+            self._fh.flush()
+        except EnvironmentError as e:
+            print "PlayLog: write failed:", e
+            self._fh = self._day = None
+
+
+    def __setitem__(self, pathname, timestamp):
+        previous = self.get(pathname)
+        WatchedDict.__setitem__(self, pathname, timestamp)
+        if previous is None or timestamp - previous > self.same_play:
+            self._append(pathname, timestamp)
+
+
+    def report(self, day):
+        """Generate (timestamp, pathname) for the plays of a day, YYYY-MM-DD.
+
+        Only the log of that day is read.
+        """
+
+        try:
+            fh = open(self._log_pathname(day))
+        except EnvironmentError:
+            return
+
+        with fh:
+            for line in fh:
+                if line.endswith("\n"):
+                    timestamp, sep, pathname = line[:-1].partition("\t")
+                    try:
+                        yield float(timestamp), pathname
+                    except ValueError:
+                        pass
+
+
+    def export_report(self, day, pathname):
+        """Write a tab separated play report for one day to pathname."""
+
+        with open(pathname, "w") as fh:
+            for timestamp, played in self.report(day):
+                fh.write("%s\t%s\n" % (time.strftime("%H:%M:%S",
+                                        time.localtime(timestamp)), played))
+
+
+    def load(self, legacy=None):
+        """Build the index from the logs within the retention period.
+
+        legacy is the pickled dict of older versions, logged afresh if no
+        logs exist yet.
+        """
+
+        days = self._log_days()
+        if not days and legacy:
+            for pathname, timestamp in sorted(legacy.iteritems(),
+                                                        key=lambda x: x[1]):
+                self[pathname] = timestamp
+            return
+
+        cutoff = self._day_of(time.time() - self.retain_days * 86400)
+        for day in days:
+            if day >= cutoff:
+                for timestamp, pathname in self.report(day):
+                    WatchedDict.__setitem__(self, pathname, timestamp)
+
+
+    def compact(self):
+        """Delete logs and forget plays older than the retention period."""
+
+        cutoff_time = time.time() - self.retain_days * 86400
+        cutoff = self._day_of(cutoff_time)
+        for day in self._log_days():
+            if day < cutoff:
+                try:
+                    os.unlink(self._log_pathname(day))
+                except EnvironmentError as e:
+                    print "PlayLog: log deletion failed:", e
+
+        for pathname in [k for k, v in self.iteritems() if v < cutoff_time]:
+            del self[pathname]
+
+
+    def save_copy(self, directory):
+        """Copy the logs to another directory."""
+
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            for day in self._log_days():
+                shutil.copy(self._log_pathname(day), directory)
+        except EnvironmentError as e:
+            print "PlayLog: copy failed:", e
+
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = self._day = None
@@ -181,6 +181,27 @@ class ArgumentParserImplementation(object):
                 help=_('No JACK ports will be connected except those listed in'
                 ' the session file.'))
 
+        sp_run.add_argument("--standin-backend", dest="standin_backend",
+                nargs="?", const="", metavar="rates",
+                help="""run against a simulated backend, for user interface
+                testing -- rates is of the form levels=25,metadata=0.05,
+                midi=0,streams=0""")
+        sp_run.add_argument("--benchmark", dest="benchmark", nargs=1,
+                metavar="results_file",
+                help="""with --standin-backend measure frame times and CPU use
+                under various traffic and write the results to a file""")
+        sp_run.add_argument("--capture", dest="capture", nargs=1,
+                metavar="capture_file",
+                help="""record the traffic with the backend to a file for
+                later use with --replay""")
+        sp_run.add_argument("--replay", dest="replay", nargs=1,
+                metavar="capture_file",
+                help="""run against a simulated backend that plays back a
+                file made with --capture""")
+        sp_run.add_argument("--replay-speed", dest="replay_speed", nargs=1,
+                type=float, default=[1.0], metavar="x",
+                help="""how many times faster than real time to replay""")
+
         group = sp_run.add_argument_group(_("user interface settings"))
         group.add_argument("-c", "--channels", dest="channels", nargs="+",
                 metavar="c",
@@ -48,6 +48,8 @@ from .dialogs import *
 from .irc import IRCPane
 from .format import FormatControl, FormatCodecMPEG
 from .tooltips import set_tip
+from .listenerstats import StatsServer, stats_collector
+from .listenerhistory import ListenerHistory, Sparkline
 from .prelims import ProfileManager
 
 
@@ -279,88 +281,12 @@ class ConnectionDialog(gtk.Dialog):
 
 
 
-class StatsThread(Thread):
-    def __init__(self, d):
-        Thread.__init__(self)
-        self.is_shoutcast = d["server_type"] % 2
-        self.host = d["host"]
-        self.port = d["port"]
-        self.mount = d["mount"]
-        if self.is_shoutcast:
-            self.login = "admin"
-        else:
-            self.login = d["login"]
-        self.passwd = d["password"]
-        self.listeners = -2         # preset error code for failed/timeout
-        self.url = "http://%s:%d%s" % (self.host, self.port, self.mount)
-
-
-    def run(self):
-        class BadXML(ValueError):
-            pass
-        
-        hostport = "%s:%d" % (self.host, self.port)
-        if self.is_shoutcast:
-            stats_url = "http://%s/admin.cgi?mode=viewxml" % hostport
-            realm = "Shoutcast Server"
-        else:
-            stats_url = "http://%s/admin/listclients?mount=%s" % (
-                                                        hostport, self.mount)
-            realm = "Icecast2 Server"
-        auth_handler = urllib2.HTTPBasicAuthHandler()
-        auth_handler.add_password(realm, hostport, self.login, self.passwd)
-        opener = urllib2.build_opener(auth_handler)
-        opener.addheaders = [('User-agent', 'Mozilla/5.0')]
-        
-        try:
-            f = opener.open(stats_url)
-            xmlfeed = f.read()
-        except:
-            print "failed to get server stats for", self.url
-            return
-        f.close()
-        try:
-            dom = mdom.parseString(xmlfeed)
-        except:
-            print "failed to parse server stats for", self.url
-            return
-        
-        try:
-            if self.is_shoutcast:
-                if dom.documentElement.tagName == u'SHOUTCASTSERVER':
-                    shoutcastserver = dom.documentElement
-                else:
-                    raise BadXML
-                currentlisteners = shoutcastserver.getElementsByTagName(
-                                                            'CURRENTLISTENERS')
-                try:
-                    self.listeners = int(currentlisteners[
-                                                0].firstChild.wholeText.strip())
-                except:
-                    raise BadXML
-            else:
-                if dom.documentElement.tagName == u'icestats':
-                    icestats = dom.documentElement
-                else:
-                    raise BadXML
-                sources = icestats.getElementsByTagName('source')
-                for source in sources:
-                    mount = source.getAttribute('mount')
-                    if stats_url.endswith(mount):
-                        listeners = source.getElementsByTagName('Listeners')
-                        try:
-                            self.listeners = int(
-                                    listeners[0].firstChild.wholeText.strip())
-                            break
-                        except:
-                            raise BadXML
-                else:
-                    raise BadXML
-        except BadXML:
-            print "Unexpected data in server stats XML file"
-        dom.unlink()
-        print "server", self.url, "has", self.listeners, "listeners"
+def stats_server(d):
+    """The StatsServer for a row of the connection pane as a dict."""
 
+    is_shoutcast = d["server_type"] % 2
+    return StatsServer(is_shoutcast, d["host"], d["port"], d["mount"],
+                        "admin" if is_shoutcast else d["login"], d["password"])
 
 
 class ActionTimer(object):
@@ -378,6 +304,88 @@ class ActionTimer(object):
         self.first = first
         self.last = last
 
+
+class BitrateStepDown(object):
+    """Lowers the bitrate of a stream's encoder while its send buffer fills.
+
+    Given the send buffer fill each monitor tick. Once at or above high
+    percent for hold_down seconds the encoder is restarted in place at the
+    lower bitrate, which the server connection survives. Once back at or
+    below low percent for hold_up seconds the set bitrate is restored.
+    """
+
+    high = 50
+    low = 10
+    hold_down = 3.0
+    hold_up = 60.0
+
+    def __init__(self, streamtab):
+        self.streamtab = streamtab
+        self.stepped = None     # The bitrate stepped down to.
+        self._since = None
+        self._refused = False
+
+    def _name(self):
+        return "stream tab %d" % (self.streamtab.numeric_id + 1)
+
+    def tick(self, now, sendbuffer_pc, percent):
+        if self.stepped is None:
+            crossed = sendbuffer_pc >= self.high
+        else:
+            crossed = sendbuffer_pc <= self.low
+        if not crossed:
+            self._since = None
+            if self.stepped is None:
+                self._refused = False
+            return
+        if self._since is None:
+            self._since = now
+
+        if self.stepped is None:
+            if now - self._since >= self.hold_down and not self._refused:
+                self._refused = not self._step_down(percent)
+        elif now - self._since >= self.hold_up:
+            print "%s: send buffer under %d%% for %g seconds" % (
+                                        self._name(), self.low, self.hold_up)
+            self.reset()
+
+    def _step_down(self, percent):
+        streamtab = self.streamtab
+        fc = streamtab.format_control
+        if not streamtab.encoder_exclusive():
+            print "%s: send buffer over %d%% but the encoder is shared so " \
+                                "the bitrate stays" % (self._name(), self.high)
+            return False
+        bitrate = fc.lower_bitrate(percent)
+        if bitrate is None:
+            print "%s: send buffer over %d%% but the format has no lower " \
+                            "bitrate to step to" % (self._name(), self.high)
+            return False
+        if not fc.update_encoder(bitrate=bitrate):
+            print "%s: failed to step the bitrate down to %s" % (
+                                                        self._name(), bitrate)
+            fc.update_encoder()
+            return False
+        self.stepped = bitrate
+        self._since = None
+        print "%s: send buffer over %d%% for %g seconds, bitrate stepped " \
+                "down to %s" % (self._name(), self.high, self.hold_down, bitrate)
+        return True
+
+    def reset(self):
+        """Restore the set bitrate if stepped down."""
+
+        if self.stepped is not None:
+            self.stepped = None
+            self._since = None
+            fc = self.streamtab.format_control
+            if fc.running:
+                if fc.update_encoder():
+                    print "%s: bitrate restored" % self._name()
+                else:
+                    print "%s: failed to restore the bitrate" % self._name()
+
+
 class CellRendererXCast(gtk.CellRendererText):
     icons = ("<span foreground='#0077FF'>&#x25A0;</span>",
                 "<span foreground='orange'>&#x25A0;</span>",
@@ -567,26 +575,29 @@ class ConnectionPane(gtk.VBox):
                     ap = self.tab.admin_password_entry.get_text().strip()
                     if ap:
                         d["password"] = ap
-                stats_thread = StatsThread(d)
-                stats_thread.start()
+                server = stats_server(d)
+                stats_collector.request(server)
                 ref = gtk.TreeRowReference(self.liststore, i)
-                self.stats_rows.append((ref, stats_thread))
+                self.stats_rows.append((ref, server))
             else:
                 row[5] = -1      # sets listeners text to 'unknown'
 
     def stats_collate(self):
         count = 0
-        for ref, thread in self.stats_rows:
+        for ref, server in self.stats_rows:
             if ref.valid() == False:
-                print "stats_collate:", thread.url, \
-                            "invalidated by its removal from the stats list"
+                print "stats_collate: %s:%d%s invalidated by its removal " \
+                        "from the stats list" % (server.host, server.port,
+                        server.mount)
                 continue
+            listeners = stats_collector.listeners(server)
             row = ref.get_model()[ref.get_path()[0]]
-            row[5] = thread.listeners
-            if thread.listeners > 0:
-                count += thread.listeners
+            row[5] = listeners
+            if listeners > 0:
+                count += listeners
         self.listeners_display.set_text(str(count))
         self.listeners = count
+        self.listeners_known = bool(self.stats_rows)
 
     def on_dialog_destroy(self, dialog, tree_selection, old_iter):
         model, iter = tree_selection.get_selected()
@@ -721,6 +732,9 @@ class ConnectionPane(gtk.VBox):
         self.listeners_display.set_padding(3, 0)
         frame.add(self.listeners_display)
         self.listeners_display.show()
+        self.sparkline = Sparkline(tab.listener_history)
+        ihbox.pack_start(self.sparkline, False, False, 2)
+        self.sparkline.show()
         self.listener_count_button.add(ihbox)
         hbox.pack_start(self.listener_count_button, False)
         
@@ -764,6 +778,8 @@ class ConnectionPane(gtk.VBox):
         vbox.pack_start(hbox, False)
         hbox.show_all()
         self.timer = ActionTimer(40, self.stats_commence, self.stats_collate)
+        self.listeners = 0
+        self.listeners_known = False
 
 
 class TimeEntry(gtk.HBox):
@@ -1041,6 +1057,21 @@ class Troubleshooting(gtk.VBox):
                     _("Assume the connection is beyond saving and reconnect."))
         for each in (self.sbf_discard_audio, self.sbf_reconnect):
             sbfbox.pack_start(each, True, False)
+
+        hbox = gtk.HBox()
+        hbox.set_spacing(4)
+        self.sbf_step_down = gtk.RadioButton(self.sbf_discard_audio,
+                            _("Before then lower the bitrate to this percentage"
+                            " of that set until the buffer drains."))
+        hbox.pack_start(self.sbf_step_down, False)
+        adj = gtk.Adjustment(50.0, 10.0, 90.0, 5.0, 10.0)
+        self.sbf_step_down_percent = gtk.SpinButton(adj)
+        hbox.pack_start(self.sbf_step_down_percent, False)
+        sbfbox.pack_start(hbox, True, False)
+        set_tip(hbox, _("The connection is kept and audio is discarded should"
+                " the buffer fill regardless. Codecs MP3, AAC, Ogg Vorbis and"
+                " Opus only, and only when the encoder is not shared with"
+                " another stream or a recorder."))
         
         self.show_all()
         
@@ -1051,6 +1082,8 @@ class Troubleshooting(gtk.VBox):
             "reconnection_repeat": (self.reconnection_repeat, "active"),
             "reconnection_quiet": (self.reconnection_quiet, "active"),
             "sbf_reconnect": (self.sbf_reconnect, "active"),
+            "sbf_step_down": (self.sbf_step_down, "active"),
+            "sbf_step_down_percent": (self.sbf_step_down_percent, "value"),
         }
         
     def _on_custom_user_agent(self, widget):
@@ -1236,7 +1269,7 @@ class StreamTab(Tab):
             self.troubleshooting.user_agent_entry.get_text().strip()
 
             self.connection_string = "\n".join((
-                    "stream_source=" + str(self.numeric_id),
+                    "stream_source=" + str(self.encoder_tab.numeric_id),
                     "server_type=" + (
                     "Icecast 2", "Shoutcast")[d["server_type"]],
                     "host=" + d["host"],
@@ -1265,6 +1298,7 @@ class StreamTab(Tab):
             self.send("command=server_disconnect\n")
             self.receive()
             self.start_stop_encoder(ENCODER_STOP)
+            self.bitrate_step.reset()
             self.connection_string = None
             self.connection_pane.streaming_set(False)
 
@@ -1277,12 +1311,48 @@ class StreamTab(Tab):
             self.start_stop_encoder(ENCODER_STOP)
 
     def start_stop_encoder(self, command):
-        """Reference counting starter and stopper for the encoder."""
+        """Reference counting starter and stopper for the encoder.
+
+        Rather than start its own encoder a tab will use the running one of
+        another tab with the same format and custom metadata settings. The
+        encoder to feed from is that of encoder_tab.
+        """
                 
         if command == ENCODER_START:
-            self.format_control.start_encoder_rc()
+            if not self._encoder_users and not self.format_control.running:
+                self.encoder_tab = self.scg.shareable_encoder(self) or self
+                if self.encoder_tab is not self:
+                    print "stream tab %d is sharing the encoder of tab %d" % (
+                            self.numeric_id + 1, self.encoder_tab.numeric_id + 1)
+            if self.encoder_tab.format_control.start_encoder_rc():
+                self._encoder_users += 1
+                if self.encoder_tab is not self:
+                    self.format_control.lock()
+            elif not self._encoder_users:
+                self.encoder_tab = self
         elif command == ENCODER_STOP:
-            self.format_control.stop_encoder_rc()
+            if self._encoder_users:
+                self.encoder_tab.format_control.stop_encoder_rc()
+                self._encoder_users -= 1
+                if not self._encoder_users:
+                    if self.encoder_tab is not self:
+                        self.format_control.unlock()
+                    self.encoder_tab = self
+        self.scg.lock_shared_metadata()
+
+    def encoder_exclusive(self):
+        """Whether only this tab's stream uses this tab's encoder."""
+
+        return self.encoder_tab is self and self._encoder_users == 1 and \
+                    self.format_control.running and not any(
+                    other.encoder_tab is self for other in self.scg.
+                    streamtabframe.tabs if other is not self)
+
+    def encoder_settings(self):
+        """What must match for another tab to use this tab's encoder."""
+
+        return (self.format_control.get_settings(), self.metadata.get_text(),
+                                            self.metadata_fallback.get_text())
     
     def server_type_cell_data_func(self, celllayout, cell, model, iter):
         text = model.get_value(iter, 0)
@@ -1329,7 +1399,7 @@ class StreamTab(Tab):
             self.metadata_update.set_relief(gtk.RELIEF_HALF)
             self.scg.send("tab_id=%d\ndev_type=encoder\ncustom_meta=%s\n"
                     "command=new_custom_metadata\n" % (
-                    self.numeric_id, cm))
+                    self.encoder_tab.numeric_id, cm))
             self.scg.receive()
 
     def cb_new_metadata_format(self, widget):
@@ -1400,6 +1470,9 @@ class StreamTab(Tab):
         self.scg = scg
         self.show_indicator("clear")
         self.tab_type = "streamer"
+        self.encoder_tab = self     # Whose encoder is in use.
+        self._encoder_users = 0
+        self.bitrate_step = BitrateStepDown(self)
         self.set_spacing(10)
               
         self.ic_expander = gtk.Expander(_('Individual Controls'))
@@ -1570,6 +1643,7 @@ class StreamTab(Tab):
         self.details_nb = gtk.Notebook()
         self.pack_start(self.details_nb, False)
         
+        self.listener_history = ListenerHistory()
         self.connection_pane = ConnectionPane(set_tip, self)
         label = gtk.Label(_('Connection'))
         self.details_nb.append_page(self.connection_pane, label)
@@ -1730,8 +1804,10 @@ class RecordTab(Tab):
                     if not self.recording:
                         sd = self.parentobject.source_dest
                         if sd.streamtab is not None:
+                            # Recordings are made at the set bitrate.
+                            sd.streamtab.bitrate_step.reset()
                             sd.streamtab.start_stop_encoder(ENCODER_START)
-                            num_id = sd.streamtab.numeric_id
+                            num_id = sd.streamtab.encoder_tab.numeric_id
                         else:
                             num_id = -1
    
@@ -2114,25 +2190,83 @@ class SourceClientGui(dbus.service.Object):
         print "streamstate_cache purge"
         self._streamstate_cache = {}
 
+    @dbus.service.method(dbus_interface=PGlobs.dbus_bus_basename,
+                                        in_signature="uss", out_signature="s")
+    def listener_history(self, tab, tier, format):
+        """Export the listener history of a stream tab.
+
+        tier is second, minute, or hour and format is csv or json.
+        """
+
+        try:
+            history = self.streamtabframe.tabs[tab].listener_history
+            return history.export(tier, format)
+        except (IndexError, ValueError) as e:
+            print "listener_history:", e
+            return ""
+
+    def shareable_encoder(self, streamtab):
+        """Another stream tab whose running encoder streamtab can use."""
+
+        if not streamtab.format_control.finalised:
+            return None
+        settings = streamtab.encoder_settings()
+        for other in self.streamtabframe.tabs:
+            if other is not streamtab and other.encoder_tab is other and \
+                        other.format_control.running and \
+                        other.bitrate_step.stepped is None and \
+                        other.encoder_settings() == settings:
+                return other
+        return None
+
+    def lock_shared_metadata(self):
+        """Hold the custom metadata of tabs sharing an encoder as is.
+
+        Sharing was agreed on the strength of it matching and the backend
+        has one custom metadata string per encoder.
+        """
+
+        tabs = self.streamtabframe.tabs
+        for tab in tabs:
+            shared = tab.encoder_tab is not tab or any(
+                    other.encoder_tab is tab for other in tabs if other is not tab)
+            for each in (tab.metadata, tab.metadata_fallback):
+                each.set_sensitive(not shared)
+
+    def get_reports(self):
+        """The recorder and streamer reports in one round trip.
+
+        The dict is keyed like recorder0 or streamer2 and the values are
+        the report fields joined by colons.
+        """
+
+        reports = {}
+        self.send("command=get_reports\n")
+        while 1:
+            reply = self.receive()
+            if reply == "succeeded" or reply == "failed":
+                break
+            key, sep, value = reply.partition("report=")
+            if sep:
+                reports[key] = value
+            else:
+                print self.unexpected_reply, reply
+        return reports
+
     def monitor(self):
         self.led_alternate = not self.led_alternate
         streaming = recording = False
+        reports = self.get_reports()
         # update the recorder LED indicators 
         for rectab in self.recordtabframe.tabs:
-            self.send("dev_type=recorder\ntab_id=%d\ncommand=get_report\n" %
-                                                            rectab.numeric_id)
-            while 1:
-                reply = self.receive()
-                if reply == "succeeded" or reply == "failed":
-                    break
-                if reply.startswith("recorder%dreport=" % rectab.numeric_id):
-                    recorder_state, recorded_seconds = reply.split("=")[
-                                                                1].split(":")
-                    rectab.show_indicator(("clear", "red", "amber", "clear")[
-                                                        int(recorder_state)])
-                    rectab.time_indicator.set_value(int(recorded_seconds))
-                    if recorder_state != "0":
-                        recording = True
+            report = reports.get("recorder%d" % rectab.numeric_id)
+            if report is not None:
+                recorder_state, recorded_seconds = report.split(":")
+                rectab.show_indicator(("clear", "red", "amber", "clear")[
+                                                    int(recorder_state)])
+                rectab.time_indicator.set_value(int(recorded_seconds))
+                if recorder_state != "0":
+                    recording = True
         update_listeners = False
         l_count = 0
         for streamtab in self.streamtabframe.tabs:
@@ -2142,55 +2276,57 @@ class SourceClientGui(dbus.service.Object):
                 update_listeners = True
                 l_count += cp.listeners
             
-            self.send("dev_type=streamer\ntab_id=%d\ncommand=get_report\n" % \
-                                                        streamtab.numeric_id)
-            reply = self.receive()
-            if reply != "failed":
-                self.receive()
-                if reply.startswith("streamer%dreport=" % streamtab.numeric_id):
-                    streamer_state, stream_sendbuffer_pc, brand_new = \
-                                                    reply.split("=")[1].split(":")
-                    state = int(streamer_state)
-                    self._handle_streamstate(streamtab.numeric_id,
-                                            int(state > 1), streamtab)
-                    streamtab.show_indicator(
-                                    ("clear", "amber", "green", "clear")[state])
-                    streamtab.ircpane.connections_controller.set_stream_active(
-                                                                    state > 1)
-                    mi = self.parent.stream_indicator[streamtab.numeric_id]
-                    if (streamer_state == "2"):
-                        mi.set_active(True)
-                        mi.set_value(int(stream_sendbuffer_pc))
-                        if int(stream_sendbuffer_pc
-                                                ) >= 100 and self.led_alternate:
-                            tshoot = streamtab.troubleshooting
-                            if tshoot.sbf_discard_audio.get_active():
-                                streamtab.show_indicator("amber")
-                                mi.set_flash(True)
-                            else:
-                                streamtab.server_connect.set_active(False)
-                                streamtab.server_connect.set_active(True)
-                                print "remade the connection because stream " \
-                                                            "buffer was full"
-                            del tshoot
+            report = reports.get("streamer%d" % streamtab.numeric_id)
+            if report is not None:
+                streamer_state, stream_sendbuffer_pc, brand_new = \
+                                                        report.split(":")
+                state = int(streamer_state)
+                streamtab.listener_history.add(time.time(),
+                            cp.listeners if cp.listeners_known else -1,
+                            int(stream_sendbuffer_pc), state)
+                cp.sparkline.update()
+                self._handle_streamstate(streamtab.numeric_id,
+                                        int(state > 1), streamtab)
+                streamtab.show_indicator(
+                                ("clear", "amber", "green", "clear")[state])
+                streamtab.ircpane.connections_controller.set_stream_active(
+                                                                state > 1)
+                mi = self.parent.stream_indicator[streamtab.numeric_id]
+                if (streamer_state == "2"):
+                    mi.set_active(True)
+                    mi.set_value(int(stream_sendbuffer_pc))
+                    tshoot = streamtab.troubleshooting
+                    if tshoot.sbf_step_down.get_active():
+                        streamtab.bitrate_step.tick(time.time(),
+                                int(stream_sendbuffer_pc),
+                                tshoot.sbf_step_down_percent.get_value_as_int())
+                    else:
+                        streamtab.bitrate_step.reset()
+                    if int(stream_sendbuffer_pc
+                                            ) >= 100 and self.led_alternate:
+                        if not tshoot.sbf_reconnect.get_active():
+                            streamtab.show_indicator("amber")
+                            mi.set_flash(True)
                         else:
-                            mi.set_flash(False)
+                            streamtab.server_connect.set_active(False)
+                            streamtab.server_connect.set_active(True)
+                            print "remade the connection because stream " \
+                                                        "buffer was full"
                     else:
-                        mi.set_active(False)
                         mi.set_flash(False)
-                    if brand_new == "1":
-                        # Streamer connected triggers.
-                        streamtab.start_recorder_action.activate()
-                        streamtab.start_player_action.activate()
-                        streamtab.reconnection_dialog.deactivate()
-                    if streamer_state != "0":
-                        streaming = True
-                    elif streamtab.server_connect.get_active():
-                        streamtab.server_connect.set_active(False)
-                        streamtab.reconnection_dialog.activate()
                 else:
-                    print "sourceclientgui.monitor: bad reply for" \
-                                                    " streamer data:", reply
+                    mi.set_active(False)
+                    mi.set_flash(False)
+                if brand_new == "1":
+                    # Streamer connected triggers.
+                    streamtab.start_recorder_action.activate()
+                    streamtab.start_player_action.activate()
+                    streamtab.reconnection_dialog.deactivate()
+                if streamer_state != "0":
+                    streaming = True
+                elif streamtab.server_connect.get_active():
+                    streamtab.server_connect.set_active(False)
+                    streamtab.reconnection_dialog.activate()
             else:
                 print "sourceclientgui.monitor:" \
                                     " failed to get a report from the streamer"
@@ -2310,11 +2446,14 @@ class SourceClientGui(dbus.service.Object):
         if self.receive() == "succeeded":
             print "updated song metadata successfully"
 
-        common = {"artist": artist, "title": title, "album": album,
-                                                        "songname": songname}
         # Update the custom metadata on all stream tabs.
-        for tab in self.streamtabframe.tabs:  
+        for tab in self.streamtabframe.tabs:
             tab.metadata_update.clicked()
+
+    def irc_new_metadata(self, artist, title, album, songname):
+        common = {"artist": artist, "title": title, "album": album,
+                                                        "songname": songname}
+        for tab in self.streamtabframe.tabs:
             ircmetadata = {"djname": tab.dj_name_entry.get_text(),
                                 "description": tab.description_entry.get_text(),
                                 "url": tab.listen_url_entry.get_text()
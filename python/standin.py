@@ -0,0 +1,582 @@
+"""A stand-in for the backend so the user interface runs without JACK."""
+
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = ["StandinBackend", "StandinServer", "GUIBenchmark", "parse_records",
+                                "StandinStatsServer", "check_stats_collector"]
+
+
+import os
+import json
+import time
+import mmap
+import random
+import select
+import urlparse
+import threading
+import SocketServer
+import BaseHTTPServer
+
+import glib
+
+from .ipcframe import command_header, record_header, reply_header
+from .meterblock import MeterBlock
+from .gtkstuff import threadslock
+
+
+def parse_rates(text, rates):
+    """Update a dict of rates from text of the form name=value,..."""
+
+    for item in filter(None, text.split(",")):
+        key, sep, value = item.partition("=")
+        if key not in rates or not sep:
+            raise ValueError("unknown rate: %s" % item)
+        rates[key] = float(value)
+    return rates
+
+
+def parse_records(data, start, end):
+    """The key value records of a command frame as a dict.
+
+    Keys starting with + have their values gathered in a list.
+    """
+
+    records = {}
+    i = start
+    while i < end:
+        klen, vlen = record_header.unpack_from(data, i)
+        i += record_header.size
+        key = data[i:i + klen]
+        value = data[i + klen:i + klen + vlen]
+        i += klen + vlen
+        if key.startswith("+"):
+            values = records.get(key[1:])
+            if not isinstance(values, list):
+                values = records[key[1:]] = []
+            values.append(value)
+        else:
+            records[key] = value
+    return records
+
+
+class StandinBackend(object):
+    """Drop-in for the backend library, serving from a child process.
+
+    Only init_backend is provided, with the same contract as the one in
+    c/main.c. The child speaks the framed mixer and sourceclient protocols
+    and synthesises traffic at the given rates:
+
+    levels    meter updates per second, by shared block and event fifo
+    metadata  track metadata changes on the left player per second
+    midi      MIDI control change messages per second
+    streams   how many streams report as connected
+
+    Commands are acknowledged but there is no audio.
+    """
+
+
+    defaults = {"levels": 25.0, "metadata": 0.05, "midi": 0.0, "streams": 0}
+
+
+    def __init__(self, rates=""):
+        self.rates = parse_rates(rates, dict(self.defaults))
+
+
+    def init_backend(self, read_pipe, write_pipe):
+        ui2be = os.pipe()
+        be2ui = os.pipe()
+        pid = os.fork()
+        if not pid:
+            status = 5
+            try:
+                keep = (ui2be[0], be2ui[1])
+                for fd in xrange(3, os.sysconf("SC_OPEN_MAX")):
+                    if fd not in keep:
+                        try:
+                            os.close(fd)
+                        except OSError:
+                            pass
+                status = self._server(ui2be[0], be2ui[1]).run()
+            finally:
+                os._exit(status)
+
+        os.close(ui2be[0])
+        os.close(be2ui[1])
+        read_pipe._obj.value = be2ui[0]
+        write_pipe._obj.value = ui2be[1]
+        return pid
+
+
+    def _server(self, in_fd, out_fd):
+        return StandinServer(in_fd, out_fd, self.rates)
+
+
+
+class StandinServer(object):
+    """The child process side of StandinBackend."""
+
+
+    players = MeterBlock.players
+
+
+    def __init__(self, in_fd, out_fd, rates):
+        self.in_fd = in_fd
+        self.out_fd = out_fd
+        self.rates = dict(rates)
+        self.buffer = ""
+        self.n_mics = int(os.environ.get("mic_qty", "4"))
+        self.meters = None
+        self.seq = 0
+        self.event_fd = None
+        self.context_id = 0
+        self.playing = dict.fromkeys(self.players)
+        self.new_metadata = None
+        self.midi = []
+        self.levels = [-127, -127, 120, 120]
+        self.mic_levels = [[-127, 0, 0, 0] for i in xrange(self.n_mics)]
+        now = time.time()
+        self.due = dict.fromkeys(("levels", "metadata", "midi"), now)
+
+
+    def run(self):
+        self._write("idjc backend ready\n")
+        while 1:
+            readable = select.select([self.in_fd], [], [], self._timeout())[0]
+            if readable:
+                data = os.read(self.in_fd, 65536)
+                if not data:
+                    return 0
+                self.buffer += data
+                while self._handle_frame():
+                    pass
+            self._synthesise(time.time())
+
+
+    def _timeout(self):
+        """Seconds until _synthesise has work to do."""
+
+        due = [self.due[x] for x in self.due if self.rates[x]]
+        return max(0.0, min(due) - time.time()) if due else None
+
+
+    def _write(self, data):
+        while data:
+            data = data[os.write(self.out_fd, data):]
+
+
+    def _post(self, what):
+        if self.event_fd is not None:
+            try:
+                os.write(self.event_fd, what)
+            except OSError:
+                pass
+
+
+    def _handle_frame(self):
+        if len(self.buffer) < command_header.size:
+            return False
+        size, request_id, module = command_header.unpack_from(self.buffer)
+        end = command_header.size + size
+        if len(self.buffer) < end:
+            return False
+
+        records = parse_records(self.buffer, command_header.size, end)
+        self.buffer = self.buffer[end:]
+
+        if module == "mx":
+            reply = self._mixer(records.get("ACTN", ""), records)
+        else:
+            reply = self._sourceclient(records.get("command", ""), records)
+        self._write(reply_header.pack(len(reply), request_id) + reply)
+        return True
+
+
+    def _mixer(self, action, records):
+        if action == "requestlevels":
+            return self._levels_text()
+        if action == "ping":
+            return "pong\n"
+        if action == "mp3_getstatus":
+            return "1\n"
+        if action == "jackportread":
+            return "jackports=\n"
+        for prefix in ("playnoflush", "play", "playmany"):
+            if action.startswith(prefix) and action[len(prefix):] in \
+                                                                self.players:
+                player = action[len(prefix):]
+                self.context_id += 1
+                self.playing[player] = (time.time(), self.context_id)
+                return "context_id=%d\n" % self.context_id
+        if action.startswith("stop") and action[4:] in self.players:
+            self.playing[action[4:]] = None
+            return ""
+        if action == "ogginforequest":
+            return "OIR:NOT VALID\n"
+        if action == "metainforequest":
+            paths = records.get("MINF")
+            if not isinstance(paths, list):
+                paths = []
+            return "MIR:X\n" * len(paths) + "MIR:end\n"
+        if action == "meterblock":
+            return "meterblock=%d\n" % self._attach(records.get("MTRF"))
+        if action == "eventfifo":
+            try:
+                self.event_fd = os.open(records.get("EVTF", ""),
+                                                os.O_WRONLY | os.O_NONBLOCK)
+            except OSError:
+                return "eventfifo=0\n"
+            return "eventfifo=1\n"
+        if action == "standin_rates":
+            try:
+                parse_rates(records.get("STND", ""), self.rates)
+            except ValueError as e:
+                print "standin:", e
+        return ""
+
+
+    def _sourceclient(self, command, records):
+        tab = int(records.get("tab_id", "-1"))
+        reply = ""
+        if command == "jack_samplerate_request":
+            reply = "idjcsc: sample_rate=48000\n"
+        elif command == "encoder_lame_availability":
+            reply = "idjcsc: lame_available=1\n"
+        elif command == "encoder_aac_availability":
+            reply = "idjcsc: aac_functionality=1:1\n"
+        elif command == "get_report":
+            dev_type = records.get("dev_type")
+            if dev_type == "streamer":
+                reply = self._streamer_report(tab)
+            elif dev_type == "recorder":
+                reply = "idjcsc: recorder%dreport=0:0\n" % tab
+            else:
+                return "idjcsc: failed\n"
+        elif command == "get_reports":
+            recorders = int(os.environ.get("num_recorders", "2"))
+            streamers = int(os.environ.get("num_streamers", "6"))
+            reply = "".join(["idjcsc: recorder%dreport=0:0\n" % i
+                                            for i in xrange(recorders)] +
+                            [self._streamer_report(i) for i in xrange(streamers)])
+        return reply + "idjcsc: succeeded\n"
+
+
+    def _streamer_report(self, tab):
+        connected = tab < self.rates["streams"]
+        return "idjcsc: streamer%dreport=%d:%d:0\n" % (tab,
+                        2 if connected else 0,
+                        random.randint(0, 20) if connected else 0)
+
+
+    def _attach(self, pathname):
+        try:
+            fd = os.open(pathname, os.O_RDWR)
+        except (OSError, TypeError):
+            return 0
+        try:
+            self.meters = mmap.mmap(fd, MeterBlock.size)
+        except EnvironmentError:
+            return 0
+        finally:
+            os.close(fd)
+        return 1
+
+
+    def _player_values(self, player, now):
+        state = self.playing[player]
+        if state is None:
+            return [0, 0, 0, 0, 0, 0.0]
+        start, cid = state
+        return [int(now - start), 1, 1, cid, 0, 0.0]
+
+
+    def _levels_text(self):
+        now = time.time()
+        lines = ["str_l_peak=%d" % self.levels[0],
+                 "str_r_peak=%d" % self.levels[1],
+                 "str_l_rms=%d" % self.levels[2],
+                 "str_r_rms=%d" % self.levels[3]]
+        for player in self.players:
+            values = self._player_values(player, now)
+            for key, value in zip(MeterBlock.player_keys, values):
+                lines.append("%s_%s=%s" % (player, key, value))
+        if self.new_metadata is not None:
+            lines.append("left_new_metadata=" + self.new_metadata)
+            self.new_metadata = None
+        for i, levels in enumerate(self.mic_levels):
+            lines.append("mic_%d_levels=%d,%d,%d,%d" % ((i + 1, ) +
+                                                                tuple(levels)))
+        lines += ["midi=" + ",".join(self.midi), "session_command=",
+                    "ports_connections_changed=0", "effects_playing=-1",
+                    "freewheel_mode=0", "end"]
+        self.midi = []
+        self._publish(now)
+        return "\n".join(lines) + "\n"
+
+
+    def _publish(self, now):
+        if self.meters is None:
+            return
+        values = list(self.levels)
+        for player in self.players:
+            values += self._player_values(player, now)
+        values += [0, 0, min(self.n_mics, MeterBlock.max_mics)]
+        for i in xrange(MeterBlock.max_mics):
+            values += self.mic_levels[i] if i < self.n_mics else [0] * 4
+        pending = self.new_metadata is not None or bool(self.midi)
+
+        self.seq += 1
+        MeterBlock.header.pack_into(self.meters, 0, MeterBlock.magic,
+                                    MeterBlock.version, self.seq, pending)
+        MeterBlock.body.pack_into(self.meters, MeterBlock.header.size, *values)
+        self.seq += 1
+        MeterBlock.header.pack_into(self.meters, 0, MeterBlock.magic,
+                                    MeterBlock.version, self.seq, pending)
+
+
+    def _synthesise(self, now):
+        if self.rates["levels"] and now >= self.due["levels"]:
+            self.due["levels"] = now + 1.0 / self.rates["levels"]
+            peak = random.randint(-30, -1)
+            self.levels = [peak, peak - random.randint(0, 3),
+                                    -peak + 6, -peak + random.randint(6, 9)]
+            for levels in self.mic_levels:
+                levels[0] = random.randint(-40, -3)
+                levels[1:] = [random.randint(0, 4), random.randint(0, 4),
+                                                        random.randint(0, 8)]
+            self._publish(now)
+            self._post("m\n")
+
+        if self.rates["metadata"] and now >= self.due["metadata"]:
+            self.due["metadata"] = now + 1.0 / self.rates["metadata"]
+            fields = ["1", "Artist %d" % random.randint(1, 999),
+                        "Title %d" % random.randint(1, 999), "Album",
+                        "%09d" % (self.context_id), "%09d" % 0]
+            self.new_metadata = "".join("d%d:%s" % (len(x), x)
+                                                        for x in fields) + "x"
+            self._publish(now)
+            self._post("e\n")
+
+        if self.rates["midi"] and now >= self.due["midi"]:
+            self.due["midi"] = now + 1.0 / self.rates["midi"]
+            self.midi.append("c0.77:%x" % random.randint(0, 0x7F))
+            self._publish(now)
+            self._post("e\n")
+
+
+
+class GUIBenchmark(object):
+    """Frame times and CPU use of the user interface under stand-in traffic.
+
+    Each phase sets the stand-in rates and is measured for a while. A probe
+    timer asks to run every frame_interval milliseconds and how late it runs
+    is taken as the frame time. CPU is that of the user interface process.
+    Results are written as JSON to pathname when all phases are done.
+    """
+
+
+    frame_interval = 16
+    phases = (
+        ("idle", "levels=0,metadata=0,midi=0,streams=0"),
+        ("meters", "levels=25,metadata=0,midi=0,streams=0"),
+        ("metadata", "levels=25,metadata=2,midi=0,streams=0"),
+        ("midi", "levels=25,metadata=0,midi=20,streams=0"),
+        ("streams", "levels=25,metadata=0,midi=0,streams=10"))
+
+
+    def __init__(self, mixer_request, pathname, seconds=30.0):
+        self.mixer_request = mixer_request
+        self.pathname = pathname
+        self.seconds = seconds
+        self.results = []
+        self._todo = list(self.phases)
+        self._start_phase()
+        glib.timeout_add(self.frame_interval, self._probe)
+
+
+    def _start_phase(self):
+        self.name, rates = self._todo.pop(0)
+        self.mixer_request([("STND", rates), ("ACTN", "standin_rates")])
+        self.lateness = []
+        self.started = self.last = time.time()
+        self.cpu = os.times()[:2]
+
+
+    def _end_phase(self, now):
+        lateness = sorted(self.lateness) or [0.0]
+        pick = lambda p: lateness[min(len(lateness) - 1, int(len(lateness) * p))]
+        user, system = (b - a for a, b in zip(self.cpu, os.times()[:2]))
+        elapsed = now - self.started
+        result = {"phase": self.name, "seconds": elapsed,
+                "frames": len(self.lateness),
+                "late_ms_p50": pick(0.5), "late_ms_p95": pick(0.95),
+                "late_ms_max": lateness[-1],
+                "cpu_user_pc": 100.0 * user / elapsed,
+                "cpu_system_pc": 100.0 * system / elapsed}
+        print "benchmark:", result
+        self.results.append(result)
+
+
+    @threadslock
+    def _probe(self):
+        now = time.time()
+        self.lateness.append(max(0.0,
+                            (now - self.last) * 1000.0 - self.frame_interval))
+        self.last = now
+        if now - self.started < self.seconds:
+            return True
+
+        self._end_phase(now)
+        if self._todo:
+            self._start_phase()
+            return True
+
+        try:
+            with open(self.pathname, "w") as f:
+                json.dump(self.results, f, indent=1)
+        except EnvironmentError as e:
+            print "benchmark: failed to write results:", e
+        print "benchmark complete"
+        return False
+
+
+
+class StandinStatsServer(SocketServer.ThreadingMixIn,
+                                                BaseHTTPServer.HTTPServer):
+    """Icecast and Shoutcast admin stats pages served from a thread.
+
+    For testing the listener stats collector, as check_stats_collector()
+    does, run with python -m idjc.standin. listeners maps mount points
+    to counts and Shoutcast is given the total. Connections are kept alive
+    and counted in connections. Each listener is listed for Icecast as the
+    real server does. Set the port to 0 for any free port, see port.
+    """
+
+
+    daemon_threads = True
+
+
+    def __init__(self, port=0, login="admin", password="hackme"):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", port),
+                                                        _StandinStatsHandler)
+        self.port = self.server_address[1]
+        self.auth = "Basic " + ("%s:%s" % (login, password)).encode("base64"
+                                                                    ).strip()
+        self.listeners = {}
+        self.connections = 0
+        self.requests = 0
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+
+    def handle_error(self, request, client_address):
+        # The collector hangs up on long pages once it has the count.
+        pass
+
+
+
+class _StandinStatsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+
+    def log_message(self, *args):
+        pass
+
+
+    def do_GET(self):
+        self.server.requests += 1
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        if self.headers.get("Authorization") != self.server.auth:
+            status, body = 401, "<html>Unauthorized</html>"
+        elif url.path == "/admin.cgi":
+            status, body = 200, ("<?xml version=\"1.0\"?><SHOUTCASTSERVER>"
+                        "<CURRENTLISTENERS>%d</CURRENTLISTENERS>"
+                        "</SHOUTCASTSERVER>" % sum(self.server.listeners.values()))
+        elif url.path == "/admin/listclients":
+            mount = query.get("mount", [""])[0]
+            if mount in self.server.listeners:
+                count = self.server.listeners[mount]
+                status, body = 200, ("<?xml version=\"1.0\"?><icestats>"
+                        "<source mount=\"%s\"><Listeners>%d</Listeners>%s"
+                        "</source></icestats>" % (mount, count, "".join(
+                        "<listener id=\"%d\"><IP>127.0.0.1</IP>"
+                        "<Connected>%d</Connected></listener>" % (i, i)
+                        for i in xrange(count))))
+            else:
+                status, body = 400, "<html>Source does not exist</html>"
+        else:
+            status, body = 404, "<html>Not found</html>"
+
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+
+def _await_listeners(collector, server, expected, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if collector.listeners(server) == expected:
+            return True
+        collector.request(server)
+        time.sleep(0.02)
+    return False
+
+
+def check_stats_collector():
+    """Run the listener stats collector against a StandinStatsServer.
+
+    Covers the Icecast mount count, the Shoutcast total, and the reuse of
+    one kept alive connection across repeat fetches. Raises AssertionError
+    on failure.
+    """
+
+    from .listenerstats import StatsServer, StatsCollector
+
+    stand_in = StandinStatsServer()
+    try:
+        collector = StatsCollector()
+        collector.min_interval = 0.0
+        icecast = StatsServer(False, "127.0.0.1", stand_in.port, "/live",
+                                                            "admin", "hackme")
+        shoutcast = StatsServer(True, "127.0.0.1", stand_in.port, "/",
+                                                            "admin", "hackme")
+        for count in (3, 5, 0):
+            stand_in.listeners = {"/live": count, "/other": 4}
+            assert _await_listeners(collector, icecast, count), \
+                        "Icecast count %d not seen" % count
+        assert _await_listeners(collector, shoutcast, 4), \
+                        "Shoutcast total not seen"
+        assert stand_in.connections == 1, \
+                        "%d connections made" % stand_in.connections
+    finally:
+        stand_in.shutdown()
+        stand_in.server_close()
+
+
+if __name__ == "__main__":
+    check_stats_collector()
+    print "listener stats collector: ok"
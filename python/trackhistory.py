@@ -0,0 +1,360 @@
+"""Track history display and logging kept off the user interface thread."""
+
+#   Copyright (C) 2013 Stephen Fairchild (s-fairchild@users.sourceforge.net)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program in the file entitled COPYING.
+#   If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = ["AsyncWriter", "TrackHistory"]
+
+
+import os
+import time
+import shutil
+import itertools
+import threading
+import Queue
+
+import glib
+
+from .gtkstuff import threadslock
+
+
+class AsyncWriter(object):
+    """Appends text to files from a background thread.
+
+    Files are kept open and flushed after each batch of writes so readers
+    see the text promptly. fsync is done at most every sync_interval
+    seconds, on wait() and on close(). When the queue is full, as it
+    would be with the file system unresponsive, text is dropped rather
+    than stall the caller. Reads are done in turn with the writes so they
+    see all that was queued before them.
+    """
+
+
+    queue_size = 256
+    sync_interval = 5.0
+
+
+    def __init__(self):
+        self._queue = Queue.Queue(self.queue_size)
+        self._files = {}
+        self.dropped = 0
+        self._overflow = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def _put(self, job):
+        try:
+            self._queue.put_nowait(job)
+        except Queue.Full:
+            if not self._overflow:
+                print "AsyncWriter: queue full, dropping writes to", job[1]
+            self._overflow = True
+            self.dropped += 1
+            return False
+        else:
+            self._overflow = False
+            return True
+
+
+    def append(self, pathname, text):
+        self._put(("append", pathname, text))
+
+
+    def truncate(self, pathname):
+        self._put(("truncate", pathname, None))
+
+
+    def read(self, pathname, start, stop, callback):
+        """Read lines start to stop of a file. Returns whether queued.
+
+        callback is called from the writer thread with the list of lines
+        or None on failure.
+        """
+
+        return self._put(("read", pathname, (start, stop, callback)))
+
+
+    def wait(self, timeout=5.0):
+        """Block until what was queued before is written and synced."""
+
+        done = threading.Event()
+        try:
+            self._queue.put(("wait", None, done), timeout=timeout)
+        except Queue.Full:
+            return False
+        done.wait(timeout)
+        return done.is_set()
+
+
+    def close(self, timeout=5.0):
+        try:
+            self._queue.put(None, timeout=timeout)
+        except Queue.Full:
+            print "AsyncWriter: not stopped, writes may be lost"
+            return
+        self._thread.join(timeout)
+
+
+    def _file(self, pathname):
+        fh = self._files.get(pathname)
+        if fh is None:
+            fh = self._files[pathname] = open(pathname, "a")
+        return fh
+
+
+    def _drop_file(self, pathname):
+        fh = self._files.pop(pathname, None)
+        if fh is not None:
+            try:
+                fh.close()
+            except EnvironmentError:
+                pass
+
+
+    def _sync(self, dirty):
+        for pathname in dirty:
+            fh = self._files.get(pathname)
+            if fh is not None:
+                try:
+                    os.fsync(fh.fileno())
+                except EnvironmentError as e:
+                    print "AsyncWriter: fsync of %s failed: %s" % (pathname, e)
+        dirty.clear()
+
+
+    def _read(self, pathname, dirty, start, stop, callback):
+        lines = None
+        try:
+            if pathname in dirty:
+                self._files[pathname].flush()
+            with open(pathname) as fh:
+                lines = list(itertools.islice(fh, start, stop))
+        except EnvironmentError as e:
+            print "AsyncWriter: read of %s failed: %s" % (pathname, e)
+        try:
+            callback(lines)
+        except Exception as e:
+            print "AsyncWriter: read callback failed:", e
+
+
+    def _run(self):
+        """Writer thread body."""
+
+        dirty = set()
+        last_sync = time.time()
+        while 1:
+            timeout = None
+            if dirty:
+                timeout = max(0.0, last_sync + self.sync_interval - time.time())
+            try:
+                jobs = [self._queue.get(True, timeout)]
+            except Queue.Empty:
+                jobs = []
+            while 1:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            waiters = []
+            stop = False
+            for job in jobs:
+                if job is None:
+                    stop = True
+                    break
+                action, pathname, arg = job
+                if action == "wait":
+                    waiters.append(arg)
+                    continue
+                if action == "read":
+                    self._read(pathname, dirty, *arg)
+                    continue
+                try:
+                    if action == "append":
+                        self._file(pathname).write(arg)
+                        dirty.add(pathname)
+                    elif action == "truncate":
+                        self._drop_file(pathname)
+                        dirty.discard(pathname)
+                        open(pathname, "w").close()
+                except EnvironmentError as e:
+                    print "AsyncWriter: write to %s failed: %s" % (pathname, e)
+                    self._drop_file(pathname)
+                    dirty.discard(pathname)
+
+            for pathname in list(dirty):
+                try:
+                    self._files[pathname].flush()
+                except EnvironmentError as e:
+                    print "AsyncWriter: write to %s failed: %s" % (pathname, e)
+                    self._drop_file(pathname)
+                    dirty.discard(pathname)
+
+            if stop or waiters or time.time() >= last_sync + self.sync_interval:
+                self._sync(dirty)
+                last_sync = time.time()
+            for done in waiters:
+                done.set()
+
+            if stop:
+                for pathname in self._files.keys():
+                    self._drop_file(pathname)
+                return
+
+
+
+class TrackHistory(object):
+    """The track history text view, capped, with the full text on disk.
+
+    Entries are appended to a file by an AsyncWriter as they happen rather
+    than the whole text being written on session save. The text view
+    holds the newest max_lines entries and pages in older ones from the
+    file, page_lines at a time, when scrolled to the top. The file is read
+    by the writer thread. Paged in entries stay until the view is back at
+    the bottom, new entries only scrolling it there when it already was.
+    """
+
+
+    max_lines = 500
+    page_lines = 100
+
+
+    def __init__(self, textview, scrolled_window, writer):
+        self.buffer = textview.get_buffer()
+        self.adjustment = scrolled_window.get_vadjustment()
+        self.adjustment.connect("value-changed", self._cb_scroll)
+        self.writer = writer
+        self.pathname = None
+        self._shown = 0
+        self._first = 0         # Line in the file at the top of the view.
+        self._generation = 0    # Changed when the file is replaced.
+        self._paging = False
+
+
+    def _reset(self, first):
+        self._shown = 0
+        self._first = first
+        self._generation += 1
+        self._paging = False
+
+
+    def _read(self):
+        try:
+            with open(self.pathname) as fh:
+                return fh.readlines()
+        except (EnvironmentError, TypeError) as e:
+            print "TrackHistory: read failed:", e
+            return []
+
+
+    def load(self, pathname, restore=True, max_age=21600):
+        """Use pathname for the history, showing it unless out of date.
+
+        The file is emptied when not restored.
+        """
+
+        self.pathname = pathname
+        self._reset(0)
+        try:
+            stat = os.stat(pathname)
+        except OSError as e:
+            print e
+            return
+        if not restore:
+            self.writer.truncate(pathname)
+        elif stat.st_ctime + max_age > time.time():
+            lines = self._read()
+            self.buffer.set_text("".join(lines[-self.max_lines:]))
+            self._shown = min(len(lines), self.max_lines)
+            self._first = len(lines) - self._shown
+        else:
+            print "disregarding out of date track history text"
+            self.writer.truncate(pathname)
+
+
+    def _at_bottom(self):
+        adj = self.adjustment
+        return adj.get_value() >= adj.upper - adj.page_size
+
+
+    def _trim(self):
+        excess = self._shown - self.max_lines
+        if excess > 0:
+            self.buffer.delete(self.buffer.get_start_iter(),
+                                    self.buffer.get_iter_at_line(excess))
+            self._shown -= excess
+            self._first += excess
+
+
+    def add(self, text):
+        at_bottom = self._at_bottom()
+        self.buffer.insert(self.buffer.get_end_iter(), text)
+        if self.pathname is not None:
+            self.writer.append(self.pathname, text)
+        self._shown += text.count("\n")
+        if at_bottom:
+            self._trim()
+            self.adjustment.set_value(self.adjustment.upper)
+
+
+    def clear(self):
+        self.buffer.set_text("")
+        self._reset(0)
+        if self.pathname is not None:
+            self.writer.truncate(self.pathname)
+
+
+    def save_copy(self, pathname):
+        """Copy the history to pathname, for sessions saved elsewhere."""
+
+        if self.pathname is None:
+            return
+        self.writer.wait()
+        try:
+            shutil.copyfile(self.pathname, pathname)
+        except EnvironmentError as e:
+            print "TrackHistory: copy failed:", e
+
+
+    def _cb_scroll(self, adjustment):
+        if adjustment.get_value() <= adjustment.lower:
+            if self._first and not self._paging and self.pathname is not None:
+                generation, first = self._generation, self._first
+                callback = lambda lines: glib.idle_add(self._page_in,
+                                                    generation, first, lines)
+                self._paging = self.writer.read(self.pathname,
+                            max(0, first - self.page_lines), first, callback)
+        elif self._at_bottom():
+            self._trim()
+
+
+    @threadslock
+    def _page_in(self, generation, first, lines):
+        if generation != self._generation:
+            return False
+        self._paging = False
+        if first == self._first and lines is not None:
+            if lines:
+                self.buffer.insert(self.buffer.get_start_iter(), "".join(lines))
+                self._shown += len(lines)
+                self._first -= len(lines)
+            else:
+                # The file is shorter than thought.
+                self._first = 0
+        return False
@@ -21,7 +21,7 @@ But strictly no third party module dependencies.
 
 
 __all__ = ["Singleton", "PolicedAttributes", "FixedAttributes",
-                "PathStr", "SlotObject", "string_multireplace"]
+                "PathStr", "SlotObject", "string_multireplace", "WatchedDict"]
 
 
 import os
@@ -336,3 +336,43 @@ class LinkUUIDRegistry(dict):
         # For a return value of None the caller must substitute the
         # pre-existing pathname to preserve functionality.
         return None
+
+
+
+class WatchedDict(dict):
+    """A dict that calls each of its watchers with (key, value) on change.
+
+    The value passed is None for a key that has been removed.
+    """
+
+
+    def __init__(self, *args, **kwds):
+        dict.__init__(self, *args, **kwds)
+        self.watchers = []
+
+
+    def _notify(self, key, value):
+        for watcher in self.watchers:
+            watcher(key, value)
+
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._notify(key, value)
+
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._notify(key, None)
+
+
+    def update(self, *args, **kwds):
+        for key, value in dict(*args, **kwds).iteritems():
+            self[key] = value
+
+
+    def clear(self):
+        keys = self.keys()
+        dict.clear(self)
+        for key in keys:
+            self._notify(key, None)